@@ -0,0 +1,137 @@
+//! Synthetic telemetry shaped like what the functions see in production.
+//! Every generator is seeded, so a scale always produces the same data and
+//! runs are comparable across commits.
+use rand::rngs::SmallRng;
+use rand::{Rng, SeedableRng};
+
+/// Bucket lower bounds of an exponential main ping histogram with range
+/// [1, 10000] and 50 buckets, as gc_ms has
+pub const EXPONENTIAL_BUCKETS: [usize; 50] = [
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 17, 20, 24, 29, 34, 40, 48, 57, 68, 81, 96, 114, 135,
+    160, 190, 226, 268, 318, 378, 449, 533, 633, 752, 894, 1062, 1262, 1500, 1782, 2117, 2516,
+    2990, 3553, 4222, 5017, 5961, 7083, 8416, 10000,
+];
+
+pub const EXPONENTIAL_METADATA: &str = r#"{"probe": "gc_ms", "histogram_type": "custom_distribution_exponential",
+    "process": "parent", "probe_location": "payload.histograms.gc_ms",
+    "buckets_key": "min, max, n_buckets", "buckets_for_probe": [1, 10000, 50]}"#;
+
+pub fn rng(seed: u64) -> SmallRng {
+    SmallRng::seed_from_u64(seed)
+}
+
+/// Rows per benchmark input, scaled by MOZFUN_LOCAL_BENCH_SCALE (default 1)
+pub fn scaled(rows: usize) -> usize {
+    let scale = std::env::var("MOZFUN_LOCAL_BENCH_SCALE")
+        .ok()
+        .and_then(|s| s.parse::<f64>().ok())
+        .unwrap_or(1.0);
+
+    ((rows as f64) * scale).max(1.0) as usize
+}
+
+/// A main ping histogram: a handful of neighbouring buckets around a per
+/// ping centre, the way timing probes cluster
+pub fn main_histogram_json(rng: &mut SmallRng) -> String {
+    let centre = rng.gen_range(2..EXPONENTIAL_BUCKETS.len() - 2);
+    let spread = rng.gen_range(1..4);
+    let low = centre.saturating_sub(spread);
+    let high = (centre + spread).min(EXPONENTIAL_BUCKETS.len() - 1);
+
+    let mut sum = 0;
+    let values = (low..=high)
+        .map(|i| {
+            let count = rng.gen_range(1..20usize);
+            sum += EXPONENTIAL_BUCKETS[i] * count;
+            format!("\"{}\":{}", EXPONENTIAL_BUCKETS[i], count)
+        })
+        .collect::<Vec<_>>()
+        .join(",");
+
+    format!(
+        r#"{{"bucket_count":50,"histogram_type":0,"sum":{},"range":[1,10000],"values":{{{}}}}}"#,
+        sum, values
+    )
+}
+
+/// client_id, build_id and histogram columns for `n_clients` clients that
+/// each sent `pings_per_client` pings, spread over `n_builds` builds
+pub fn main_ping_rows(
+    rng: &mut SmallRng,
+    n_clients: usize,
+    pings_per_client: usize,
+    n_builds: usize,
+) -> (Vec<String>, Vec<String>, Vec<String>) {
+    let mut client_ids = Vec::with_capacity(n_clients * pings_per_client);
+    let mut build_ids = Vec::with_capacity(n_clients * pings_per_client);
+    let mut histograms = Vec::with_capacity(n_clients * pings_per_client);
+
+    for client in 0..n_clients {
+        let build = 20230101000000u64 + rng.gen_range(0..n_builds) as u64;
+        for _ in 0..pings_per_client {
+            client_ids.push(format!("{:032x}", client));
+            build_ids.push(build.to_string());
+            histograms.push(main_histogram_json(rng));
+        }
+    }
+
+    (client_ids, build_ids, histograms)
+}
+
+/// BigQuery array<struct<key, value>> as it comes out of a query, with the
+/// braces map_get_key trims
+pub fn key_value_struct(rng: &mut SmallRng, n_keys: usize) -> String {
+    let pairs = (0..n_keys)
+        .map(|i| format!(r#"{{"key": "key_{}", "value": "{}"}}"#, i, rng.gen::<u32>()))
+        .collect::<Vec<_>>()
+        .join(", ");
+
+    format!("{{[{}]}}", pairs)
+}
+
+/// Firefox style version strings, e.g. 110.0.1 or 111.0b3
+pub fn version_string(rng: &mut SmallRng) -> String {
+    let major = rng.gen_range(90..120);
+    match rng.gen_range(0..3) {
+        0 => format!("{}.0", major),
+        1 => format!("{}.0.{}", major, rng.gen_range(1..4)),
+        _ => format!("{}.0b{}", major, rng.gen_range(1..10)),
+    }
+}
+
+/// Raw os names as clients report them
+pub fn os_name(rng: &mut SmallRng) -> &'static str {
+    const OS: [&str; 8] = [
+        "Windows_NT",
+        "Darwin",
+        "Linux",
+        "Android",
+        "iOS",
+        "iPadOS",
+        "FreeBSD",
+        "SunOS",
+    ];
+
+    OS[rng.gen_range(0..OS.len())]
+}
+
+/// Glean experiments payload with `n_experiments` enrolments
+pub fn experiments_json(rng: &mut SmallRng, n_experiments: usize) -> String {
+    let experiments = (0..n_experiments)
+        .map(|i| {
+            let branch = ["control", "treatment-a", "treatment-b"][rng.gen_range(0..3)];
+            format!(
+                r#"{{"key": "experiment_{}", "value": {{"branch": "{}", "extra": {{"type": "nimbus-nimbus"}}}}}}"#,
+                i, branch
+            )
+        })
+        .collect::<Vec<_>>()
+        .join(", ");
+
+    format!(r#"{{"experiments": [{}]}}"#, experiments)
+}
+
+/// Random bytes, e.g. for sample id bit extraction
+pub fn bytes(rng: &mut SmallRng, len: usize) -> Vec<u8> {
+    (0..len).map(|_| rng.gen()).collect()
+}
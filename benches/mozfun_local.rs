@@ -0,0 +1,189 @@
+//! Benchmarks of the Rust side of every mozfun_local function group.
+//!
+//! cargo bench --no-default-features
+//!
+//! Criterion keeps the last run in target/criterion and reports the change
+//! against it; use --save-baseline/--baseline to compare named commits.
+mod generators;
+
+use criterion::{black_box, criterion_group, criterion_main, BatchSize, Criterion, Throughput};
+use polars::prelude::*;
+
+use mozfun_local::experiments::ExperimentIndex;
+use mozfun_local::glam::{glam_histograms, GlamOptions};
+use mozfun_local::hist::{normalize_histogram_series, parse_metadata_json};
+use mozfun_local::{bytes, json, map, norm, stats};
+
+fn bench_glam(c: &mut Criterion) {
+    let mut rng = generators::rng(0);
+    let metadata = parse_metadata_json(generators::EXPONENTIAL_METADATA).unwrap();
+    let n_clients = generators::scaled(10_000);
+    let (client_ids, build_ids, histograms) =
+        generators::main_ping_rows(&mut rng, n_clients, 3, 20);
+    let rows = client_ids.len();
+    let frame = df!(
+        "client_id" => client_ids,
+        "build_id" => build_ids,
+        "gc_ms" => histograms
+    )
+    .unwrap();
+
+    let mut group = c.benchmark_group("glam");
+    group.throughput(Throughput::Elements(rows as u64));
+    group.sample_size(10);
+    group.bench_function("glam_style_histogram", |b| {
+        b.iter_batched(
+            || frame.clone(),
+            |df| glam_histograms(df, &metadata, &GlamOptions::default()).unwrap(),
+            BatchSize::LargeInput,
+        )
+    });
+    group.bench_function("normalize_histogram_column", |b| {
+        b.iter(|| normalize_histogram_series(black_box(frame.column("gc_ms").unwrap())))
+    });
+    group.finish();
+}
+
+fn bench_map(c: &mut Criterion) {
+    let mut rng = generators::rng(1);
+    let n = generators::scaled(100_000);
+    let keys: Vec<String> = (0..100).map(|i| format!("key_{}", i)).collect();
+    let pairs: Vec<(&str, f64)> = (0..n)
+        .map(|i| (keys[i % keys.len()].as_str(), i as f64))
+        .collect();
+    let int_pairs: Vec<(u64, u64)> = (0..n as u64).map(|i| (i % 100, i)).collect();
+    let structs: Vec<String> = (0..generators::scaled(1_000))
+        .map(|_| generators::key_value_struct(&mut rng, 20))
+        .collect();
+
+    let mut group = c.benchmark_group("map");
+    group.bench_function("map_sum", |b| b.iter(|| map::sum_pairs(black_box(&pairs))));
+    group.bench_function("int_map_sum", |b| {
+        b.iter(|| map::sum_pairs(black_box(&int_pairs)))
+    });
+    group.bench_function("map_get_key", |b| {
+        b.iter(|| {
+            for s in &structs {
+                black_box(map::get_key(s, "key_15", true));
+            }
+        })
+    });
+    group.finish();
+}
+
+fn bench_mode_last(c: &mut Criterion) {
+    let n = generators::scaled(100_000);
+    let ints: Vec<i64> = (0..n as i64).map(|i| (i * 7919) % 1_000).collect();
+    let strings: Vec<String> = ints.iter().map(|i| format!("branch_{}", i)).collect();
+
+    let mut group = c.benchmark_group("mode_last");
+    group.throughput(Throughput::Elements(n as u64));
+    let strs: Vec<&str> = strings.iter().map(|s| s.as_str()).collect();
+    group.bench_function("stats_mode_last", |b| {
+        b.iter(|| stats::last_mode(black_box(&ints)))
+    });
+    group.bench_function("json_mode_last", |b| {
+        b.iter(|| stats::last_mode(black_box(&strs)))
+    });
+    group.finish();
+}
+
+fn bench_norm(c: &mut Criterion) {
+    let mut rng = generators::rng(2);
+    let n = generators::scaled(10_000);
+    let versions: Vec<String> = (0..n)
+        .map(|_| generators::version_string(&mut rng))
+        .collect();
+    let os_names: Vec<&str> = (0..n).map(|_| generators::os_name(&mut rng)).collect();
+    let experiments: Vec<String> = (0..generators::scaled(1_000))
+        .map(|_| generators::experiments_json(&mut rng, 10))
+        .collect();
+    let truncator = norm::Matcher::new();
+    let extractor = norm::Extractor::new();
+
+    let mut group = c.benchmark_group("norm");
+    group.throughput(Throughput::Elements(n as u64));
+    group.bench_function("norm_normalize_os", |b| {
+        b.iter(|| {
+            for os in &os_names {
+                black_box(norm::norm_normalize_os(os).unwrap());
+            }
+        })
+    });
+    group.bench_function("norm_truncate_version", |b| {
+        b.iter(|| {
+            for v in &versions {
+                black_box(truncator.find_minor_version(v));
+            }
+        })
+    });
+    group.bench_function("norm_extract_version", |b| {
+        b.iter(|| {
+            for v in &versions {
+                black_box(extractor.extract_version(v, "patch"));
+            }
+        })
+    });
+    group.finish();
+
+    c.bench_function("glean_legacy_compatible_experiments", |b| {
+        b.iter(|| {
+            for e in &experiments {
+                black_box(json::legacy_compatible_experiments(e).unwrap());
+            }
+        })
+    });
+
+    let column = Series::new("experiments", &experiments);
+    c.bench_function("experiment_index", |b| {
+        b.iter(|| black_box(ExperimentIndex::from_series(&column).unwrap()))
+    });
+}
+
+fn bench_bytes(c: &mut Criterion) {
+    let mut rng = generators::rng(3);
+    let width = 16;
+    let n = generators::scaled(100_000);
+    let data = generators::bytes(&mut rng, width * n);
+    let mut out = vec![0u8; bytes::extracted_len(width, 20)];
+
+    let mut group = c.benchmark_group("bytes");
+    group.throughput(Throughput::Bytes(data.len() as u64));
+    group.bench_function("bytes_zero_right", |b| {
+        b.iter_batched(
+            || data.clone(),
+            |mut data| {
+                data.chunks_mut(width)
+                    .for_each(|row| bytes::zero_right_in_place(row, 37));
+                data
+            },
+            BatchSize::LargeInput,
+        )
+    });
+    group.bench_function("bytes_extract_bits", |b| {
+        b.iter(|| {
+            for row in data.chunks(width) {
+                bytes::extract_bits_to(row, 3, 20, &mut out);
+                black_box(&out);
+            }
+        })
+    });
+    group.bench_function("bytes_bit_pos_to_byte_pos", |b| {
+        b.iter(|| {
+            for bit in -64..64 {
+                black_box(bytes::bytes_bit_pos_to_byte_pos(bit).unwrap());
+            }
+        })
+    });
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    bench_glam,
+    bench_map,
+    bench_mode_last,
+    bench_norm,
+    bench_bytes
+);
+criterion_main!(benches);
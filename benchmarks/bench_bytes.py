@@ -0,0 +1,49 @@
+import pyarrow as pa
+import pytest
+
+from generators import byte_strings, scaled
+from mozfun_local.bytes_fun import (
+    bytes_bit_pos_to_byte_pos,
+    bytes_extract_bits,
+    bytes_extract_bits_column,
+    bytes_zero_right,
+    bytes_zero_right_column,
+)
+
+
+@pytest.fixture
+def fixed_width(rng):
+    return byte_strings(rng, scaled(100_000), 16)
+
+
+@pytest.fixture
+def binary_column(fixed_width):
+    return pa.array([row.tobytes() for row in fixed_width], type=pa.binary())
+
+
+def test_bytes_bit_pos_to_byte_pos(benchmark):
+    benchmark(lambda: [bytes_bit_pos_to_byte_pos(bit) for bit in range(-64, 64)])
+
+
+def test_bytes_extract_bits(benchmark, fixed_width):
+    rows = [row.tobytes() for row in fixed_width[:1_000]]
+
+    benchmark(lambda: [bytes_extract_bits(b, 3, 20) for b in rows])
+
+
+def test_bytes_zero_right(benchmark, fixed_width):
+    rows = [row.tobytes() for row in fixed_width[:1_000]]
+
+    benchmark(lambda: [bytes_zero_right(b, 37) for b in rows])
+
+
+def test_bytes_extract_bits_column_numpy(benchmark, fixed_width):
+    benchmark(bytes_extract_bits_column, fixed_width, 3, 20)
+
+
+def test_bytes_extract_bits_column_arrow(benchmark, binary_column):
+    benchmark(bytes_extract_bits_column, binary_column, 3, 20)
+
+
+def test_bytes_zero_right_column_arrow(benchmark, binary_column):
+    benchmark(bytes_zero_right_column, binary_column, 37)
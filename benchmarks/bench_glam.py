@@ -0,0 +1,32 @@
+import polars as pl
+import pytest
+
+from generators import EXPONENTIAL_METADATA, main_ping_rows, scaled
+from mozfun_local.glam import calculate_percentiles
+from mozfun_local.hist_fun import hist_normalize_column
+from mozfun_local.mozfun_local_rust import (
+    glam_style_histogram as _glam_style_histogram,
+)
+
+
+@pytest.fixture
+def main_pings(rng):
+    return pl.DataFrame(main_ping_rows(rng, scaled(10_000), 3, 20))
+
+
+def test_glam_style_histogram(benchmark, main_pings):
+    result = benchmark(_glam_style_histogram, main_pings, EXPONENTIAL_METADATA)
+
+    assert len(result) == main_pings["build_id"].n_unique()
+
+
+def test_calculate_percentiles(benchmark, main_pings):
+    _, distribution = _glam_style_histogram(main_pings, EXPONENTIAL_METADATA)[0]
+
+    benchmark(calculate_percentiles, distribution, [0.05, 0.25, 0.5, 0.75, 0.95])
+
+
+def test_hist_normalize_column(benchmark, main_pings):
+    result = benchmark(hist_normalize_column, main_pings["gc_ms"])
+
+    assert len(result) == len(main_pings)
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+import pytest
+
+MODULES = [
+    "mozfun_local.bytes_fun",
+    "mozfun_local.glam",
+    "mozfun_local.glean_fun",
+    "mozfun_local.hist_fun",
+    "mozfun_local.json_fun",
+    "mozfun_local.map_fun",
+    "mozfun_local.norm_fun",
+]
+
+
+def _import_in_fresh_interpreter(module):
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time(benchmark, module):
+    # a new interpreter every round, the first import is what workers pay
+    benchmark.pedantic(
+        _import_in_fresh_interpreter, args=(module,), rounds=5, iterations=1
+    )
@@ -0,0 +1,27 @@
+import pytest
+
+from generators import key_value_struct, scaled
+from mozfun_local.map_fun import map_get_key, map_sum
+
+
+@pytest.fixture
+def key_values():
+    return [(f"key_{i % 100}", float(i)) for i in range(scaled(100_000))]
+
+
+@pytest.fixture
+def structs(rng):
+    return [key_value_struct(rng, 20) for _ in range(scaled(1_000))]
+
+
+def test_map_sum(benchmark, key_values):
+    result = benchmark(map_sum, key_values)
+
+    assert len(result) == 100
+
+
+def test_map_get_key(benchmark, structs):
+    def get_keys():
+        return [map_get_key(s, "key_15", coerce_to_number="int") for s in structs]
+
+    assert len(benchmark(get_keys)) == len(structs)
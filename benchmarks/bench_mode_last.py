@@ -0,0 +1,21 @@
+import pandas as pd
+import pytest
+
+from generators import scaled
+from mozfun_local.json_fun import json_mode_last
+from mozfun_local.mozfun_local_rust import mode_last
+
+
+@pytest.fixture
+def ints():
+    return [(i * 7919) % 1_000 for i in range(scaled(100_000))]
+
+
+def test_stats_mode_last(benchmark, ints):
+    benchmark(mode_last, ints)
+
+
+def test_json_mode_last(benchmark, ints):
+    branches = pd.DataFrame([f"branch_{i}" for i in ints], columns=["test"])
+
+    benchmark(json_mode_last, branches)
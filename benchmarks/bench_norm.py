@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from generators import (
+    experiments_json,
+    fenix_app_build,
+    os_name,
+    scaled,
+    version_string,
+)
+from mozfun_local.glean_fun import glean_legacy_compatible_experiments
+from mozfun_local.norm_fun import (
+    norm_extract_version,
+    norm_glean_fenix_build_to_date,
+    norm_normalize_os,
+    norm_truncate_version,
+)
+
+
+@pytest.fixture
+def versions(rng):
+    return [version_string(rng) for _ in range(scaled(10_000))]
+
+
+def test_norm_normalize_os(benchmark, rng):
+    os_names = [os_name(rng) for _ in range(scaled(10_000))]
+
+    benchmark(lambda: [norm_normalize_os(os) for os in os_names])
+
+
+def test_norm_truncate_version(benchmark, versions):
+    benchmark(lambda: [norm_truncate_version(v, "minor") for v in versions])
+
+
+def test_norm_extract_version(benchmark, versions):
+    benchmark(lambda: [norm_extract_version(v, "patch") for v in versions])
+
+
+def test_norm_glean_fenix_build_to_date(benchmark, rng):
+    app_builds = [fenix_app_build(rng) for _ in range(scaled(10_000))]
+
+    benchmark(lambda: [norm_glean_fenix_build_to_date(b) for b in app_builds])
+
+
+def test_glean_legacy_compatible_experiments(benchmark, rng):
+    payloads = [[json.loads(experiments_json(rng, 10))] for _ in range(scaled(1_000))]
+
+    benchmark(lambda: [glean_legacy_compatible_experiments(p) for p in payloads])
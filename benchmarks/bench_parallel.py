@@ -0,0 +1,60 @@
+"""The per row Python functions applied to a column by mozfun_local.parallel,
+on 1 to 8 worker processes. One worker runs in the calling process, so it is
+the serial baseline. Compare the runs of a group:
+
+    python -m pytest benchmarks/bench_parallel.py --benchmark-group-by=func
+"""
+
+import json
+import os
+
+import pyarrow as pa
+import pytest
+
+from generators import fenix_app_build, scaled
+from mozfun_local import parallel
+
+WORKERS = [n for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stop_workers():
+    yield
+    parallel.shutdown()
+
+
+@pytest.fixture
+def app_builds(rng):
+    return pa.array([fenix_app_build(rng) for _ in range(scaled(100_000))])
+
+
+@pytest.fixture
+def int_maps(rng):
+    def int_map():
+        pairs = rng.integers(0, 1000, (20, 2))
+        return json.dumps([{"key": str(k), "value": str(v)} for k, v in pairs])
+
+    return pa.array([int_map() for _ in range(scaled(20_000))])
+
+
+def _warm(function, column, max_workers):
+    # start the pool outside the timed runs, as a long running process would
+    function(column[:1000], max_workers=max_workers, chunk_rows=100)
+
+
+@pytest.mark.parametrize("max_workers", WORKERS)
+def test_norm_glean_fenix_build_to_date_workers(benchmark, app_builds, max_workers):
+    function = parallel.norm_glean_fenix_build_to_date
+    _warm(function, app_builds, max_workers)
+    result = benchmark(function, app_builds, max_workers=max_workers)
+
+    assert len(result) == len(app_builds)
+
+
+@pytest.mark.parametrize("max_workers", WORKERS)
+def test_json_extract_int_map_workers(benchmark, int_maps, max_workers):
+    function = parallel.json_extract_int_map
+    _warm(function, int_maps, max_workers)
+    result = benchmark(function, int_maps, max_workers=max_workers)
+
+    assert len(result) == len(int_maps)
@@ -0,0 +1,59 @@
+"""The Rust functions called from a pool of Python threads. They release the
+GIL while they compute, so the same total work spread over more threads
+should take close to 1 / threads of the time, up to the number of cores.
+Compare the runs of a group:
+
+    python -m pytest benchmarks/bench_threads.py --benchmark-group-by=func
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+from generators import experiments_json, key_value_struct, scaled
+from mozfun_local.mozfun_local_rust import (
+    glean_legacy_compatible_experiments,
+    map_get_key,
+)
+
+THREADS = [n for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)]
+
+
+def _run_threaded(function, batches, n_threads):
+    def run_batch(batch):
+        return [function(*args) for args in batch]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return list(executor.map(run_batch, batches))
+
+
+def _batches(calls, n_batches=32):
+    return [calls[i::n_batches] for i in range(n_batches)]
+
+
+@pytest.fixture
+def structs(rng):
+    return [(key_value_struct(rng, 200), "key_150", True) for _ in range(scaled(2_000))]
+
+
+@pytest.fixture
+def experiments(rng):
+    return [(experiments_json(rng, 50),) for _ in range(scaled(2_000))]
+
+
+@pytest.mark.parametrize("n_threads", THREADS)
+def test_map_get_key_threads(benchmark, structs, n_threads):
+    result = benchmark(_run_threaded, map_get_key, _batches(structs), n_threads)
+
+    assert sum(len(batch) for batch in result) == len(structs)
+
+
+@pytest.mark.parametrize("n_threads", THREADS)
+def test_glean_legacy_compatible_experiments_threads(benchmark, experiments, n_threads):
+    batches = _batches(experiments)
+    result = benchmark(
+        _run_threaded, glean_legacy_compatible_experiments, batches, n_threads
+    )
+
+    assert sum(len(batch) for batch in result) == len(experiments)
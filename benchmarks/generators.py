@@ -0,0 +1,147 @@
+"""Synthetic telemetry for the benchmarks, shaped like what the functions
+see in production. Every generator takes a numpy Generator, so a seed and a
+scale always produce the same data and runs are comparable across commits.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Bucket lower bounds of an exponential main ping histogram with range
+# [1, 10000] and 50 buckets, as gc_ms has
+EXPONENTIAL_BUCKETS = [
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 17, 20, 24, 29, 34, 40, 48, 57, 68,
+    81, 96, 114, 135, 160, 190, 226, 268, 318, 378, 449, 533, 633, 752, 894,
+    1062, 1262, 1500, 1782, 2117, 2516, 2990, 3553, 4222, 5017, 5961, 7083,
+    8416, 10000,
+]  # fmt: skip
+
+EXPONENTIAL_METADATA = json.dumps(
+    {
+        "probe": "gc_ms",
+        "histogram_type": "custom_distribution_exponential",
+        "process": "parent",
+        "probe_location": "payload.histograms.gc_ms",
+        "buckets_key": "min, max, n_buckets",
+        "buckets_for_probe": [1, 10000, 50],
+    }
+)
+
+_OS_NAMES = [
+    "Windows_NT",
+    "Darwin",
+    "Linux",
+    "Android",
+    "iOS",
+    "iPadOS",
+    "FreeBSD",
+    "SunOS",
+]
+
+
+def scaled(rows: int) -> int:
+    """Rows per benchmark input, scaled by MOZFUN_LOCAL_BENCH_SCALE (default 1)"""
+    scale = float(os.environ.get("MOZFUN_LOCAL_BENCH_SCALE", 1))
+    return max(int(rows * scale), 1)
+
+
+def main_histogram_json(rng: np.random.Generator) -> str:
+    """A main ping histogram: a handful of neighbouring buckets around a per
+    ping centre, the way timing probes cluster"""
+    centre = rng.integers(2, len(EXPONENTIAL_BUCKETS) - 2)
+    spread = rng.integers(1, 4)
+    indices = range(max(centre - spread, 0), min(centre + spread, 49) + 1)
+    values = {
+        str(EXPONENTIAL_BUCKETS[i]): int(count)
+        for i, count in zip(indices, rng.integers(1, 20, len(indices)))
+    }
+
+    return json.dumps(
+        {
+            "bucket_count": 50,
+            "histogram_type": 0,
+            "sum": sum(int(k) * v for k, v in values.items()),
+            "range": [1, 10000],
+            "values": values,
+        }
+    )
+
+
+def main_ping_rows(
+    rng: np.random.Generator, n_clients: int, pings_per_client: int, n_builds: int
+) -> dict:
+    """client_id, build_id and gc_ms columns for n_clients clients that each
+    sent pings_per_client pings, spread over n_builds builds"""
+    builds = 20230101000000 + rng.integers(0, n_builds, n_clients)
+    client_ids, build_ids, histograms = [], [], []
+
+    for client, build in enumerate(builds):
+        for _ in range(pings_per_client):
+            client_ids.append(f"{client:032x}")
+            build_ids.append(str(build))
+            histograms.append(main_histogram_json(rng))
+
+    return {"client_id": client_ids, "build_id": build_ids, "gc_ms": histograms}
+
+
+def key_value_struct(rng: np.random.Generator, n_keys: int) -> str:
+    """BigQuery array<struct<key, value>> as it comes out of a query, with the
+    braces map_get_key trims"""
+    pairs = [
+        {"key": f"key_{i}", "value": str(v)}
+        for i, v in enumerate(rng.integers(0, 2**32, n_keys))
+    ]
+
+    return "{" + json.dumps(pairs) + "}"
+
+
+def version_string(rng: np.random.Generator) -> str:
+    """Firefox style version strings, e.g. 110.0.1 or 111.0b3"""
+    major = rng.integers(90, 120)
+    kind = rng.integers(0, 3)
+    if kind == 0:
+        return f"{major}.0"
+    if kind == 1:
+        return f"{major}.0.{rng.integers(1, 4)}"
+    return f"{major}.0b{rng.integers(1, 10)}"
+
+
+def os_name(rng: np.random.Generator) -> str:
+    """Raw os names as clients report them"""
+    return _OS_NAMES[rng.integers(0, len(_OS_NAMES))]
+
+
+def fenix_app_build(rng: np.random.Generator) -> str:
+    """Fenix client_info.app_build, both the old 8 digit and the 10 digit
+    format"""
+    if rng.random() < 0.2:
+        return (
+            f"{rng.integers(0, 5)}{rng.integers(1, 366):03d}"
+            f"{rng.integers(0, 24):02d}{rng.integers(0, 60):02d}"
+        )
+    return str(int(rng.integers(2_015_000_000, 2_016_000_000)))
+
+
+def experiments_json(rng: np.random.Generator, n_experiments: int) -> str:
+    """Glean experiments payload with n_experiments enrolments"""
+    branches = ["control", "treatment-a", "treatment-b"]
+    return json.dumps(
+        {
+            "experiments": [
+                {
+                    "key": f"experiment_{i}",
+                    "value": {
+                        "branch": branches[rng.integers(0, 3)],
+                        "extra": {"type": "nimbus-nimbus"},
+                    },
+                }
+                for i in range(n_experiments)
+            ]
+        }
+    )
+
+
+def byte_strings(rng: np.random.Generator, n: int, width: int) -> np.ndarray:
+    """n fixed width byte strings as a 2-D uint8 array"""
+    return rng.integers(0, 256, (n, width), dtype=np.uint8)
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+
+class FakeQueryJob:
+    def __init__(self, table):
+        self.table = table
+
+    def result(self):
+        return self
+
+    def to_arrow(self):
+        return self.table
+
+
+class FakeClient:
+    """Stands in for bigquery.Client: answers every query with the same Arrow
+    table, after an optional delay, and records the queries it is sent"""
+
+    def __init__(self, table, delay: float = 0):
+        self.table = table
+        self.delay = delay
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def query(self, sql):
+        with self._lock:
+            self.queries.append(sql)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(self.delay)
+
+        with self._lock:
+            self.in_flight -= 1
+
+        return FakeQueryJob(self.table)
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient
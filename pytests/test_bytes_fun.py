@@ -1,7 +1,12 @@
+import numpy as np
+import pyarrow as pa
+
 from mozfun_local.bytes_fun import (
     bytes_bit_pos_to_byte_pos,
     bytes_zero_right,
     bytes_extract_bits,
+    bytes_zero_right_column,
+    bytes_extract_bits_column,
 )
 
 
@@ -19,19 +24,55 @@ def test_bytes_zero_right():
     assert b"\xF0" == bytes_zero_right(b"\xFF", 4)
     assert b"\xFF" == bytes_zero_right(b"\xFF", 0)
     assert b"\x00" == bytes_zero_right(b"\xFF", 8)
+    assert b"\xFF\x00" == bytes_zero_right(b"\xFF\xFF", 8)
 
 
 def test_bytes_extract_bits():
-    assert True
-    # assert b"\xFF" == bytes_extract_bits(b"\x01\xFE", 8, 8)
-    # assert b"\xF0" == bytes_extract_bits(b"\xFF", 5, 4)
-    # assert b"\xFF" == bytes_extract_bits(b"\x0F\xF0", -12, 8)
-    # assert b"\x0F" == bytes_extract_bits(b"\x0F\x77", 0, 8)
-    # assert b"\xFC" == bytes_extract_bits(b"\x0F\xF0", -10, 8)
-    # assert b"\xFF" == bytes_extract_bits(b"\x0F\xF0", 5, 8)
-    # assert b"\xCC" == bytes_extract_bits(b"\x0C\xC0", -12, 8)
-    # assert b"\x80" == bytes_extract_bits(b"\xFF", -4, 1)
-    # assert b"\xC0" == bytes_extract_bits(b"\xFF\xFF", 2, 2)
-    # assert b"\x80" == bytes_extract_bits(b"\xFF\xFF", 6, 1)
-    # assert b"\x80" == bytes_extract_bits(b"\xFF\xFF", 1, 1)
-    # assert b"\xFF" == bytes_extract_bits(b"\xFF", 1, 20)
+    assert b"\xFF" == bytes_extract_bits(b"\x01\xFE", 8, 8)
+    assert b"\xF0" == bytes_extract_bits(b"\xFF", 5, 4)
+    assert b"\xFF" == bytes_extract_bits(b"\x0F\xF0", -12, 8)
+    assert b"\x0F" == bytes_extract_bits(b"\x0F\x77", 0, 8)
+    assert b"\xFC" == bytes_extract_bits(b"\x0F\xF0", -10, 8)
+    assert b"\xFF" == bytes_extract_bits(b"\x0F\xF0", 5, 8)
+    assert b"\xCC" == bytes_extract_bits(b"\x0C\xC0", -12, 8)
+    assert b"\x80" == bytes_extract_bits(b"\xFF", -4, 1)
+    assert b"\xC0" == bytes_extract_bits(b"\xFF\xFF", 2, 2)
+    assert b"\x80" == bytes_extract_bits(b"\xFF\xFF", 6, 1)
+    assert b"\x80" == bytes_extract_bits(b"\xFF\xFF", 1, 1)
+    assert b"\xFF" == bytes_extract_bits(b"\xFF", 1, 20)
+    # as wide as BigQuery's result, bits past the end are zero
+    assert b"\xFF\x00" == bytes_extract_bits(b"\xFF\xFF", 9, 16)
+    assert b"\x00" == bytes_extract_bits(b"\xFF", 9, 8)
+
+
+def test_bytes_zero_right_column():
+    column = pa.array([b"\xFF", None, b"\x0F\xF0\x11"])
+    assert bytes_zero_right_column(column, 4).to_pylist() == [
+        b"\xF0",
+        None,
+        b"\x0F\xF0\x10",
+    ]
+
+    fixed = np.array([b"\xFF\xFF", b"\x0F\xF0"], dtype="S2")
+    result = bytes_zero_right_column(fixed, 12)
+    assert result.tolist() == [[0xF0, 0x00], [0x00, 0x00]]
+
+
+def test_bytes_extract_bits_column():
+    column = pa.array([b"\x01\xFE", b"\x0F\xF0", None])[1:]
+    assert bytes_extract_bits_column(column, -12, 8).to_pylist() == [b"\xFF", None]
+
+    fixed = pa.array([b"\x0F\xF0", b"\x0C\xC0"], pa.binary(2))
+    assert bytes_extract_bits_column(fixed, -12, 8).to_pylist() == [b"\xFF", b"\xCC"]
+
+    # every row is min(CEIL(length / 8), its own length) bytes
+    short = pa.array([b"\xFF", b"\xFF\xFF", b""])
+    assert bytes_extract_bits_column(short, 9, 16).to_pylist() == [
+        b"\x00",
+        b"\xFF\x00",
+        b"",
+    ]
+
+    for value, begin, length in [(b"\x0F\xF0", -10, 8), (b"\xFF\xFF", 2, 2)]:
+        result = bytes_extract_bits_column(np.array([value]), begin, length)
+        assert result[0].tobytes() == bytes_extract_bits(value, begin, length)
@@ -0,0 +1,415 @@
+import json
+import pickle
+
+import pyarrow as pa
+import pytest
+
+from mozfun_local import glam
+from mozfun_local.glam import (
+    calculate_percentiles,
+    date_range,
+    GlamOptions,
+    HyperLogLog,
+    glam_bootstrap_percentiles,
+    glam_client_counts,
+    glam_style_histogram,
+    glam_style_histogram_dates,
+    glam_style_histogram_sampled,
+    glam_style_histogram_slices,
+    merge_client_counts,
+)
+
+_METADATA = json.dumps(
+    {
+        "probe": "gc_ms",
+        "histogram_type": "custom_distribution_exponential",
+        "process": "parent",
+        "probe_location": "payload.histograms.gc_ms",
+        "buckets_key": "min, max, n_buckets",
+        "buckets_for_probe": [1, 10000, 10],
+    }
+)
+
+
+def _histogram(values):
+    return json.dumps(
+        {
+            "bucket_count": 10,
+            "histogram_type": 0,
+            "sum": sum(int(k) * v for k, v in values.items()),
+            "range": [1, 10000],
+            "values": values,
+        }
+    )
+
+
+def _histograms():
+    return pa.table(
+        {
+            "client_id": ["a", "a", "b", "c"],
+            "build_id": ["20230101", "20230101", "20230101", "20230102"],
+            "gc_ms": [
+                _histogram({"1": 2, "3": 1}),
+                _histogram({"3": 1}),
+                _histogram({"10": 4}),
+                _histogram({"32": 1}),
+            ],
+        }
+    )
+
+
+def _client_aggregated_histograms():
+    return pa.table(
+        {
+            "client_id": ["a", "b", "c"],
+            "build_id": ["20230101", "20230101", "20230102"],
+            "gc_ms": [
+                '{"values": {"1": 2, "3": 2}}',
+                '{"values": {"10": 4}}',
+                '{"values": {"32": 1}}',
+            ],
+        }
+    )
+
+
+def _struct_histograms():
+    bucket = pa.struct([("key", pa.int64()), ("value", pa.int64())])
+    return pa.table(
+        {
+            "client_id": ["a", "a", "b", "c"],
+            "build_id": ["20230101", "20230101", "20230101", "20230102"],
+            "gc_ms": pa.array(
+                [
+                    [{"key": 1, "value": 2}, {"key": 3, "value": 1}],
+                    [{"key": 3, "value": 1}],
+                    [{"key": 10, "value": 4}],
+                    [{"key": 32, "value": 1}],
+                ],
+                type=pa.list_(bucket),
+            ),
+        }
+    )
+
+
+def _assert_histograms_close(result, expected):
+    assert [k for k, *_ in result] == [k for k, _ in expected]
+    assert [v for _, v, *_ in result] == pytest.approx([v for _, v in expected])
+
+
+def _options(client, **options):
+    return GlamOptions(use_cache=False, client=client, **options)
+
+
+@pytest.fixture(autouse=True)
+def gc_ms_metadata(monkeypatch):
+    monkeypatch.setattr(glam, "get_metadata", lambda probe: _METADATA)
+
+
+def test_date_range():
+    assert date_range("2022-12-31", "2023-01-02") == [
+        "2022-12-31",
+        "2023-01-01",
+        "2023-01-02",
+    ]
+
+
+def test_glam_style_histogram_dates(fake_client):
+    dates = date_range("2023-01-01", "2023-01-05")
+    client = fake_client(_histograms(), delay=0.05)
+
+    stats = {}
+    results = glam_style_histogram_dates(
+        "gc_ms", False, dates, max_workers=2, options=_options(client), stats=stats
+    )
+    single = glam_style_histogram(
+        "gc_ms", False, dates[0], options=_options(fake_client(_histograms()))
+    )
+
+    assert list(results) == dates
+    assert len(client.queries) == len(dates)
+    assert client.max_in_flight <= 2
+    for date in dates:
+        assert sorted(results[date]) == sorted(single)
+        assert stats[date]["rows"] == 4
+
+
+def test_glam_style_histogram_aggregate_in_query(fake_client):
+    raw_client = fake_client(_histograms())
+    aggregated_client = fake_client(_client_aggregated_histograms())
+
+    raw = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(raw_client)
+    )
+    aggregated = glam_style_histogram(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        options=_options(aggregated_client, aggregate_in_query=True),
+    )
+
+    assert "GROUP BY client_id, build_id" in aggregated_client.queries[0]
+    assert "GROUP BY" not in raw_client.queries[0]
+    assert sorted(raw) == sorted(aggregated)
+
+
+def test_glam_style_histogram_struct_format(fake_client):
+    json_result = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+    struct_client = fake_client(_struct_histograms())
+    struct_result = glam_style_histogram(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        options=_options(struct_client, histogram_format="struct"),
+    )
+
+    assert "mozfun.hist.extract(payload.histograms.gc_ms).values" in (
+        struct_client.queries[0]
+    )
+    assert sorted(struct_result) == sorted(json_result)
+
+
+def test_glam_style_histogram_sampled(fake_client):
+    sampled_client = fake_client(_histograms())
+    sampled = glam_style_histogram_sampled(
+        "gc_ms", False, "2023-01-01", sample_rate=0.5, options=_options(sampled_client)
+    )
+    exact = dict(
+        glam_style_histogram(
+            "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+        )
+    )
+
+    assert "MOD(ABS(FARM_FINGERPRINT(client_id)), 10000) < 5000" in (
+        sampled_client.queries[0]
+    )
+    assert sorted(sampled) == sorted(exact)
+    assert sampled["20230101"]["sampled_clients"] == 2
+    assert sampled["20230101"]["n_reporting"] == 4
+    for build_id, result in sampled.items():
+        _assert_histograms_close(result["histogram"], exact[build_id])
+        for estimate, low, high in result["percentiles"].values():
+            assert low <= estimate <= high
+
+
+def test_glam_bootstrap_percentiles(fake_client):
+    results = glam_bootstrap_percentiles(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        percentiles=[0.25, 0.5, 0.75],
+        n_replicates=200,
+        options=_options(fake_client(_histograms())),
+    )
+    exact = dict(
+        glam_style_histogram(
+            "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+        )
+    )
+
+    assert sorted(results) == sorted(exact)
+    for build_id, result in results.items():
+        _assert_histograms_close(result["histogram"], exact[build_id])
+        point = calculate_percentiles(exact[build_id], [0.25, 0.5, 0.75])
+        for p, (estimate, low, high) in result["percentiles"].items():
+            assert estimate == point[p]
+            assert low <= estimate <= high
+
+
+def test_glam_style_histogram_profile(fake_client):
+    profile = {}
+    result = glam_style_histogram(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        options=_options(fake_client(_histograms())),
+        stats=profile,
+    )
+    plain = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+
+    assert sorted(result) == sorted(plain)
+    assert (profile["rows"], profile["clients"], profile["builds"]) == (4, 3, 2)
+    assert profile["arrow_bytes"] > 0
+    assert profile["bytes_parsed"] > 0
+    stages = [
+        "query_seconds",
+        "to_polars_seconds",
+        "parse_seconds",
+        "dirichlet_seconds",
+        "to_python_seconds",
+    ]
+    assert all(profile[stage] >= 0 for stage in stages)
+    assert profile["total_seconds"] >= sum(profile[stage] for stage in stages)
+
+
+def test_glam_client_counts(fake_client):
+    first = glam_client_counts(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+    next_day = pa.table(
+        {
+            "client_id": ["b", "d"],
+            "build_id": ["20230101", "20230101"],
+            "gc_ms": [_histogram({"3": 1}), _histogram({"1": 1})],
+        }
+    )
+    second = glam_client_counts(
+        "gc_ms", False, "2023-01-02", options=_options(fake_client(next_day))
+    )
+
+    assert len(first["20230101"]["clients"]) == 2
+    assert {k: len(v) for k, v in first["20230101"]["buckets"].items()} == {
+        1: 1,
+        3: 1,
+        10: 1,
+    }
+
+    window = merge_client_counts(first, second)
+    assert len(window["20230101"]["clients"]) == 3
+    assert len(window["20230102"]["clients"]) == 1
+    assert {k: len(v) for k, v in window["20230101"]["buckets"].items()} == {
+        1: 2,
+        3: 2,
+        10: 1,
+    }
+    # merging leaves the daily sketches as they were
+    assert len(first["20230101"]["clients"]) == 2
+
+    sketch = window["20230101"]["clients"]
+    assert HyperLogLog.from_bytes(sketch.to_bytes()).estimate() == sketch.estimate()
+    assert pickle.loads(pickle.dumps(sketch)).estimate() == sketch.estimate()
+    with pytest.raises(ValueError):
+        sketch.merge(HyperLogLog(precision=10))
+
+
+def test_glam_style_histogram_slices(fake_client):
+    histograms = _histograms().append_column(
+        "os", pa.array(["Windows_NT", "Windows_NT", "Darwin", "Linux"])
+    )
+    client = fake_client(histograms.append_column("channel", pa.array(["release"] * 4)))
+    slices = glam_style_histogram_slices(
+        "gc_ms", False, "2023-01-01", rollups=True, options=_options(client)
+    )
+    by_build = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+
+    assert "normalized_channel AS channel" in client.queries[0]
+    assert slices[("20230101", "Windows", "release")]["n_reporting"] == 1
+    assert slices[("20230101", "Mac", "release")]["n_reporting"] == 1
+    assert slices[("*", "*", "release")]["n_reporting"] == 3
+    for build_id, histogram in by_build:
+        _assert_histograms_close(slices[(build_id, "*", "*")]["histogram"], histogram)
+
+    process_client = fake_client(
+        histograms.append_column(
+            "process", pa.array(["parent", "content", "parent", "gpu"])
+        )
+    )
+    by_process = glam_style_histogram_slices(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        group_by=["build_id", "process"],
+        options=_options(process_client),
+    )
+    assert "payload.processes.gpu.histograms.gc_ms" in process_client.queries[0]
+    assert by_process[("20230101", "content")]["n_reporting"] == 1
+
+
+def test_glam_style_histogram_memory_budget(fake_client, tmp_path):
+    expected = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+    stats = {}
+    spilled = glam_style_histogram(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        options=_options(
+            fake_client(_histograms()), memory_budget=0, spill_dir=str(tmp_path)
+        ),
+        stats=stats,
+    )
+
+    assert stats["spilled_bytes"] > 0
+    assert list(tmp_path.iterdir()) == []
+    for (build_id, histogram), (spilled_id, spilled_histogram) in zip(
+        sorted(expected), sorted(spilled)
+    ):
+        assert build_id == spilled_id
+        _assert_histograms_close(spilled_histogram, histogram)
+
+
+def test_glam_style_histogram_sort_in_query(fake_client):
+    expected = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+    client = fake_client(_histograms())
+    result = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(client, sort_in_query=True)
+    )
+
+    assert "ORDER BY application.build_id, client_id" in client.queries[0]
+    for (build_id, histogram), (sorted_id, sorted_histogram) in zip(
+        sorted(expected), sorted(result)
+    ):
+        assert build_id == sorted_id
+        _assert_histograms_close(sorted_histogram, histogram)
+
+
+def test_glam_style_histogram_deduplicate(fake_client, caplog):
+    expected = glam_style_histogram(
+        "gc_ms", False, "2023-01-01", options=_options(fake_client(_histograms()))
+    )
+    # client b's ping arrived three times
+    histograms = _histograms()
+    retried = pa.concat_tables(
+        [histograms, histograms.slice(2, 1), histograms.slice(2, 1)]
+    )
+    retried = retried.append_column(
+        "document_id", pa.array(["d0", "d1", "d2", "d3", "d2", "d2"])
+    )
+    client = fake_client(retried)
+    stats = {}
+    result = glam_style_histogram(
+        "gc_ms",
+        False,
+        "2023-01-01",
+        options=_options(client, deduplicate=True),
+        stats=stats,
+    )
+
+    assert "document_id" in client.queries[0]
+    assert (stats["rows"], stats["duplicate_rows"]) == (4, 2)
+    assert stats["approximate_duplicate_rows"] == 0
+
+    # dropped pings are reported without asking for stats
+    with caplog.at_level("INFO", logger="mozfun_local.glam"):
+        glam_style_histogram(
+            "gc_ms",
+            False,
+            "2023-01-01",
+            options=_options(fake_client(retried), deduplicate=True),
+        )
+    assert "dropped 2 duplicate pings" in caplog.text
+    for (build_id, histogram), (dedup_id, dedup_histogram) in zip(
+        sorted(expected), sorted(result)
+    ):
+        assert build_id == dedup_id
+        _assert_histograms_close(dedup_histogram, histogram)
+
+    with pytest.raises(AssertionError):
+        glam_style_histogram(
+            "gc_ms",
+            False,
+            "2023-01-01",
+            options=_options(
+                fake_client(_client_aggregated_histograms()),
+                aggregate_in_query=True,
+                deduplicate=True,
+            ),
+        )
@@ -0,0 +1,96 @@
+import os
+
+import pyarrow as pa
+import pytest
+
+from mozfun_local.glam import _fetch_histograms
+from mozfun_local.glam_cache import QueryCache, is_immutable_date
+
+
+def _histograms():
+    return pa.table(
+        {
+            "client_id": ["a", "a", "b"],
+            "build_id": ["20230101", "20230101", "20230102"],
+            "gc_ms": ['{"values": {"1": 1}}', '{"values": {"2": 1}}', None],
+        }
+    )
+
+
+_PARAMS = dict(
+    table="proj.dataset.table",
+    probe="gc_ms",
+    date="2023-01-01",
+    limit=None,
+    keyed=False,
+)
+
+
+def test_query_cache_round_trip(tmp_path):
+    cache = QueryCache(tmp_path)
+    key = cache.key(**_PARAMS)
+
+    assert cache.get(key) is None
+    cache.put(key, _histograms())
+    assert cache.get(key).equals(_histograms())
+    assert key != cache.key(**dict(_PARAMS, date="2023-01-02"))
+
+
+def test_query_cache_drops_corrupt_results(tmp_path):
+    cache = QueryCache(tmp_path)
+    key = cache.key(**_PARAMS)
+    cache.put(key, _histograms())
+    path = cache._path(key)
+    path.write_bytes(path.read_bytes()[:40])
+
+    assert cache.get(key) is None
+    assert not path.exists()
+    cache.put(key, _histograms())
+    assert cache.get(key).equals(_histograms())
+
+
+def test_query_cache_put_removes_partial_file(tmp_path, monkeypatch):
+    cache = QueryCache(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(pa.ipc, "new_file", fail)
+    with pytest.raises(OSError):
+        cache.put(cache.key(**_PARAMS), _histograms())
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_query_cache_evicts_least_recently_used(tmp_path):
+    cache = QueryCache(tmp_path, max_bytes=10**9)
+    keys = [cache.key(**dict(_PARAMS, limit=i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, _histograms())
+        os.utime(cache._path(key), (i, i))
+
+    cache.get(keys[0])
+    cache.max_bytes = 2 * cache._path(keys[0]).stat().st_size
+    cache.evict()
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_fetch_histograms_uses_cache(tmp_path, fake_client):
+    cache = QueryCache(tmp_path)
+    client = fake_client(_histograms())
+
+    first = _fetch_histograms("SELECT 1", _PARAMS, cache=cache, client=client)
+    second = _fetch_histograms("SELECT 1", _PARAMS, cache=cache, client=client)
+    assert len(client.queries) == 1
+    assert first.equals(second)
+
+    _fetch_histograms("SELECT 1", _PARAMS, use_cache=False, cache=cache, client=client)
+    assert len(client.queries) == 2
+
+
+def test_is_immutable_date():
+    assert is_immutable_date("2023-01-01")
+    assert not is_immutable_date("2999-01-01")
@@ -1,7 +1,16 @@
+import json
+import pickle
+
+import polars as pl
+import pytest
+
 from mozfun_local.glean_fun import (
+    glean_experiment_index,
     glean_legacy_compatible_experiments,
     glean_timespan_nanos,
+    glean_timespan_nanos_column,
     glean_timespan_seconds,
+    glean_timespan_seconds_column,
 )
 
 
@@ -50,3 +59,134 @@ def test_glean_timespan_seconds():
     assert (
         glean_timespan_seconds({"time_unit": "nonexistent_unit", "value": 13}) is None
     )
+
+
+def test_glean_timespan_seconds_from_string():
+    assert 345_600 == glean_timespan_seconds('{"time_unit": "day", "value": 4}')
+    assert glean_timespan_seconds("{not a struct") is None
+
+
+def test_glean_timespan_nanos_column():
+    timespans = [
+        {"time_unit": "day", "value": 4},
+        {"time_unit": "nanosecond", "value": 13},
+        {"time_unit": "nonexistent_unit", "value": 13},
+        {"time_unit": "millisecond", "value": None},
+    ]
+    result = glean_timespan_nanos_column(pl.Series(timespans))
+
+    assert result.dtype == pl.Int64
+    assert result.to_list() == [345_600_000_000_000, 13, None, None]
+
+    units = ["second", "minute", None]
+    assert glean_timespan_nanos_column(units, [2, 1, 1]).to_list() == [
+        2_000_000_000,
+        60_000_000_000,
+        None,
+    ]
+
+
+def test_glean_timespan_seconds_column():
+    timespans = [
+        {"time_unit": "day", "value": 4},
+        {"time_unit": "nanosecond", "value": 13},
+        {"time_unit": "second", "value": 13},
+        {"time_unit": "millisecond", "value": 1999},
+        {"time_unit": "nonexistent_unit", "value": 13},
+    ]
+    result = glean_timespan_seconds_column(pl.Series(timespans))
+
+    assert result.to_list() == [345_600, 0, 13, 1, None]
+    for timespan, seconds in zip(timespans, result.to_list()):
+        assert glean_timespan_seconds(timespan) == seconds
+
+
+def test_glean_timespan_column_overflow():
+    # 2**40 days is past int64 nanoseconds, 2**50 days past int64 seconds
+    timespans = [
+        {"time_unit": "day", "value": 2**40},
+        {"time_unit": "day", "value": -(2**50)},
+        {"time_unit": "hour", "value": 2},
+    ]
+    nanos = glean_timespan_nanos_column(pl.Series(timespans)).to_list()
+    seconds = glean_timespan_seconds_column(pl.Series(timespans)).to_list()
+
+    assert nanos == [None, None, 7_200_000_000_000]
+    assert seconds == [2**40 * 86_400, None, 7_200]
+
+
+def test_glean_timespan_seconds_integer():
+    # past 2**53 a float division would round, the column path does not
+    timespans = [
+        {"time_unit": "hour", "value": 2**50 + 1},
+        {"time_unit": "millisecond", "value": -1999},
+        {"time_unit": "nanosecond", "value": 2**62 + 1},
+    ]
+    column = glean_timespan_seconds_column(pl.Series(timespans)).to_list()
+
+    assert column == [(2**50 + 1) * 3600, -1, (2**62 + 1) // 10**9]
+    assert [glean_timespan_seconds(t) for t in timespans] == column
+
+
+def test_glean_experiment_index():
+    def payload(*enrollments):
+        return json.dumps(
+            {
+                "experiments": [
+                    {"key": key, "value": {"branch": branch, "extra": {}}}
+                    for key, branch in enrollments
+                ]
+            }
+        )
+
+    rows = [
+        payload(("a", "control"), ("b", "treatment")),
+        payload(("a", "treatment")),
+        None,
+        payload(("b", "control")),
+        payload(("a", "control")),
+    ]
+    index = glean_experiment_index(rows)
+
+    assert index.n_rows == 5
+    assert index.experiments() == ["a", "b"]
+    assert index.branches("a") == ["control", "treatment"]
+    assert index.rows("a", "control").to_list() == [0, 4]
+    assert index.rows("a").to_list() == [0, 1, 4]
+    assert len(index.rows("missing")) == 0
+    assert index.intersect([("a", "control"), ("b", None)]).to_list() == [0]
+    assert (index.rows("a") - index.rows("b")).to_list() == [1, 4]
+    assert 3 in (index.rows("a") | index.rows("b"))
+    assert index.counts() == {
+        "a": {"control": 2, "treatment": 1},
+        "b": {"control": 1, "treatment": 1},
+    }
+
+    restored = pickle.loads(pickle.dumps(index))
+    assert restored.counts() == index.counts()
+    assert restored.to_bytes() == index.to_bytes()
+
+    structs = pl.Series(
+        [
+            [{"key": "a", "value": {"branch": "control"}}],
+            [],
+            [{"key": "a", "value": {"branch": "treatment"}}],
+        ]
+    )
+    assert glean_experiment_index(structs).rows("a").to_list() == [0, 2]
+
+
+def test_glean_experiment_index_legacy_forms():
+    payload = {"experiments": [{"key": "a", "value": {"branch": "control"}}]}
+    rows = [
+        json.dumps(payload),
+        "[" + json.dumps(payload) + "]",
+        str(payload),
+        None,
+    ]
+    index = glean_experiment_index(rows)
+
+    assert index.rows("a", "control").to_list() == [0, 1, 2]
+    assert glean_experiment_index([payload, None]).rows("a").to_list() == [0]
+    with pytest.raises(ValueError):
+        glean_experiment_index(["{'experiments': ["])
@@ -0,0 +1,35 @@
+import polars as pl
+
+from mozfun_local.hist_fun import hist_normalize, hist_normalize_column
+
+
+def test_hist_normalize():
+    assert hist_normalize({2: 1.0, 11: 3.0}) == {2: 0.25, 11: 0.75}
+
+
+def test_hist_normalize_column_json():
+    column = pl.Series(
+        [
+            '{"bucket_count": 3, "histogram_type": 1, "sum": 13, "range": [1, 2], "values": {"2": 1, "11": 1}}',
+            '{"0": 3, "1": 1}',
+            None,
+        ]
+    )
+    result = hist_normalize_column(column).to_list()
+
+    assert result[0] == [{"bucket": 2, "value": 0.5}, {"bucket": 11, "value": 0.5}]
+    assert result[1] == [{"bucket": 0, "value": 0.75}, {"bucket": 1, "value": 0.25}]
+    assert result[2] is None
+
+
+def test_hist_normalize_column_structs():
+    column = pl.Series(
+        [
+            [{"key": 11, "value": 1}, {"key": 2, "value": 3}],
+            [],
+        ]
+    )
+    result = hist_normalize_column(column).to_list()
+
+    assert result[0] == [{"bucket": 2, "value": 0.75}, {"bucket": 11, "value": 0.25}]
+    assert result[1] == []
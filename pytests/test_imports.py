@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_DEPENDENCIES = [
+    "google.cloud.bigquery",
+    "numba",
+    "numpy",
+    "pandas",
+    "polars",
+    "pyarrow",
+]
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "mozfun_local.bytes_fun",
+        "mozfun_local.glam",
+        "mozfun_local.glam_cache",
+        "mozfun_local.glean_fun",
+        "mozfun_local.hist_fun",
+        "mozfun_local.json_fun",
+        "mozfun_local.map_fun",
+        "mozfun_local.norm_fun",
+    ],
+)
+def test_import_defers_heavy_dependencies(module):
+    code = (
+        f"import json, sys, {module}; "
+        f"print(json.dumps([m for m in {HEAVY_DEPENDENCIES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+
+    assert json.loads(result.stdout) == []
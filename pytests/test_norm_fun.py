@@ -2,7 +2,7 @@ from datetime import datetime
 
 import numpy as np
 
-from mozfun_local.norm_fun import norm_glean_fenix_build_to_date
+from mozfun_local.norm_fun import _to_int64, norm_glean_fenix_build_to_date
 
 
 def test_norm_glean_fenix_build_to_date_old_style_typical_date():
@@ -45,3 +45,12 @@ def test_norm_glean_fenix_build_to_date_old_style_typical_date():
     assert None == norm_glean_fenix_build_to_date("11831860")
 
     assert None == norm_glean_fenix_build_to_date("11832459")
+
+
+def test_to_int64():
+    assert _to_int64("2015757667") == 2015757667
+    assert _to_int64(str(2**63 - 1)) == 2**63 - 1
+    assert _to_int64(str(-(2**63))) == -(2**63)
+    assert _to_int64(str(2**63)) is None
+    assert _to_int64(str(-(2**63) - 1)) is None
+    assert _to_int64("hi") is None
@@ -0,0 +1,61 @@
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+from mozfun_local import parallel
+from mozfun_local.bytes_fun import bytes_extract_bits
+from mozfun_local.glean_fun import glean_timespan_seconds
+from mozfun_local.json_fun import json_extract_int_map, json_extract_string_map
+from mozfun_local.norm_fun import norm_glean_fenix_build_to_date
+
+
+def test_json_extract_maps():
+    int_maps = ['[{"key": "%d", "value": "%d"}]' % (i, i * 3) for i in range(200)] + [
+        None
+    ]
+    string_maps = pd.Series(
+        ['{"a": %d, "b": null}' % i for i in range(200)] + [None, "{}"],
+        index=range(10, 212),
+    )
+
+    ints = parallel.json_extract_int_map(int_maps, max_workers=2, chunk_rows=30)
+    strings = parallel.json_extract_string_map(
+        string_maps, max_workers=2, chunk_rows=30
+    )
+
+    assert ints == [None if m is None else json_extract_int_map(m) for m in int_maps]
+    assert list(strings.index) == list(string_maps.index)
+    assert strings.tolist()[:-2] == [
+        json_extract_string_map(m) for m in string_maps.tolist()[:-2]
+    ]
+    assert pd.isna(strings.iloc[-2])
+    assert strings.iloc[-1] == [None]
+
+
+def test_glean_norm_bytes():
+    timespans = pa.array(
+        [{"time_unit": "millisecond", "value": i * 999} for i in range(100)]
+        + [{"time_unit": "fortnight", "value": 1}]
+    )
+    builds = pl.Series("app_build", ["21850000", "2015051234", None, "abc"] * 25)
+    data = [bytes([i, 255 - i]) for i in range(100)]
+
+    seconds = parallel.glean_timespan_seconds(timespans, max_workers=2, chunk_rows=16)
+    dates = parallel.norm_glean_fenix_build_to_date(
+        builds, max_workers=2, chunk_rows=16
+    )
+    bits = parallel.bytes_extract_bits(data, 3, 7, max_workers=2, chunk_rows=16)
+
+    assert seconds.to_pylist() == [
+        glean_timespan_seconds(t) for t in timespans.to_pylist()
+    ]
+    assert dates.name == "app_build"
+    assert dates.to_list() == [
+        None if b is None else norm_glean_fenix_build_to_date(b)
+        for b in builds.to_list()
+    ]
+    assert bits == [bytes_extract_bits(b, 3, 7) for b in data]
+
+    # one chunk is done in this process
+    assert parallel.glean_timespan_seconds(timespans, max_workers=1).equals(seconds)
+    parallel.shutdown()
@@ -0,0 +1,93 @@
+import polars as pl
+
+import mozfun_local.polars_ext  # noqa: F401
+from mozfun_local.glean_fun import glean_timespan_seconds
+from mozfun_local.norm_fun import norm_extract_version, norm_normalize_os
+
+
+def test_norm_expressions():
+    os_names = ["Windows_NT", "Darwin", None, "GNU/Linux", "AIX"]
+    versions = ["106.0.1", "5.1.5-ubuntu-foobar", None, "10", "PerrysNightlyBuild"]
+    df = pl.DataFrame({"os": os_names, "version": versions})
+
+    result = (
+        df.lazy()
+        .select(
+            pl.col("os").mozfun.norm_normalize_os(),
+            pl.col("version").mozfun.norm_truncate_version("minor").alias("minor"),
+            pl.col("version").mozfun.norm_extract_version("patch").alias("patch"),
+        )
+        .collect()
+    )
+
+    assert result["os"].to_list() == [
+        None if os is None else norm_normalize_os(os) for os in os_names
+    ]
+    assert result["minor"].to_list() == ["106.0", "5.1", None, "10", "0.0"]
+    assert result["patch"].to_list() == [
+        None if v is None else norm_extract_version(v, "patch") for v in versions
+    ]
+
+
+def test_map_expressions():
+    df = pl.DataFrame(
+        {
+            "json": ['{[{"key": "foo", "value": "42"}]}', None],
+            "entries": [
+                [
+                    {"key": "a", "value": 1},
+                    {"key": "b", "value": 2},
+                    {"key": "a", "value": 3},
+                ],
+                None,
+            ],
+        }
+    )
+
+    result = df.select(
+        pl.col("json").mozfun.map_get_key("foo"),
+        pl.col("entries").mozfun.map_sum(),
+    )
+
+    assert result["json"].to_list() == ["42", None]
+    assert result["entries"].to_list() == [
+        [{"key": "a", "value": 4.0}, {"key": "b", "value": 2.0}],
+        None,
+    ]
+
+
+def test_mode_last_expressions():
+    df = pl.DataFrame(
+        {
+            "ints": [[1, 1, 2, 2, 2, 1], [1, 1, 2, 2, 1, 2], [], None],
+            "strings": [["a", "b", "a"], ["a", None, "b"], [], None],
+        }
+    )
+
+    result = df.select(
+        pl.col("ints").mozfun.stats_mode_last(),
+        pl.col("strings").mozfun.json_mode_last(),
+    )
+
+    assert result["ints"].to_list() == [1, 2, None, None]
+    assert result["strings"].to_list() == ["a", "b", None, None]
+
+
+def test_glean_bytes_expressions():
+    timespans = [
+        {"time_unit": "millisecond", "value": 12345},
+        {"time_unit": "fortnight", "value": 1},
+    ]
+    df = pl.DataFrame(
+        {"timespan": timespans, "bytes": [b"\xff\xff", b"\x0f\xf0"]},
+    )
+
+    result = df.select(
+        pl.col("timespan").mozfun.glean_timespan_seconds(),
+        pl.col("bytes").mozfun.bytes_zero_right(4),
+    )
+
+    assert result["timespan"].to_list() == [
+        glean_timespan_seconds(t) for t in timespans
+    ]
+    assert result["bytes"].to_list() == [b"\xff\xf0", b"\x0f\xf0"]
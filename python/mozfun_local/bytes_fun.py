@@ -1,8 +1,19 @@
+from __future__ import annotations
+
 import sys
+from typing import TYPE_CHECKING
+
 from mozfun_local.mozfun_local_rust import (
     bytes_bit_pos_to_byte_pos as _bytes_bit_pos_to_byte_pos,
+    bytes_zero_right_fixed as _bytes_zero_right_fixed,
+    bytes_zero_right_offsets as _bytes_zero_right_offsets,
+    bytes_extract_bits_fixed as _bytes_extract_bits_fixed,
+    bytes_extract_bits_offsets as _bytes_extract_bits_offsets,
 )
-from numba import njit
+
+# numpy and pyarrow are only needed by the column functions
+if TYPE_CHECKING:
+    import numpy as np
 
 
 def bytes_bit_pos_to_byte_pos(bit_pos: int) -> int:
@@ -17,55 +28,187 @@ def bytes_bit_pos_to_byte_pos(bit_pos: int) -> int:
 
 
 def bytes_extract_bits(b: bytes, begin: int, length: int) -> bytes:
-    """PROVIDED WITHOUT WARRANTY
+    """Extract bits from a byte array. Roughly matches substr with three arguments:
+    b: bytes - The byte string we need to extract from
+    start: int - The position of the first bit we want to extract. Can be
+    negative to start from the end of the byte array. One-indexed, like substring.
+    length: int - The number of bits we want to extract
+
+    The return byte array will have CEIL(length/8) bytes, at most as many as b
+    has, wherever extraction starts. The bits of interest will start at the
+    beginning of the byte string. In other words, the byte array will have
+    trailing 0s for any non-relevant fields and for bits past the end of b.
+
+    Bytes are treated as big-endian, as BigQuery does, independent of the host
+    byte order.
+    """
+    result, _ = _bytes_extract_bits_fixed(b, len(b), begin, length)
+    return result
 
-    BQ ENDIANESS IS NOT REPLICABLE ON M1 Macs SO THIS FUNCTION DOES NOT
-    PRODUCE EQUIVALENT RESULTS TO BQ"""
-    b_len = len(b)
 
-    the_bits = int.from_bytes(b, sys.byteorder)
+def bytes_zero_right(b: bytes, length: int) -> bytes:
+    """Zero bits on the right of byte
 
-    result = _shift_and_zero_right(the_bits, b_len, begin, length)
+    Args:
+        b (bytes): the bytes
+        length (int): the start of where the bits will be zeroed
 
-    bit_results = result.to_bytes(8, sys.byteorder)
+    """
+    return _bytes_zero_right_fixed(b, len(b), max(length, 0))
 
-    clip_at = bytes_bit_pos_to_byte_pos(length)
 
-    return bit_results[:clip_at]
+def bytes_extract_bits_column(column, begin: int, length: int):
+    """bytes_extract_bits over a whole column, done in Rust on the contiguous
+    buffer backing the column rather than row by row. The buffer is read
+    where it is, through the buffer protocol, and the result is written into
+    a single new buffer.
 
+    Args:
+        column: an Arrow binary/large_binary/fixed_size_binary array, or a
+        NumPy array of fixed width bytes ("S"/"V" dtype, or 2-D uint8)
+        begin (int): position of the first bit to extract, see bytes_extract_bits
+        length (int): the number of bits to extract
 
-@njit
-def _shift_and_zero_right(b, len_b, begin, length):
+    Returns:
+        the same kind of column. NumPy input comes back as a 2-D uint8 array
+        of shape (rows, bytes), since "S" arrays drop trailing zero bytes.
+    """
+    if _is_numpy(column):
+        data, width = _numpy_buffer(column)
+        result, out_width = _bytes_extract_bits_fixed(data, width, begin, length)
+        return _numpy_result(result, len(column), out_width)
+
+    import pyarrow as pa
+
+    column = _combine_arrow_chunks(column)
+
+    if pa.types.is_fixed_size_binary(column.type):
+        validity, data = column.buffers()
+        width = column.type.byte_width
+        result, out_width = _bytes_extract_bits_fixed(
+            _arrow_fixed_data(column, data), width, begin, length
+        )
+        return pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(out_width),
+            len(column),
+            [validity, pa.py_buffer(result)],
+            column.null_count,
+            column.offset,
+        )
+
+    large = column.cast(pa.large_binary())
+    validity, offsets, data = large.buffers()
+    result, out_offsets = _bytes_extract_bits_offsets(
+        _view(data), _arrow_offsets(large, offsets), begin, length
+    )
+    return pa.LargeBinaryArray.from_buffers(
+        pa.large_binary(),
+        len(large),
+        [validity, pa.py_buffer(out_offsets), pa.py_buffer(result)],
+        large.null_count,
+        large.offset,
+    ).cast(column.type)
+
+
+def bytes_zero_right_column(column, length: int):
+    """bytes_zero_right over a whole column, done in Rust on the contiguous
+    buffer backing the column rather than row by row. The buffer is read
+    where it is, through the buffer protocol, and the result is written into
+    a single new buffer.
 
-    if begin >= 0:
-        shift_by = max([begin - 1, 0])
-    else:
-        shift_by = len_b * 8 + begin
+    Args:
+        column: an Arrow binary/large_binary/fixed_size_binary array, or a
+        NumPy array of fixed width bytes ("S"/"V" dtype, or 2-D uint8)
+        length (int): the number of bits on the right of each value to zero
 
-    the_bytes = b << shift_by
+    Returns:
+        the same kind of column. NumPy input comes back as a 2-D uint8 array
+        of shape (rows, bytes), since "S" arrays drop trailing zero bytes.
+    """
+    length = max(length, 0)
 
-    right_shift_by = max([8 * len_b - length, 0])
+    if _is_numpy(column):
+        data, width = _numpy_buffer(column)
+        result = _bytes_zero_right_fixed(data, width, length)
+        return _numpy_result(result, len(column), width)
 
-    shifted_right = _bytes_zero_right(the_bytes, right_shift_by)
+    import pyarrow as pa
 
-    return shifted_right
+    column = _combine_arrow_chunks(column)
 
+    if pa.types.is_fixed_size_binary(column.type):
+        validity, data = column.buffers()
+        result = _bytes_zero_right_fixed(
+            _arrow_fixed_data(column, data), column.type.byte_width, length
+        )
+        return pa.FixedSizeBinaryArray.from_buffers(
+            column.type,
+            len(column),
+            [validity, pa.py_buffer(result)],
+            column.null_count,
+            column.offset,
+        )
 
-def bytes_zero_right(b: bytes, length: int) -> bytes:
-    """Zero bits on the right of byte
+    large = column.cast(pa.large_binary())
+    validity, offsets, data = large.buffers()
+    result = _bytes_zero_right_offsets(
+        _view(data), _arrow_offsets(large, offsets), length
+    )
+    return pa.LargeBinaryArray.from_buffers(
+        pa.large_binary(),
+        len(large),
+        [validity, offsets, pa.py_buffer(result)],
+        large.null_count,
+        large.offset,
+    ).cast(column.type)
 
-    Args:
-        b (bytes): the bytes
-        length (int): the start of where the bits will be zeroed
 
-    """
-    u8_length = len(b)
-    give_me_the_bits = int.from_bytes(b, sys.byteorder)
-    result = _bytes_zero_right(give_me_the_bits, length)
-    return result.to_bytes(u8_length, sys.byteorder)
+def _is_numpy(column) -> bool:
+    # a column can only be an ndarray if numpy has already been imported
+    np = sys.modules.get("numpy")
+    return np is not None and isinstance(column, np.ndarray)
 
 
-@njit
-def _bytes_zero_right(the_bytes, length):
-    result = the_bytes >> length << length
-    return result
+def _numpy_buffer(column: np.ndarray):
+    import numpy as np
+
+    # uint8 views of the array, only copied if it is not contiguous
+    if column.ndim == 2 and column.dtype == np.uint8:
+        return np.ascontiguousarray(column).reshape(-1), column.shape[1]
+    if column.ndim == 1 and column.dtype.kind in "SV":
+        return np.ascontiguousarray(column).view(np.uint8), column.dtype.itemsize
+    raise TypeError(
+        f"expected 'S'/'V' bytes or a 2-D uint8 array, you provided {column.dtype}"
+    )
+
+
+def _numpy_result(result: bytes, rows: int, width: int) -> np.ndarray:
+    import numpy as np
+
+    return np.frombuffer(result, dtype=np.uint8).reshape(rows, width)
+
+
+def _combine_arrow_chunks(column):
+    if hasattr(column, "combine_chunks"):
+        return column.combine_chunks()
+    return column
+
+
+def _arrow_fixed_data(column, data) -> memoryview:
+    # validity is kept as is, so process every value up to the end of the slice
+    width = column.type.byte_width
+    return _view(data, (column.offset + len(column)) * width)
+
+
+def _arrow_offsets(column, offsets) -> memoryview:
+    return _view(offsets, (column.offset + len(column) + 1) * 8)
+
+
+def _view(buffer, size: int = None) -> memoryview:
+    """The first size bytes of an Arrow buffer, as unsigned bytes the Rust
+    kernels read without a copy. Arrow exports its buffers as signed."""
+    if buffer is None:
+        return memoryview(b"")
+    if size is not None:
+        buffer = buffer.slice(0, size)
+    return memoryview(buffer).cast("B")
@@ -1,10 +1,32 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import datetime
+import json
+import logging
 import os
 from pathlib import Path
+import time
+from typing import TYPE_CHECKING, Any, Optional
 
-from google.cloud import bigquery
+from mozfun_local.glam_cache import QueryCache, default_cache, is_immutable_date
 from mozfun_local.mozfun_local_rust import glam_style_histogram as _glam_style_histogram
-import numpy as np
-import polars as pl
+from mozfun_local.mozfun_local_rust import HyperLogLog
+from mozfun_local.mozfun_local_rust import (
+    glam_bootstrap_percentiles as _glam_bootstrap_percentiles,
+    glam_client_sketches as _glam_client_sketches,
+    glam_style_histogram_profiled as _glam_style_histogram_profiled,
+    glam_style_histogram_sampled as _glam_style_histogram_sampled,
+    glam_style_histogram_slices as _glam_style_histogram_slices,
+)
+
+# bigquery, numpy and polars are imported where they are used, so importing
+# this module stays fast for short-lived workers
+if TYPE_CHECKING:
+    import polars as pl
+
+logger = logging.getLogger(__name__)
 
 
 class metadata:
@@ -29,10 +51,65 @@ class metadata:
         return metadata
 
 
-# This is global & instantiated on import to avoid re-reads. This is the worst
-# solution, except for all of the others (passing around a big metadata class,
-# making it explicit, etc.
-_metadata = metadata()
+# This is global & instantiated on first use to avoid re-reads. This is the
+# worst solution, except for all of the others (passing around a big metadata
+# class, making it explicit, etc.
+_metadata = None
+
+
+@dataclass
+class GlamOptions:
+    """How the GLAM functions fetch and aggregate a probe. Every field has a
+    default, and one instance can be shared by all the calls of a trend or a
+    backfill, e.g. GlamOptions(aggregate_in_query=True, client=client).
+
+    Fields:
+    aggregate_in_query -- bool, sum bucket counts per (client_id, build_id) in
+                          BigQuery so one row per client is downloaded instead
+                          of one per ping. limit then applies to client rows,
+                          and keyed histograms are summed across keys (default False)
+    histogram_format -- "json" to download histograms as JSON strings, or
+                        "struct" to have the query shape them as
+                        ARRAY<STRUCT<key INT64, value INT64>>, which is
+                        aggregated without any text parsing (default "json")
+    use_cache -- bool, set to False to bypass the local query cache (default True)
+    cache -- QueryCache to use instead of the default one in ~/.cache/mozfun_local
+    client -- bigquery.Client (or anything with the same query method) to
+              run the queries with (default a new client for the table's project)
+    memory_budget -- int of bytes of per client histograms to hold in memory.
+                     Past it they are spilled to local disk, and read back
+                     one partition of clients at a time, for days with more
+                     clients than fit in memory (default None/no limit)
+    spill_dir -- directory for the spill files (default the system temp dir)
+    sort_in_query -- bool, have BigQuery order the rows by build and client,
+                     so they are aggregated as runs of rows without any
+                     partitioning and with one client's histogram in memory
+                     at a time. Sorted results are detected without it, this
+                     makes the query sort them (default False)
+    deduplicate -- bool, count each document_id once, so pings retried by
+                   the client are not aggregated twice. The number of pings
+                   dropped is logged at INFO level to mozfun_local.glam. Not
+                   available with aggregate_in_query, which sums pings before
+                   they reach Python, nor in glam_client_counts (default False)
+    dedup_memory_budget -- int of bytes of document ids to hold exactly.
+                           Past it they go into a Bloom filter, which can
+                           drop about one in a million unique pings
+                           (default 256MB)
+
+    memory_budget and spill_dir apply to glam_style_histogram, its _dates
+    and _sampled variants, the other fields to every GLAM function.
+    """
+
+    aggregate_in_query: bool = False
+    histogram_format: str = "json"
+    use_cache: bool = True
+    cache: Optional[QueryCache] = None
+    client: Any = None
+    memory_budget: Optional[int] = None
+    spill_dir: Optional[str] = None
+    sort_in_query: bool = False
+    deduplicate: bool = False
+    dedup_memory_budget: Optional[int] = None
 
 
 def glam_style_histogram(
@@ -41,50 +118,783 @@ def glam_style_histogram(
     date: str,
     limit: int = None,
     table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+    stats: dict = None,
 ) -> list:
     """Calculate the GLAM style histogram transformation to a given histogram
     metric. The result is a list of sorted key-value pairs of bucket and the
     dirichlet distribution estimator at that bucket (non-cumulative). From this,
     percentiles can be calculated using the calculate_percentiles function.
 
+    Query results for complete (past) dates are cached on disk, so re-running
+    the same probe and date does not go back to BigQuery.
+
     Keyword Arguments:
     probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
     keyed -- bool if the histogram is keyed
     date -- string of date you wish to calculate the transformation for (date is a partition key)
     limit -- int of the number of rows from the ping to take (default None/no limit)
     table -- full path to the table you wish to take probes from (default mozdata.telemetry.main_1pct)
+    options -- GlamOptions, how the probe is fetched and aggregated
+               (default GlamOptions())
+    stats -- dict to fill in with where the time and memory went
+        query_seconds -- BigQuery (or cache read) time
+        to_polars_seconds -- Arrow to polars conversion
+        partition_seconds, parse_seconds, client_aggregation_seconds,
+        build_aggregation_seconds, dirichlet_seconds -- Rust stages
+        to_python_seconds -- converting the result back to Python objects
+        total_seconds -- the whole call
+        rows, clients, builds, arrow_bytes, bytes_parsed, spilled_bytes -- sizes
+        duplicate_rows, approximate_duplicate_rows, dedup_seconds -- pings
+        dropped with deduplicate, and of those the ones the Bloom filter
+        dropped
+        commit_delta_bytes, peak_commit_bytes, peak_rss_bytes -- mimalloc's
+        view of the process memory
+        These are also logged at DEBUG level to mozfun_local.glam.
+        (default None, nothing is measured)
+
+    Returns:
+    list of (build_id, histogram)
+    """
+    options = options or GlamOptions()
+    metadata = get_metadata(probe)
+
+    return _glam_for_date(
+        probe,
+        keyed,
+        date,
+        limit,
+        table,
+        _query_options(options),
+        options,
+        metadata,
+        stats,
+    )
+
+
+def glam_style_histogram_dates(
+    probe: str,
+    keyed: bool,
+    dates: list,
+    limit: int = None,
+    table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+    max_workers: int = 4,
+    stats: dict = None,
+) -> dict:
+    """glam_style_histogram for several dates at once, e.g. to build a trend.
+
+    Up to max_workers dates are fetched concurrently, and each date is
+    aggregated as soon as its result arrives while the other dates are still
+    loading (the Rust aggregation does not hold the GIL).
+
+    Keyword Arguments:
+    probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
+    keyed -- bool if the histogram is keyed
+    dates -- list of date strings, see date_range to build one
+    limit -- int of the number of rows per date to take (default None/no limit)
+    table -- full path to the table you wish to take probes from (default mozdata.telemetry.main_1pct)
+    options -- GlamOptions shared by all dates, see glam_style_histogram
+    max_workers -- int of the number of dates in flight at once (default 4)
+    stats -- dict to fill in with the stats of every date, by date, see
+             glam_style_histogram (default None, nothing is measured)
+
+    Returns:
+    dict of date to the glam_style_histogram result for that date, in the
+    order the dates were given
+    """
+    options = options or GlamOptions()
+    metadata = get_metadata(probe)
+    query_options = _query_options(options)
+
+    def histogram_for_date(date):
+        date_stats = None if stats is None else stats.setdefault(date, {})
+        return _glam_for_date(
+            probe,
+            keyed,
+            date,
+            limit,
+            table,
+            query_options,
+            options,
+            metadata,
+            date_stats,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(histogram_for_date, dates)
+
+        return dict(zip(dates, results))
+
+
+def glam_style_histogram_sampled(
+    probe: str,
+    keyed: bool,
+    date: str,
+    sample_rate: float = 0.01,
+    percentiles: list = (0.05, 0.25, 0.5, 0.75, 0.95),
+    z: float = 1.96,
+    limit: int = None,
+    table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+) -> dict:
+    """Approximate glam_style_histogram from a deterministic sample of
+    clients, for when latency matters more than the last bit of accuracy.
+
+    Clients are kept when a hash of their client_id falls under sample_rate,
+    so the same clients are picked for every date and probe. n_reporting is
+    scaled back up to the whole table, and every bucket and percentile comes
+    with an error estimate to pick a sample rate against.
+
+    Keyword Arguments:
+    probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
+    keyed -- bool if the histogram is keyed
+    date -- string of date you wish to calculate the transformation for
+    sample_rate -- float in (0, 1], fraction of clients to aggregate, in steps
+                   of 1/10000 (default 0.01)
+    percentiles -- percentiles to estimate, with intervals (default 5/25/50/75/95)
+    z -- float, width of the percentile intervals in standard errors
+         (default 1.96, a 95% interval)
+    limit, table, options -- see glam_style_histogram
+
+    Returns:
+    dict of build_id to a dict with
+        n_reporting -- estimated number of clients reporting in the table
+        sampled_clients -- number of clients actually aggregated
+        histogram -- list of (bucket, value, standard error) sorted by bucket
+        percentiles -- dict of percentile to (bucket, low bucket, high bucket)
+    """
+    assert 0 < sample_rate <= 1, "sample_rate must be in (0, 1]"
+    options = options or GlamOptions()
+    metadata = get_metadata(probe)
+
+    builds = _glam_for_date(
+        probe,
+        keyed,
+        date,
+        limit,
+        table,
+        _query_options(options, sample_rate=sample_rate),
+        options,
+        metadata,
+    )
+
+    return {
+        build_id: _sampled_result(n_reporting, histogram, percentiles, z, sample_rate)
+        for build_id, n_reporting, histogram in builds
+    }
+
+
+def _sampled_result(
+    n_reporting: float, histogram: list, percentiles, z: float, sample_rate: float
+) -> dict:
+    """Percentile intervals use the distribution free order statistic
+    bound: percentile p is bracketed by the percentiles p -/+ z * sqrt(p(1-p)/n)
+    over the n sampled clients."""
+    import numpy as np
+
+    sampled_clients = round(n_reporting * _effective_sample_rate(sample_rate))
+    buckets = [bucket for bucket, _, _ in histogram]
+    cdf = np.cumsum([value for _, value, _ in histogram])
+
+    intervals = {}
+    for p in percentiles:
+        half_width = (
+            z
+            * np.sqrt(p * (1 - p) / max(sampled_clients, 1))
+            * np.sqrt(1 - _effective_sample_rate(sample_rate))
+        )
+        low, estimate, high = (
+            max(p - half_width, 0.0),
+            p,
+            min(p + half_width, 1.0),
+        )
+        cutoffs = _find_cutoffs(buckets, cdf, [low, estimate, high])
+        intervals[p] = (cutoffs[estimate], cutoffs[low], cutoffs[high])
+
+    return dict(
+        n_reporting=n_reporting,
+        sampled_clients=sampled_clients,
+        histogram=histogram,
+        percentiles=intervals,
+    )
+
+
+def _effective_sample_rate(sample_rate: float) -> float:
+    """The rate the query actually samples at, client hashes are bucketed
+    into 10000 slots"""
+    return max(round(sample_rate * 10_000), 1) / 10_000
+
+
+def glam_bootstrap_percentiles(
+    probe: str,
+    keyed: bool,
+    date: str,
+    percentiles: list = (0.05, 0.25, 0.5, 0.75, 0.95),
+    n_replicates: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+    limit: int = None,
+    table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+) -> dict:
+    """glam_style_histogram with bootstrap confidence intervals for its
+    percentiles. Clients are resampled with Poisson(1) weights in Rust, with
+    the replicates spread over all cores, so the histograms are only fetched
+    and parsed once.
+
+    Keyword Arguments:
+    probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
+    keyed -- bool if the histogram is keyed
+    date -- string of date you wish to calculate the transformation for
+    percentiles -- list of floating point values [0.0, 1.0] of the percentiles
+                   you wish to calculate (default 5/25/50/75/95)
+    n_replicates -- int of bootstrap replicates (default 1000)
+    confidence -- float, coverage of the intervals (default 0.95)
+    seed -- int, replicates are reproducible for a given seed (default 0)
+    limit, table, options -- see glam_style_histogram
+
+    Returns:
+    dict of build_id to a dict with
+        histogram -- the glam_style_histogram result for the build
+        percentiles -- dict of percentile to (bucket, low bucket, high bucket)
+    """
+    assert 0 < confidence < 1, "confidence must be in (0, 1)"
+    options = options or GlamOptions()
+    metadata = get_metadata(probe)
+    query_options = _query_options(options)
+
+    df = _histograms_for_date(probe, keyed, date, limit, table, query_options, options)
+    builds, stats = _glam_bootstrap_percentiles(
+        df,
+        metadata,
+        [float(p) for p in percentiles],
+        n_replicates,
+        confidence,
+        seed,
+        json.dumps(_glam_options(query_options, options)),
+    )
+    _log_duplicates(probe, date, json.loads(stats))
+
+    return {
+        build_id: dict(
+            histogram=histogram,
+            percentiles={p: (estimate, low, high) for p, estimate, low, high in cis},
+        )
+        for build_id, histogram, cis in builds
+    }
+
+
+def glam_style_histogram_slices(
+    probe: str,
+    keyed: bool,
+    date: str,
+    group_by: list = ("build_id", "os", "channel"),
+    rollups: bool = False,
+    limit: int = None,
+    table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+) -> dict:
+    """glam_style_histogram sliced by several dimensions at once, the way
+    GLAM shows a probe per os, channel and process. The histograms are
+    fetched and parsed once for all the slices, instead of once per slice.
+
+    Keyword Arguments:
+    probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
+    keyed -- bool if the histogram is keyed
+    date -- string of date you wish to calculate the transformation for
+    group_by -- dimensions to slice by, any of build_id, os, channel and
+                process. os is normalized as in norm_normalize_os, and
+                process reads the histogram of the parent, content and gpu
+                processes (limit then applies per process)
+                (default build_id, os and channel)
+    rollups -- bool, also aggregate over every subset of group_by, the
+               rolled up dimensions being "*" in the key. A client is counted
+               once in a rollup however many of its slices it reports in
+               (default False)
+    limit, table, options -- see glam_style_histogram
+
+    Returns:
+    dict of the slice key, a tuple of its group_by values, to a dict with
+        n_reporting -- number of clients reporting in the slice
+        histogram -- the glam_style_histogram result for the slice
+    """
+    options = options or GlamOptions()
+    metadata = get_metadata(probe)
+    query_options = _query_options(options, group_by=tuple(group_by))
+
+    df = _histograms_for_date(probe, keyed, date, limit, table, query_options, options)
+    glam_options = _glam_options(query_options, options)
+    glam_options.update(group_by=list(group_by), rollups=rollups)
+    slices, stats = _glam_style_histogram_slices(df, metadata, json.dumps(glam_options))
+    _log_duplicates(probe, date, json.loads(stats))
+
+    return {
+        tuple(key): dict(n_reporting=n_reporting, histogram=histogram)
+        for key, n_reporting, histogram in slices
+    }
+
+
+def glam_client_counts(
+    probe: str,
+    keyed: bool,
+    date: str,
+    precision: int = 12,
+    limit: int = None,
+    table: str = "mozdata.telemetry.main_1pct",
+    options: GlamOptions = None,
+) -> dict:
+    """HyperLogLog sketches of the distinct clients reporting a probe, per
+    build and per bucket. Unlike n_reporting from glam_style_histogram these
+    combine across dates with merge_client_counts, so the reporting counts of
+    a 7 or 28 day window come from the daily results rather than from every
+    ping of the window. Sketches pickle, or go to bytes with to_bytes() and
+    back with HyperLogLog.from_bytes(), to be stored or sent between workers.
+
+    Keyword Arguments:
+    probe -- string of the probe you wish to calculate (e.g. wr_renderer_time)
+    keyed -- bool if the histogram is keyed
+    date -- string of date you wish to count clients for
+    precision -- int in [4, 18], a sketch takes 2^precision bytes and its
+                 relative standard error is about 1.04 / sqrt(2^precision),
+                 1.6% at the default 12. Only sketches of the same precision
+                 can be merged (default 12)
+    limit, table, options -- see glam_style_histogram
+
+    Returns:
+    dict of build_id to a dict with
+        clients -- HyperLogLog of the clients of the build
+        buckets -- dict of bucket to HyperLogLog of the clients with a non
+                   zero count in that bucket
+    call estimate() (or len()) on a sketch for the approximate count.
     """
+    options = options or GlamOptions()
+    assert not options.deduplicate, "glam_client_counts does not deduplicate pings"
+    metadata = get_metadata(probe)
+    query_options = _query_options(options)
+
+    df = _histograms_for_date(probe, keyed, date, limit, table, query_options, options)
+    builds = _glam_client_sketches(df, metadata, precision)
+
+    return {
+        build_id: dict(clients=clients, buckets=dict(buckets))
+        for build_id, clients, buckets in builds
+    }
+
+
+def merge_client_counts(*client_counts: dict) -> dict:
+    """Combines glam_client_counts results, e.g. of every date of a window
+    or of several workers, into the counts of their union. The inputs are
+    left untouched.
+
+        window = date_range("2023-01-01", "2023-01-07")
+        weekly = merge_client_counts(
+            *(glam_client_counts("gc_ms", False, date) for date in window)
+        )
+        weekly[build_id]["clients"].estimate()
+    """
+    merged = {}
+    for counts in client_counts:
+        for build_id, sketches in counts.items():
+            if build_id not in merged:
+                merged[build_id] = dict(clients=sketches["clients"].copy(), buckets={})
+            else:
+                merged[build_id]["clients"].merge(sketches["clients"])
+
+            buckets = merged[build_id]["buckets"]
+            for bucket, sketch in sketches["buckets"].items():
+                if bucket in buckets:
+                    buckets[bucket].merge(sketch)
+                else:
+                    buckets[bucket] = sketch.copy()
+
+    return merged
+
+
+def date_range(start_date: str, end_date: str) -> list:
+    """Every date from start_date to end_date (inclusive) as YYYY-MM-DD strings"""
+    start = datetime.date.fromisoformat(start_date)
+    end = datetime.date.fromisoformat(end_date)
+
+    return [
+        (start + datetime.timedelta(days=i)).isoformat()
+        for i in range((end - start).days + 1)
+    ]
+
+
+def _glam_for_date(
+    probe: str,
+    keyed: bool,
+    date: str,
+    limit: int,
+    table: str,
+    query_options: dict,
+    options: GlamOptions,
+    metadata: str,
+    stats: dict = None,
+) -> list:
+    start = time.perf_counter()
+    timings = {}
+    df = _histograms_for_date(
+        probe, keyed, date, limit, table, query_options, options, timings
+    )
+    glam_options = json.dumps(_glam_options(query_options, options))
+
+    if query_options["sample_rate"] is not None:
+        result, rust_stats = _glam_style_histogram_sampled(df, metadata, glam_options)
+        _log_duplicates(probe, date, json.loads(rust_stats))
+        return result
+
+    # without deduplicate there is nothing to report unless asked to
+    if stats is None and not options.deduplicate:
+        return _glam_style_histogram(df, metadata, glam_options)
+
+    rust_start = time.perf_counter()
+    result, rust_stats = _glam_style_histogram_profiled(df, metadata, glam_options)
+    rust_seconds = time.perf_counter() - rust_start
+
+    stats = {} if stats is None else stats
+    stats.update(json.loads(rust_stats))
+    stats.update(timings)
+    stats["to_python_seconds"] = max(rust_seconds - stats["total_seconds"], 0.0)
+    stats["total_seconds"] = time.perf_counter() - start
+    logger.debug("glam_style_histogram %s %s: %s", probe, date, stats)
+    _log_duplicates(probe, date, stats)
+
+    return result
+
+
+def _log_duplicates(probe: str, date: str, stats: dict):
+    if stats["duplicate_rows"]:
+        logger.info(
+            "glam %s %s: dropped %d duplicate pings, %d of them by the Bloom filter",
+            probe,
+            date,
+            stats["duplicate_rows"],
+            stats["approximate_duplicate_rows"],
+        )
+
+
+def _histograms_for_date(
+    probe: str,
+    keyed: bool,
+    date: str,
+    limit: int,
+    table: str,
+    query_options: dict,
+    options: GlamOptions,
+    timings: dict = None,
+) -> pl.DataFrame:
+    timings = {} if timings is None else timings
+    sql_query = _histogram_query(probe, keyed, date, limit, table, **query_options)
+
+    start = time.perf_counter()
+    dataset = _fetch_histograms(
+        sql_query,
+        dict(table=table, probe=probe, date=date, limit=limit, keyed=keyed),
+        options.use_cache,
+        options.cache,
+        options.client,
+    )
+    fetched = time.perf_counter()
+    import polars as pl
+
+    df = pl.from_arrow(dataset)
+
+    timings["query_seconds"] = fetched - start
+    timings["to_polars_seconds"] = time.perf_counter() - fetched
+    timings["arrow_bytes"] = dataset.nbytes
+
+    return df
+
+
+def _query_options(options: GlamOptions, sample_rate: float = None, **extra) -> dict:
+    """The arguments of _histogram_query that come from the options"""
+    return dict(
+        aggregate_in_query=options.aggregate_in_query,
+        histogram_format=options.histogram_format,
+        sample_rate=sample_rate,
+        sort_in_query=options.sort_in_query,
+        deduplicate=options.deduplicate,
+        **extra,
+    )
+
+
+def _glam_options(query_options: dict, options: GlamOptions) -> dict:
+    """GlamOptions for the Rust aggregation, matching how the query shaped
+    the rows"""
+    glam_options = {"client_aggregated": query_options["aggregate_in_query"]}
+
+    if query_options["deduplicate"]:
+        glam_options["dedup_column"] = "document_id"
+
+    if query_options["sample_rate"] is not None:
+        glam_options["sample_rate"] = _effective_sample_rate(
+            query_options["sample_rate"]
+        )
+
+    for key in ("memory_budget", "spill_dir", "dedup_memory_budget"):
+        if getattr(options, key) is not None:
+            glam_options[key] = getattr(options, key)
+
+    return glam_options
+
+
+_HISTOGRAM_FORMATS = ["json", "struct"]
+
+# Columns glam_style_histogram_slices can group by, on top of build_id which
+# every query selects
+_DIMENSIONS = {
+    "os": "environment.system.os.name",
+    "channel": "normalized_channel",
+}
+
+# Where each process keeps its histograms, process is a dimension too
+_PROCESSES = {
+    "parent": "payload",
+    "content": "payload.processes.content",
+    "gpu": "payload.processes.gpu",
+}
+
+
+def _histogram_query(
+    probe: str,
+    keyed: bool,
+    date: str,
+    limit: int,
+    table: str,
+    aggregate_in_query: bool = False,
+    histogram_format: str = "json",
+    sample_rate: float = None,
+    group_by: tuple = None,
+    sort_in_query: bool = False,
+    deduplicate: bool = False,
+) -> str:
+    assert (
+        histogram_format in _HISTOGRAM_FORMATS
+    ), f"{histogram_format} is not one of {_HISTOGRAM_FORMATS}"
+    group_by = group_by or ()
+    unknown = set(group_by) - {"build_id", "process", *_DIMENSIONS}
+    assert not unknown, f"cannot group by {sorted(unknown)}"
+    assert not (
+        sort_in_query and "process" in group_by
+    ), "sort_in_query orders a single query, not the union over processes"
+    assert not (
+        deduplicate and aggregate_in_query
+    ), "pings summed in the query cannot be deduplicated"
+    assert not (
+        deduplicate and "process" in group_by
+    ), "a ping has a row per process, they share its document_id"
+
+    if "process" not in group_by:
+        return _process_query(
+            probe,
+            keyed,
+            date,
+            limit,
+            table,
+            aggregate_in_query,
+            histogram_format,
+            sample_rate,
+            group_by,
+            "parent",
+            sort_in_query,
+            deduplicate,
+        )
+
+    # one branch per process, so every slice comes out of a single query
+    return "\nUNION ALL\n".join(
+        "(\n"
+        + _process_query(
+            probe,
+            keyed,
+            date,
+            limit,
+            table,
+            aggregate_in_query,
+            histogram_format,
+            sample_rate,
+            group_by,
+            process,
+        )
+        + "\n)"
+        for process in _PROCESSES
+    )
+
+
+def _process_query(
+    probe: str,
+    keyed: bool,
+    date: str,
+    limit: int,
+    table: str,
+    aggregate_in_query: bool,
+    histogram_format: str,
+    sample_rate: float,
+    group_by: tuple,
+    process: str,
+    sort_in_query: bool = False,
+    deduplicate: bool = False,
+) -> str:
     _limit = f"LIMIT {limit}" if limit else ""
+    if sort_in_query:
+        # rows then come grouped by build and client, which the Rust
+        # aggregation reads off as runs instead of partitioning
+        build_id = "build_id" if aggregate_in_query else "application.build_id"
+        _limit = f"ORDER BY {build_id}, client_id {_limit}".rstrip()
     probe_location = (
-        f"payload.histograms.{probe}"
+        f"{_PROCESSES[process]}.histograms.{probe}"
         if not keyed
-        else f"payload.keyed_histograms.{probe}"
+        else f"{_PROCESSES[process]}.keyed_histograms.{probe}"
     )
+    dimensions = [d for d in group_by if d in _DIMENSIONS]
+    process_column = f"'{process}' AS process" if "process" in group_by else None
+
+    _sample = (
+        "AND MOD(ABS(FARM_FINGERPRINT(client_id)), 10000) < "
+        f"{round(_effective_sample_rate(sample_rate) * 10_000)}"
+        if sample_rate is not None
+        else ""
+    )
+
+    if aggregate_in_query:
+        return _client_aggregated_query(
+            probe,
+            keyed,
+            probe_location,
+            date,
+            _limit,
+            _sample,
+            table,
+            histogram_format,
+            dimensions,
+            process_column,
+        )
+
+    histogram = probe_location
+    if histogram_format == "struct":
+        histogram = (
+            f"""ARRAY(
+         SELECT AS STRUCT bucket.key, SUM(bucket.value) AS value
+         FROM UNNEST({probe_location}) AS keyed_probe,
+           UNNEST(mozfun.hist.extract(keyed_probe.value).values) AS bucket
+         GROUP BY bucket.key
+       ) AS {probe}"""
+            if keyed
+            else f"mozfun.hist.extract({probe_location}).values AS {probe}"
+        )
+    columns = [f"{_DIMENSIONS[d]} AS {d}" for d in dimensions]
+    if process_column:
+        columns.append(process_column)
+    if deduplicate:
+        columns.insert(0, "document_id")
+    _columns = "".join(f"{column},\n       " for column in columns)
+
     sql_query = f"""SELECT 
        client_id,
        application.build_id,
-       {probe_location},
+       {_columns}{histogram},
 FROM {table}
 WHERE date(submission_timestamp) = '{date}'
   AND date(submission_timestamp) > date(2022, 12, 20)
   AND {probe_location} IS NOT NULL
+  {_sample}
   {_limit}"""
 
-    metadata = get_metadata(probe)
+    return sql_query
 
-    project = table.split(".")[0]
-    bq_client = bigquery.Client(project=project)
 
-    dataset = bq_client.query(sql_query).result()
-    df = pl.from_arrow(dataset.to_arrow())
+def _client_aggregated_query(
+    probe: str,
+    keyed: bool,
+    probe_location: str,
+    date: str,
+    _limit: str,
+    _sample: str,
+    table: str,
+    histogram_format: str,
+    dimensions: list = (),
+    process_column: str = None,
+) -> str:
+    """Sums bucket counts per (client_id, build_id, bucket) in BigQuery and
+    returns one histogram per client and build, and per value of the extra
+    dimensions"""
+    histograms = (
+        f"UNNEST({probe_location}) AS keyed_probe,\n"
+        "    UNNEST(mozfun.hist.extract(keyed_probe.value).values) AS bucket"
+        if keyed
+        else f"UNNEST(mozfun.hist.extract({probe_location}).values) AS bucket"
+    )
+    client_histogram = (
+        "ARRAY_AGG(STRUCT(key, value))"
+        if histogram_format == "struct"
+        else "CONCAT('{\"values\": {', STRING_AGG(FORMAT('\"%d\": %d', key, value), ', '), '}}')"
+    )
+    _columns = "".join(f"{_DIMENSIONS[d]} AS {d},\n    " for d in dimensions)
+    _keys = "".join(f"{d}, " for d in dimensions)
+    outer_columns = [*dimensions, process_column] if process_column else dimensions
+    _outer = "".join(f"{column},\n  " for column in outer_columns)
+    _outer_keys = "".join(f", {d}" for d in dimensions)
+    sql_query = f"""WITH buckets AS (
+  SELECT
+    client_id,
+    application.build_id AS build_id,
+    {_columns}bucket.key AS key,
+    SUM(bucket.value) AS value,
+  FROM {table},
+    {histograms}
+  WHERE date(submission_timestamp) = '{date}'
+    AND date(submission_timestamp) > date(2022, 12, 20)
+    AND {probe_location} IS NOT NULL
+    {_sample}
+  GROUP BY client_id, build_id, {_keys}key
+)
+SELECT
+  client_id,
+  build_id,
+  {_outer}{client_histogram} AS {probe},
+FROM buckets
+GROUP BY client_id, build_id{_outer_keys}
+{_limit}"""
 
-    results = _glam_style_histogram(df, metadata)
+    return sql_query
 
-    return results
+
+def _fetch_histograms(
+    sql_query: str,
+    query_params: dict,
+    use_cache: bool = True,
+    cache: QueryCache = None,
+    client=None,
+):
+    """Runs the query, or reads its result back from the local cache. Only
+    complete dates are cached, today's partition is still being written."""
+    use_cache = use_cache and is_immutable_date(query_params["date"])
+    if use_cache:
+        cache = cache or default_cache()
+        key = cache.key(sql=sql_query, **query_params)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if client is None:
+        from google.cloud import bigquery
+
+        project = query_params["table"].split(".")[0]
+        client = bigquery.Client(project=project)
+
+    dataset = client.query(sql_query).result().to_arrow()
+
+    if use_cache:
+        cache.put(key, dataset)
+
+    return dataset
 
 
 def get_metadata(probe: str) -> str:
     global _metadata
+    if _metadata is None:
+        _metadata = metadata()
     return _metadata.metadata[probe]
 
 
@@ -98,14 +908,14 @@ def _lists_from_tuples(tuples):
 
 def _find_cutoffs(buckets, cdf, percentiles):
     assert len(percentiles) > 0, "Must provide at least one percentile to calculate"
-    percentiles = sorted(percentiles) # we only need to go through once
-                                      # if values are sorted
-    
+    percentiles = sorted(percentiles)  # we only need to go through once
+    # if values are sorted
+
     results = {}
     max_iter = len(cdf)
     i = 0
     for p in percentiles:
-        while i < max_iter and cdf[i] < p: 
+        while i < max_iter and cdf[i] < p:
             i += 1
         if i < max_iter:
             results[p] = buckets[i]
@@ -117,7 +927,7 @@ def _find_cutoffs(buckets, cdf, percentiles):
 
 def calculate_percentiles(distribution: list, percentiles: list) -> dict:
     """Given a list of percentiles and a distribution, find the buckets that
-    represent each percentile. Internal functions are numba jitted python.
+    represent each percentile.
 
     Keyword Arguments:
     distribution -- list of key-value pairs, these are already sorted in
@@ -125,6 +935,8 @@ def calculate_percentiles(distribution: list, percentiles: list) -> dict:
     percentiles -- list of floating point values [0.0, 1.0] of the percentiles
                    you wish to calculate
     """
+    import numpy as np
+
     if type(percentiles) != np.ndarray:
         percentiles = np.array(percentiles)
 
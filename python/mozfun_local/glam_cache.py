@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+# pyarrow is only imported once the cache is read or written
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+_DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "mozfun_local")
+_DEFAULT_MAX_BYTES = 5 * 1024**3
+
+
+class QueryCache:
+    """Content-addressed local cache of query results.
+
+    Results are stored as zstd compressed Arrow IPC files named by the hash of
+    the query parameters. Every buffer is decompressed on read anyway, so they
+    are read as plain files rather than memory mapped. Once the cache grows
+    past max_bytes the least recently used results are evicted.
+
+    Keyword Arguments:
+    directory -- where results are stored (default $MOZFUN_LOCAL_CACHE_DIR or
+                 ~/.cache/mozfun_local)
+    max_bytes -- size the cache is trimmed to after every write (default
+                 $MOZFUN_LOCAL_CACHE_MAX_BYTES or 5GiB)
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None) -> None:
+        self.directory = Path(
+            directory or os.environ.get("MOZFUN_LOCAL_CACHE_DIR", _DEFAULT_DIRECTORY)
+        )
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(os.environ.get("MOZFUN_LOCAL_CACHE_MAX_BYTES", _DEFAULT_MAX_BYTES))
+        )
+
+    @staticmethod
+    def key(**params) -> str:
+        """Hash of the parameters that fully determine a query result"""
+        serialized = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.arrow"
+
+    def get(self, key: str) -> Optional[pa.Table]:
+        import pyarrow as pa
+        import pyarrow.ipc
+
+        path = self._path(key)
+        try:
+            with pa.OSFile(str(path), "rb") as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            return None
+        except (pa.ArrowInvalid, OSError):
+            # truncated or unreadable, e.g. a full disk or another pyarrow
+            # version: drop it so the query runs again
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+        try:
+            # bump the modification time, it doubles as the last access time
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since it was read
+            pass
+
+        return table
+
+    def put(self, key: str, table: pa.Table) -> None:
+        import pyarrow as pa
+        import pyarrow.ipc
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        partial = path.with_suffix(f".{os.getpid()}.partial")
+
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        try:
+            with pa.OSFile(str(partial), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        # readers only ever see complete files
+        os.replace(partial, path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used results until the cache fits max_bytes"""
+        entries = []
+        for path in self.directory.glob("*.arrow"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.arrow"):
+            path.unlink(missing_ok=True)
+
+
+def is_immutable_date(date: str) -> bool:
+    """Partitions before today (UTC) are complete and safe to cache"""
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    return datetime.date.fromisoformat(str(date)) < today
+
+
+_default_cache = None
+
+
+def default_cache() -> QueryCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = QueryCache()
+    return _default_cache
@@ -1,11 +1,53 @@
-from typing import Optional, Dict, List
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Dict, List
 import ast
 import json
 
+from mozfun_local.mozfun_local_rust import ExperimentIndex
 from mozfun_local.mozfun_local_rust import (
     glean_legacy_compatible_experiments as _glean_legacy_compatible_experiments,
 )
 
+# numpy and polars are only needed by the column functions
+if TYPE_CHECKING:
+    import numpy as np
+    import polars as pl
+
+# nanoseconds in each Glean time unit, see
+# https://mozilla.github.io/glean/book/reference/metrics/timespan.html
+_NANOS_PER_UNIT = {
+    "nanosecond": 1,
+    "microsecond": 1000,
+    "millisecond": 1000 * 1000,
+    "second": 1000 * 1000 * 1000,
+    "minute": 1000 * 1000 * 1000 * 60,
+    "hour": 1000 * 1000 * 1000 * 60 * 60,
+    "day": 1000 * 1000 * 1000 * 60 * 60 * 24,
+}
+
+# (multiplier, divisor) that takes each unit to seconds, kept apart so
+# conversions never leave integer arithmetic
+_SECONDS_PER_UNIT = {
+    unit: (nanos // 10**9, 1) if nanos >= 10**9 else (1, 10**9 // nanos)
+    for unit, nanos in _NANOS_PER_UNIT.items()
+}
+
+
+@lru_cache(maxsize=None)
+def _unit_lookups():
+    """Sorted lookup tables for the column functions, unknown units are
+    masked out: (units, nanos, seconds multiplier, seconds divisor)"""
+    import numpy as np
+
+    units = np.array(sorted(_NANOS_PER_UNIT))
+    nanos = np.array([_NANOS_PER_UNIT[u] for u in units], dtype=np.int64)
+    multipliers = np.array([_SECONDS_PER_UNIT[u][0] for u in units], dtype=np.int64)
+    divisors = np.array([_SECONDS_PER_UNIT[u][1] for u in units], dtype=np.int64)
+
+    return units, nanos, multipliers, divisors
+
 
 def glean_timespan_nanos(
     timespan: Dict[str, int],
@@ -30,21 +72,9 @@ def glean_timespan_nanos(
 
     unit_of_time = timespan[key_key]
 
-    if unit_of_time == "nanosecond":
-        return int(timespan[value_key])
-    if unit_of_time == "microsecond":
-        return int(timespan[value_key] * 1000)
-    if unit_of_time == "millisecond":
-        return int(timespan[value_key] * 1000 * 1000)
-    if unit_of_time == "second":
-        return int(timespan[value_key] * 1000 * 1000 * 1000)
-    if unit_of_time == "minute":
-        return int(timespan[value_key] * 1000 * 1000 * 1000 * 60)
-    if unit_of_time == "hour":
-        return int(timespan[value_key] * 1000 * 1000 * 1000 * 60 * 60)
-    if unit_of_time == "day":
-        return int(timespan[value_key] * 1000 * 1000 * 1000 * 60 * 60 * 24)
-    return None
+    if unit_of_time not in _NANOS_PER_UNIT:
+        return None
+    return int(timespan[value_key] * _NANOS_PER_UNIT[unit_of_time])
 
 
 def glean_timespan_seconds(
@@ -70,27 +100,146 @@ def glean_timespan_seconds(
     """
     if type(timespan) == str:
         try:
-            dict(ast.literal_eval(timespan))
-        except SyntaxError:
+            timespan = dict(ast.literal_eval(timespan))
+        except (SyntaxError, ValueError):
             return None
 
     unit_of_time = timespan[key_key]
 
-    if unit_of_time == "nanosecond":
-        return int(timespan[value_key] / 1000 / 1000 / 1000)
-    if unit_of_time == "microsecond":
-        return int(timespan[value_key] / 1000 / 1000)
-    if unit_of_time == "millisecond":
-        return int(timespan[value_key] / 1000)
-    if unit_of_time == "second":
-        return int(timespan[value_key])
-    if unit_of_time == "minute":
-        return int(timespan[value_key] * 60)
-    if unit_of_time == "hour":
-        return int(timespan[value_key] * 60 * 60)
-    if unit_of_time == "day":
-        return int(timespan[value_key] * 60 * 60 * 24)
-    return None
+    if unit_of_time not in _SECONDS_PER_UNIT:
+        return None
+    multiplier, divisor = _SECONDS_PER_UNIT[unit_of_time]
+    scaled = timespan[value_key] * multiplier
+    # integer division that truncates towards zero, like the column version
+    seconds = abs(scaled) // divisor
+    return int(seconds if scaled >= 0 else -seconds)
+
+
+def glean_timespan_nanos_column(
+    timespan,
+    values=None,
+    key_key: str = "time_unit",
+    value_key: str = "value",
+) -> pl.Series:
+    """Vectorized glean_timespan_nanos over a whole column of timespans.
+
+    Units are mapped to multipliers through a lookup table and the conversion
+    is done with exact int64 arithmetic, no Python objects per row.
+
+    Args:
+        timespan: either a struct column (polars Series or Arrow struct array)
+        holding key_key and value_key fields, or a column of time units when
+        values is provided.
+        values (optional): column of timespan values, used together with a
+        column of units in timespan. Defaults to None.
+        key_key (str, optional): Key for the struct, rarely needs to be changed.
+        Defaults to "time_unit".
+        value_key (str, optional): Value key for the struct, rarely needs to be
+        change. Defaults to "value".
+
+    Returns:
+        pl.Series: int64 nanoseconds, null where the unit is unknown, the
+        value is null or the nanoseconds do not fit in an int64
+    """
+    units, values = _timespan_columns(timespan, values, key_key, value_key)
+    idx, valid = _lookup_units(units, values)
+
+    import numpy as np
+
+    _, nanos, _, _ = _unit_lookups()
+    raw, factor = values.fill_null(0).to_numpy(), nanos[idx]
+    valid &= _fits_int64(raw, factor)
+    result = np.where(valid, raw, 0) * factor
+
+    return _with_nulls("nanos", result, valid)
+
+
+def glean_timespan_seconds_column(
+    timespan,
+    values=None,
+    key_key: str = "time_unit",
+    value_key: str = "value",
+) -> pl.Series:
+    """Vectorized glean_timespan_seconds over a whole column of timespans,
+    rounded down to full seconds.
+
+    Args:
+        timespan: either a struct column (polars Series or Arrow struct array)
+        holding key_key and value_key fields, or a column of time units when
+        values is provided.
+        values (optional): column of timespan values, used together with a
+        column of units in timespan. Defaults to None.
+        key_key (str, optional): Key for the struct, rarely needs to be changed.
+        Defaults to "time_unit".
+        value_key (str, optional): Value key for the struct, rarely needs to be
+        change. Defaults to "value".
+
+    Returns:
+        pl.Series: int64 seconds, null where the unit is unknown, the value
+        is null or the value times the unit's seconds does not fit in an
+        int64
+    """
+    units, values = _timespan_columns(timespan, values, key_key, value_key)
+    idx, valid = _lookup_units(units, values)
+
+    import numpy as np
+
+    _, _, multipliers, divisors = _unit_lookups()
+    raw, multiplier = values.fill_null(0).to_numpy(), multipliers[idx]
+    valid &= _fits_int64(raw, multiplier)
+    scaled = np.where(valid, raw, 0) * multiplier
+    divisor = divisors[idx]
+    # integer division that truncates towards zero, like int() does
+    result = np.sign(scaled) * (np.abs(scaled) // divisor)
+
+    return _with_nulls("seconds", result, valid)
+
+
+def _timespan_columns(timespan, values, key_key, value_key):
+    import polars as pl
+
+    if values is None:
+        structs = timespan if isinstance(timespan, pl.Series) else pl.Series(timespan)
+        units, values = structs.struct.field(key_key), structs.struct.field(value_key)
+    else:
+        units = timespan if isinstance(timespan, pl.Series) else pl.Series(timespan)
+        values = values if isinstance(values, pl.Series) else pl.Series(values)
+
+    return units.cast(pl.Utf8), values.cast(pl.Int64)
+
+
+def _lookup_units(units: pl.Series, values: pl.Series):
+    """Position of every unit in the lookup table, and whether the row has
+    both a known unit and a value"""
+    import numpy as np
+
+    known_units, _, _, _ = _unit_lookups()
+    names = units.fill_null("").to_numpy().astype(str)
+    idx = np.searchsorted(known_units, names)
+    idx = np.minimum(idx, len(known_units) - 1)
+
+    valid = (known_units[idx] == names) & values.is_not_null().to_numpy()
+
+    return idx, valid
+
+
+def _fits_int64(values: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """Whether each value times its factor fits in an int64, numpy would
+    wrap around silently"""
+    import numpy as np
+
+    limit = np.iinfo(np.int64).max // factors
+    return (values <= limit) & (values >= -limit)
+
+
+def _with_nulls(name: str, result: np.ndarray, valid: np.ndarray) -> pl.Series:
+    import numpy as np
+    import polars as pl
+
+    series = pl.Series(name, result.astype(np.int64), dtype=pl.Int64)
+    if valid.all():
+        return series
+    return series.set(pl.Series(~valid), None)
 
 
 def glean_legacy_compatible_experiments(
@@ -130,3 +279,66 @@ def glean_legacy_compatible_experiments(
         experiment_dict = {"experiments": experiment_list}
 
     return experiment_dict
+
+
+def glean_experiment_index(experiments) -> ExperimentIndex:
+    """Inverted index of experiment enrollment over a whole column: for every
+    experiment and branch, the set of rows enrolled in it. Built in Rust in
+    one parallel pass, after which lookups need no parsing:
+
+        index = glean_experiment_index(df["experiments"])
+        treated = index.rows("my-experiment", "treatment")
+        both = index.intersect([("my-experiment", "treatment"), ("other", None)])
+        df.iloc[treated.to_list()]
+
+    RowSets combine with &, | and -. The index pickles, and to_bytes and
+    ExperimentIndex.from_bytes keep it around between analyses.
+
+    Args:
+        experiments: a column of Glean experiments payloads, or of
+        list<struct<key, value: struct<branch, ..>>> as in the ping tables.
+        A polars Series, pyarrow array, pandas Series or list. Null rows are
+        not enrolled in anything. Payloads can be in any form
+        glean_legacy_compatible_experiments takes: JSON strings are parsed
+        in Rust, and a column with anything else, strings wrapped in [ ],
+        Python literals or dicts, is first turned into JSON row by row in
+        Python.
+
+    Returns:
+        ExperimentIndex
+    """
+    import polars as pl
+
+    if not isinstance(experiments, pl.Series):
+        experiments = pl.Series(experiments)
+
+    try:
+        return ExperimentIndex.from_column(experiments)
+    except ValueError:
+        if experiments.dtype == pl.List:
+            raise
+
+    payloads = [_experiments_json(row) for row in experiments.to_list()]
+    return ExperimentIndex.from_column(pl.Series(payloads, dtype=pl.Utf8))
+
+
+def _experiments_json(row) -> Optional[str]:
+    """An experiments payload as glean_legacy_compatible_experiments takes
+    it, as a JSON string"""
+    if row is None:
+        return None
+    if isinstance(row, str):
+        if row[:1] == "[":
+            row = row[1:-1]
+        try:
+            json.loads(row)
+            return row
+        except ValueError:
+            try:
+                row = ast.literal_eval(row)
+            except SyntaxError as e:
+                raise ValueError(f"not a Glean experiments payload: {row!r}") from e
+    elif isinstance(row, list):
+        row = row[0]
+
+    return json.dumps(row)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict
+
+from mozfun_local.mozfun_local_rust import normalize_histogram as _normalize_histogram
+from mozfun_local.mozfun_local_rust import (
+    normalize_histogram_column as _normalize_histogram_column,
+)
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+def hist_normalize(histogram: Dict[int, float]) -> Dict[int, float]:
+    """Normalize a histogram so that its values sum to 1.
+
+    Args:
+        histogram (Dict[int, float]): bucket to count
+
+    Returns:
+        Dict[int, float]: bucket to the share of the total in that bucket
+    """
+    return _normalize_histogram(histogram)
+
+
+def hist_normalize_column(column) -> pl.Series:
+    """Normalize a whole column of histograms in one pass. Parsing and
+    normalization happen in parallel in Rust, without a dict conversion per row.
+
+    Args:
+        column: polars Series or Arrow array of either histogram JSON strings
+        (a full main ping histogram, or just its map of values), or
+        list<struct<key, value>> histograms.
+
+    Returns:
+        pl.Series: list<struct<bucket: i64, value: f64>> sorted by bucket, null
+        for null or unparseable rows.
+    """
+    import polars as pl
+
+    if not isinstance(column, pl.Series):
+        column = pl.Series(column)
+
+    return _normalize_histogram_column(column)
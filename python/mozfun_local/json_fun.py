@@ -1,11 +1,14 @@
-from typing import List, Dict, Optional
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict, Optional
 import ast
 import json
 
-import pandas as pd
-
 from mozfun_local.mozfun_local_rust import json_mode_last as _json_mode_last
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def json_mode_last(data: pd.Series) -> int:
     """Returns the most frequently occuring element in an array.
@@ -1,14 +1,20 @@
+from __future__ import annotations
+
 import typing
 
-import pandas as pd
 from mozfun_local.mozfun_local_rust import map_sum as _map_sum
 from mozfun_local.mozfun_local_rust import map_get_key as _map_get_key
 
 
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
 T = typing.TypeVar("T")
 
 
 def map_sum(data: pd.Series, reversed: bool = False) -> pd.DataFrame:
+    import pandas as pd
+
     result = pd.DataFrame(_map_sum(data))
     if reversed:
         return result.sort_index(ascending=True)
@@ -1,10 +1,6 @@
 import typing
 from datetime import (timedelta, datetime)
 
-import numpy as np
-
-from numba import jit
-
 from mozfun_local.mozfun_local_rust import norm_normalize_os as _norm_normalize_os
 from mozfun_local.mozfun_local_rust import VersionTruncator, VersionExtractor
 
@@ -108,11 +104,9 @@ def norm_glean_fenix_build_to_date(app_build: str, format: str = "datetime"):
     ]:
         return None
 
-    try:
-        # need to do some bitwise operations here
-        # first cast to int64
-        i64_app_build = np.int64(int(app_build))
-    except:
+    # need to do some bitwise operations here
+    int_app_build = _to_int64(app_build)
+    if int_app_build is None:
         return None
 
     if appbuild_len == 8:
@@ -129,18 +123,30 @@ def norm_glean_fenix_build_to_date(app_build: str, format: str = "datetime"):
     # Branchless, this is the 10 digit section
     base_date = datetime(2014, 12, 28, 0, 0, 0)
 
-    shifted_app_build = _bitwise_shift_eight_chars(i64_app_build)
+    shifted_app_build = _bitwise_shift_eight_chars(int_app_build)
 
     return base_date + timedelta(hours=float(shifted_app_build))
 
 
-@jit(nopython=True)
-def _bitwise_shift_eight_chars(x: np.int64):
-    # shift left then right to drop all but 20 rightmost bits
-    # 64-20 = 44
-    x = x << 44 >> 44
+def _to_int64(value: str) -> typing.Optional[int]:
+    """value as an int, or None if it is not one or does not fit in an
+    int64, as BigQuery's SAFE_CAST(value AS INT64) reads app_build"""
+    try:
+        x = int(value)
+    except ValueError:
+        return None
+
+    # app_build is at most 10 digits by the time it gets here, so this only
+    # matters to other callers; kept so the helper means what its name says
+    return x if -(2**63) <= x < 2**63 else None
 
-    # now drop the last 3 of those
-    x = x >> 3
 
-    return x
+def _bitwise_shift_eight_chars(x: int) -> int:
+    # drop all but the 20 rightmost bits, sign extended the way an int64
+    # shift left then right by 44 (64-20) would
+    x &= 0xFFFFF
+    if x & 0x80000:
+        x -= 1 << 20
+
+    # now drop the last 3 of those
+    return x >> 3
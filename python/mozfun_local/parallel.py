@@ -0,0 +1,387 @@
+"""The per row mozfun functions applied to a whole column on a pool of
+processes, under the same names as in the other modules:
+
+    from mozfun_local.parallel import json_extract_int_map
+
+    df["histogram"] = json_extract_int_map(df["histogram_values"])
+
+The column is converted to Arrow once and written to a shared memory block
+as one record batch per chunk. Every worker maps the block and reads its
+batch in place, so rows are never pickled on the way in, and sends back its
+chunk of the output as a single object. Chunks are put back together in
+order and nulls stay null.
+
+Columns can be pandas, polars or pyarrow, or a list. The output is the same
+kind of column, except for json_extract_int_map whose dicts have no Arrow
+type: it returns a list, or an object Series for pandas input.
+
+Workers are started with spawn, since forking a process with running Rust
+threads is unsafe, and kept between calls. Starting them takes about as
+long as importing mozfun_local, so a column that fits in one chunk is done
+in the calling process.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, wait
+import itertools
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+import sys
+import threading
+from typing import TYPE_CHECKING, Optional
+
+# pyarrow is imported where it is used, so importing this module stays fast
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# chunks per worker, so a slow chunk does not hold up the rest of the pool
+_CHUNKS_PER_WORKER = 4
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def json_extract_int_map(
+    column, max_workers: Optional[int] = None, chunk_rows: Optional[int] = None
+):
+    """json_fun.json_extract_int_map of every row of a column
+
+    Args:
+        column: strings, or lists of key/value structs
+        max_workers (int, optional): processes in the pool. Defaults to the
+        number of cores.
+        chunk_rows (int, optional): rows each worker takes at a time. Defaults
+        to a quarter of the rows per worker.
+
+    Returns:
+        list of the results, an object Series for pandas input
+    """
+    return _apply("json_extract_int_map", column, (), max_workers, chunk_rows)
+
+
+def json_extract_string_map(
+    column, max_workers: Optional[int] = None, chunk_rows: Optional[int] = None
+):
+    """json_fun.json_extract_string_map of every row of a column of json
+    strings, see json_extract_int_map for the arguments"""
+    return _apply("json_extract_string_map", column, (), max_workers, chunk_rows)
+
+
+def glean_timespan_nanos(
+    column,
+    key_key: str = "time_unit",
+    value_key: str = "value",
+    max_workers: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+):
+    """glean_fun.glean_timespan_nanos of every row of a struct column of
+    Glean timespans, see json_extract_int_map for the other arguments"""
+    return _apply(
+        "glean_timespan_nanos", column, (key_key, value_key), max_workers, chunk_rows
+    )
+
+
+def glean_timespan_seconds(
+    column,
+    key_key: str = "time_unit",
+    value_key: str = "value",
+    max_workers: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+):
+    """glean_fun.glean_timespan_seconds of every row of a struct column of
+    Glean timespans, see json_extract_int_map for the other arguments"""
+    return _apply(
+        "glean_timespan_seconds",
+        column,
+        (key_key, value_key),
+        max_workers,
+        chunk_rows,
+    )
+
+
+def norm_glean_fenix_build_to_date(
+    column,
+    format: str = "datetime",
+    max_workers: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+):
+    """norm_fun.norm_glean_fenix_build_to_date of every row of a column of
+    app_build values, see json_extract_int_map for the other arguments"""
+    return _apply(
+        "norm_glean_fenix_build_to_date", column, (format,), max_workers, chunk_rows
+    )
+
+
+def bytes_extract_bits(
+    column,
+    begin: int,
+    length: int,
+    max_workers: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+):
+    """bytes_fun.bytes_extract_bits of every row of a binary column, see
+    json_extract_int_map for the other arguments"""
+    return _apply(
+        "bytes_extract_bits", column, (begin, length), max_workers, chunk_rows
+    )
+
+
+def shutdown():
+    """Stops the worker processes, the next call starts a new pool"""
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_workers = None, 0
+
+
+# Every kernel takes a chunk as an Arrow array and returns its output as an
+# Arrow array, or a list where the output has no Arrow type
+
+
+def _rows(function, chunk, *args) -> list:
+    return [None if v is None else function(v, *args) for v in chunk.to_pylist()]
+
+
+def _json_extract_int_map(chunk):
+    from mozfun_local.json_fun import json_extract_int_map
+
+    return _rows(json_extract_int_map, chunk)
+
+
+def _json_extract_string_map(chunk):
+    import pyarrow as pa
+
+    from mozfun_local.json_fun import json_extract_string_map
+
+    entry = pa.struct([("key", pa.string()), ("value", pa.string())])
+    return pa.array(_rows(json_extract_string_map, chunk), type=pa.list_(entry))
+
+
+def _glean_timespan_nanos(chunk, key_key, value_key):
+    from mozfun_local.glean_fun import glean_timespan_nanos_column
+
+    return glean_timespan_nanos_column(
+        chunk, key_key=key_key, value_key=value_key
+    ).to_arrow()
+
+
+def _glean_timespan_seconds(chunk, key_key, value_key):
+    from mozfun_local.glean_fun import glean_timespan_seconds_column
+
+    return glean_timespan_seconds_column(
+        chunk, key_key=key_key, value_key=value_key
+    ).to_arrow()
+
+
+def _norm_glean_fenix_build_to_date(chunk, format):
+    import pyarrow as pa
+
+    from mozfun_local.norm_fun import norm_glean_fenix_build_to_date
+
+    dates = _rows(norm_glean_fenix_build_to_date, chunk, format)
+    return pa.array(dates, type=pa.date32() if format == "date" else pa.timestamp("us"))
+
+
+def _bytes_extract_bits(chunk, begin, length):
+    from mozfun_local.bytes_fun import bytes_extract_bits_column
+
+    return bytes_extract_bits_column(chunk, begin, length)
+
+
+_KERNELS = {
+    "json_extract_int_map": _json_extract_int_map,
+    "json_extract_string_map": _json_extract_string_map,
+    "glean_timespan_nanos": _glean_timespan_nanos,
+    "glean_timespan_seconds": _glean_timespan_seconds,
+    "norm_glean_fenix_build_to_date": _norm_glean_fenix_build_to_date,
+    "bytes_extract_bits": _bytes_extract_bits,
+}
+
+
+def _apply(kernel: str, column, args: tuple, max_workers, chunk_rows):
+    array = _to_arrow(column)
+    workers = max_workers or os.cpu_count() or 1
+    if chunk_rows is None:
+        chunk_rows = -(-len(array) // (workers * _CHUNKS_PER_WORKER))
+    chunk_rows = max(chunk_rows, 1)
+
+    if workers == 1 or len(array) <= chunk_rows:
+        return _like(column, _concat([_KERNELS[kernel](array, *args)]))
+
+    shared, size, n_chunks = _share(array, chunk_rows)
+    try:
+        executor = _executor(workers)
+        futures = [
+            executor.submit(_apply_chunk, kernel, shared.name, size, i, args)
+            for i in range(n_chunks)
+        ]
+        try:
+            chunks = [pickle.loads(f.result()) for f in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            # chunks that already started still use the block
+            wait(futures)
+            raise
+    finally:
+        shared.close()
+        shared.unlink()
+
+    return _like(column, _concat(chunks))
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+
+        return _pool
+
+
+def _share(array: pa.Array, chunk_rows: int):
+    """Writes the array to shared memory as an Arrow IPC file with a record
+    batch per chunk. Returns the block, the size of the file, which can be
+    less than the block, and the number of chunks."""
+    import pyarrow as pa
+
+    batches = [
+        pa.record_batch([array.slice(start, chunk_rows)], names=["column"])
+        for start in range(0, len(array), chunk_rows)
+    ]
+
+    def write(sink):
+        with pa.ipc.new_file(sink, batches[0].schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+    mock = pa.MockOutputStream()
+    write(mock)
+    size = mock.size()
+
+    shared = SharedMemory(create=True, size=size)
+    try:
+        buffer = pa.py_buffer(shared.buf)
+        write(pa.FixedSizeBufferWriter(buffer))
+        # the block cannot be closed while Arrow holds a view of it
+        del buffer
+    except BaseException:
+        shared.close()
+        shared.unlink()
+        raise
+
+    return shared, size, len(batches)
+
+
+def _apply_chunk(kernel: str, name: str, size: int, index: int, args: tuple) -> bytes:
+    """Runs in a worker: the kernel over one record batch of the shared file.
+    The output is pickled here, before the block is closed, since it can
+    share buffers with the input."""
+    shared = _attach(name)
+    try:
+        return pickle.dumps(
+            _KERNELS[kernel](_read_chunk(shared, size, index), *args),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    finally:
+        try:
+            shared.close()
+        except BufferError:
+            # a traceback still holds a view of the chunk, the mapping is
+            # released with it
+            pass
+
+
+def _read_chunk(shared: SharedMemory, size: int, index: int) -> pa.Array:
+    import pyarrow as pa
+
+    reader = pa.ipc.open_file(pa.py_buffer(shared.buf)[:size])
+    return reader.get_batch(index).column(0)
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        # the caller owns the block, keep the resource tracker out of it
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # track was added in Python 3.13. Before it, attaching registers the block
+    # with the resource tracker, which then warns about it and unlinks it a
+    # second time at exit. Spawned workers share the caller's tracker, so
+    # unregistering after the fact would drop the caller's own registration:
+    # skip registering instead. Tasks run on the worker's only thread.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _to_arrow(column) -> pa.Array:
+    import pyarrow as pa
+
+    if isinstance(column, pa.ChunkedArray):
+        return column.combine_chunks()
+    if isinstance(column, pa.Array):
+        return column
+    if _is_instance(column, "polars", "Series"):
+        return _to_arrow(column.to_arrow())
+    if _is_instance(column, "pandas", "Series"):
+        return pa.array(column, from_pandas=True)
+
+    return pa.array(column)
+
+
+def _concat(chunks: list):
+    import pyarrow as pa
+
+    if all(isinstance(chunk, pa.Array) for chunk in chunks):
+        return pa.concat_arrays(chunks)
+
+    return list(itertools.chain.from_iterable(chunks))
+
+
+def _like(column, result):
+    """The result as the same kind of column as the input"""
+    import pyarrow as pa
+
+    if _is_instance(column, "pandas", "Series"):
+        import pandas as pd
+
+        if isinstance(result, list):
+            return pd.Series(result, index=column.index, name=column.name, dtype=object)
+        series = result.to_pandas(types_mapper=pd.ArrowDtype)
+        series.index, series.name = column.index, column.name
+        return series
+
+    if isinstance(result, list):
+        return result
+    if _is_instance(column, "polars", "Series"):
+        import polars as pl
+
+        return pl.Series(column.name, result)
+    if isinstance(column, (pa.Array, pa.ChunkedArray)):
+        return result
+
+    return result.to_pylist()
+
+
+def _is_instance(column, module: str, name: str) -> bool:
+    # a column can only come from a library that has already been imported
+    library = sys.modules.get(module)
+    return library is not None and isinstance(column, getattr(library, name))
@@ -0,0 +1,173 @@
+"""mozfun_local functions as polars expressions, under the ``mozfun``
+namespace. Importing this module registers the namespace:
+
+    import polars as pl
+    import mozfun_local.polars_ext  # noqa: F401
+
+    df.lazy().with_columns(pl.col("os").mozfun.norm_normalize_os()).collect()
+
+The expressions are Python map_batches callbacks, not native polars
+expressions: pyo3-polars 0.1 cannot register those. Each call hands a whole
+Series to a Rust or NumPy kernel that works on the Arrow buffers in
+parallel, so there is one Python call per batch rather than per row. Nulls
+stay null.
+
+Every kernel is row-wise, and is marked is_elementwise where polars supports
+it (map_batches in newer releases). There streaming queries call it on each
+chunk. With older polars, whose Expr.map has no such flag, polars has to
+materialize the whole column for the call, and that step of a streaming
+query runs outside the streaming engine.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+import polars as pl
+
+from mozfun_local.mozfun_local_rust import (
+    json_mode_last_column as _json_mode_last_column,
+    map_get_key_column as _map_get_key_column,
+    map_sum_column as _map_sum_column,
+    norm_extract_version_column as _norm_extract_version_column,
+    norm_normalize_os_column as _norm_normalize_os_column,
+    norm_truncate_version_column as _norm_truncate_version_column,
+    stats_mode_last_column as _stats_mode_last_column,
+)
+
+
+def _map_series(
+    expr: pl.Expr, function: Callable[[pl.Series], pl.Series], return_dtype
+) -> pl.Expr:
+    # Expr.map was renamed map_batches in later polars releases
+    map_batches = getattr(expr, "map_batches", None)
+    if map_batches is None:
+        return expr.map(function, return_dtype=return_dtype)
+    try:
+        # every kernel is row-wise, so chunks can be mapped on their own
+        return map_batches(function, return_dtype=return_dtype, is_elementwise=True)
+    except TypeError:
+        # map_batches releases from before is_elementwise
+        return map_batches(function, return_dtype=return_dtype)
+
+
+@pl.api.register_expr_namespace("mozfun")
+class MozfunExpr:
+    def __init__(self, expr: pl.Expr):
+        self._expr = expr
+
+    def norm_normalize_os(self) -> pl.Expr:
+        """norm_normalize_os of a Utf8 column"""
+        return _map_series(self._expr, _norm_normalize_os_column, pl.Utf8)
+
+    def norm_truncate_version(self, truncate_to_version: str) -> pl.Expr:
+        """norm_truncate_version of a Utf8 column, to "major" or "minor" """
+        part = truncate_to_version.lower()
+        return _map_series(
+            self._expr,
+            lambda s: _norm_truncate_version_column(s, part),
+            pl.Utf8,
+        )
+
+    def norm_extract_version(self, part_to_extract: str) -> pl.Expr:
+        """norm_extract_version of a Utf8 column, "major", "minor" or "patch".
+        Null where the version has no such part."""
+        part = part_to_extract.lower()
+        return _map_series(
+            self._expr,
+            lambda s: _norm_extract_version_column(s, part),
+            pl.UInt64,
+        )
+
+    def map_get_key(self, key: str, trim_chars: bool = True) -> pl.Expr:
+        """map_get_key of a Utf8 column of json encoded array<struct<key, value>>,
+        "" where the key is missing"""
+        return _map_series(
+            self._expr,
+            lambda s: _map_get_key_column(s, key, trim_chars),
+            pl.Utf8,
+        )
+
+    def map_sum(self) -> pl.Expr:
+        """mozfun's map.sum of every row of a list<struct<key, value>> column:
+        values of repeated keys are summed. Returns
+        list<struct<key: utf8, value: f64>>, keys in order of first appearance."""
+        return _map_series(
+            self._expr,
+            _map_sum_column,
+            pl.List(
+                pl.Struct([pl.Field("key", pl.Utf8), pl.Field("value", pl.Float64)])
+            ),
+        )
+
+    def stats_mode_last(self) -> pl.Expr:
+        """stats_mode_last of every row of a list of integers, null for empty
+        rows"""
+        return _map_series(self._expr, _stats_mode_last_column, pl.Int64)
+
+    def json_mode_last(self) -> pl.Expr:
+        """json_mode_last of every row of a list column, values are compared
+        as strings. Null for empty rows."""
+        return _map_series(self._expr, _json_mode_last_column, pl.Utf8)
+
+    def glean_timespan_nanos(
+        self, key_key: str = "time_unit", value_key: str = "value"
+    ) -> pl.Expr:
+        """glean_timespan_nanos of a struct column of Glean timespans"""
+        from mozfun_local.glean_fun import glean_timespan_nanos_column
+
+        return _map_series(
+            self._expr,
+            lambda s: glean_timespan_nanos_column(
+                s, key_key=key_key, value_key=value_key
+            ).alias(s.name),
+            pl.Int64,
+        )
+
+    def glean_timespan_seconds(
+        self, key_key: str = "time_unit", value_key: str = "value"
+    ) -> pl.Expr:
+        """glean_timespan_seconds of a struct column of Glean timespans"""
+        from mozfun_local.glean_fun import glean_timespan_seconds_column
+
+        return _map_series(
+            self._expr,
+            lambda s: glean_timespan_seconds_column(
+                s, key_key=key_key, value_key=value_key
+            ).alias(s.name),
+            pl.Int64,
+        )
+
+    def bytes_extract_bits(self, begin: int, length: int) -> pl.Expr:
+        """bytes_extract_bits of a Binary column"""
+        from mozfun_local.bytes_fun import bytes_extract_bits_column
+
+        return _map_series(
+            self._expr,
+            lambda s: pl.Series(
+                s.name, bytes_extract_bits_column(s.to_arrow(), begin, length)
+            ),
+            pl.Binary,
+        )
+
+    def bytes_zero_right(self, length: int) -> pl.Expr:
+        """bytes_zero_right of a Binary column"""
+        from mozfun_local.bytes_fun import bytes_zero_right_column
+
+        return _map_series(
+            self._expr,
+            lambda s: pl.Series(s.name, bytes_zero_right_column(s.to_arrow(), length)),
+            pl.Binary,
+        )
+
+    def hist_normalize(self) -> pl.Expr:
+        """hist_normalize_column of a column of histograms"""
+        from mozfun_local.hist_fun import hist_normalize_column
+
+        return _map_series(
+            self._expr,
+            hist_normalize_column,
+            pl.List(
+                pl.Struct([pl.Field("bucket", pl.Int64), pl.Field("value", pl.Float64)])
+            ),
+        )
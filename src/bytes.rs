@@ -1,5 +1,9 @@
 use math::round::ceil;
+use pyo3::buffer::PyBuffer;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3::types::PyBytes;
+use rayon::prelude::*;
 
 #[allow(dead_code)]
 #[pyfunction]
@@ -11,10 +15,249 @@ pub fn bytes_bit_pos_to_byte_pos(bit_pos: i64) -> PyResult<i64> {
     Ok(sign * ceiling)
 }
 
+/// Zero the rightmost `length` bits of a byte string, in place.
+/// Bytes are always treated as big-endian (as BigQuery does), so the rightmost
+/// bits are the low bits of the last byte regardless of the host byte order.
+pub fn zero_right_in_place(b: &mut [u8], length: usize) {
+    let length = length.min(b.len() * 8);
+    let full_bytes = length / 8;
+    let remainder = length % 8;
+    let keep = b.len() - full_bytes;
+
+    b[keep..].iter_mut().for_each(|x| *x = 0);
+    if remainder > 0 {
+        b[keep - 1] &= 0xFFu8 << remainder;
+    }
+}
+
+/// 1-indexed bit at which extraction starts, following SUBSTR: 0 is treated
+/// as 1 and negative positions count back from the end of the bytes
+fn extract_start_bit(len_b: usize, begin: i64) -> i64 {
+    if begin >= 0 {
+        begin.max(1)
+    } else {
+        (8 * len_b as i64 + begin + 1).max(1)
+    }
+}
+
+/// Number of bytes extract_bits produces for an input of `len_b` bytes.
+/// Like BigQuery, which shifts the whole value and then takes
+/// SUBSTR(.., 1, CEIL(length / 8)), it does not depend on where extraction
+/// starts.
+pub fn extracted_len(len_b: usize, length: i64) -> usize {
+    if length <= 0 {
+        return 0;
+    }
+
+    (((length + 7) / 8) as usize).min(len_b)
+}
+
+/// Big-endian bit extraction, `out` must be extracted_len() bytes long.
+/// Bits are shifted up to the first output byte, bits shifted in from past
+/// the end are zero, and anything past `length` bits is zeroed.
+pub fn extract_bits_to(b: &[u8], begin: i64, length: i64, out: &mut [u8]) {
+    if out.is_empty() {
+        return;
+    }
+    let start_bit = extract_start_bit(b.len(), begin);
+    let start_byte = ((start_bit - 1) / 8) as usize;
+    let shift = ((start_bit - 1) % 8) as u32;
+
+    for (i, x) in out.iter_mut().enumerate() {
+        let high = b.get(start_byte + i).map_or(0, |byte| byte << shift);
+        let low = match (shift, b.get(start_byte + i + 1)) {
+            (0, _) | (_, None) => 0,
+            (_, Some(next)) => next >> (8 - shift),
+        };
+        *x = high | low;
+    }
+
+    let excess = 8 * out.len() as i64 - length;
+    if excess > 0 {
+        zero_right_in_place(out, excess as usize);
+    }
+}
+
+/// Arrow offsets are little-endian by specification, so decode them
+/// explicitly rather than trusting the host byte order
+fn decode_offsets(offsets: &[u8]) -> PyResult<Vec<usize>> {
+    if offsets.len() % 8 != 0 {
+        return Err(PyValueError::new_err(
+            "offsets must be a buffer of little-endian int64",
+        ));
+    }
+
+    Ok(offsets
+        .chunks_exact(8)
+        .map(|c| i64::from_le_bytes(c.try_into().unwrap()) as usize)
+        .collect())
+}
+
+/// The bytes behind a buffer, e.g. bytes, a NumPy uint8 array or a
+/// memoryview of an Arrow buffer cast to "B", read where they are rather
+/// than copied. The slice lives as long as the PyBuffer.
+fn buffer_bytes(buffer: &PyBuffer<u8>) -> PyResult<&[u8]> {
+    if !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err("expected a contiguous buffer"));
+    }
+    if buffer.len_bytes() == 0 {
+        return Ok(&[]);
+    }
+
+    // u8 has no alignment or validity requirements, and the buffer is held
+    // for as long as the slice
+    Ok(unsafe { std::slice::from_raw_parts(buffer.buf_ptr() as *const u8, buffer.len_bytes()) })
+}
+
+/// Split a contiguous buffer into one mutable slice per row
+fn split_rows<'a>(mut data: &'a mut [u8], offsets: &[usize]) -> Vec<&'a mut [u8]> {
+    let mut rows = Vec::with_capacity(offsets.len().saturating_sub(1));
+    if let Some(first) = offsets.first() {
+        data = &mut data[*first..];
+    }
+
+    for w in offsets.windows(2) {
+        let (row, rest) = data.split_at_mut(w[1] - w[0]);
+        rows.push(row);
+        data = rest;
+    }
+
+    rows
+}
+
+/// bytes_zero_right over a column of fixed width values stored back to back.
+/// The values are read from `data` where they are, copied once into the
+/// bytes object returned and zeroed there.
+#[pyfunction]
+pub fn bytes_zero_right_fixed(
+    py: Python,
+    data: PyBuffer<u8>,
+    width: usize,
+    length: usize,
+) -> PyResult<Py<PyBytes>> {
+    let data = buffer_bytes(&data)?;
+    let result = PyBytes::new_with(py, data.len(), |buffer| {
+        buffer.copy_from_slice(data);
+        if width > 0 {
+            py.allow_threads(|| {
+                buffer
+                    .par_chunks_mut(width)
+                    .for_each(|b| zero_right_in_place(b, length))
+            });
+        }
+        Ok(())
+    })?;
+
+    Ok(result.into())
+}
+
+/// bytes_zero_right over a column of variable width values, described by
+/// Arrow style int64 offsets into `data`. Offsets are unchanged, the values
+/// are copied once as in bytes_zero_right_fixed.
+#[pyfunction]
+pub fn bytes_zero_right_offsets(
+    py: Python,
+    data: PyBuffer<u8>,
+    offsets: PyBuffer<u8>,
+    length: usize,
+) -> PyResult<Py<PyBytes>> {
+    let data = buffer_bytes(&data)?;
+    let offsets = decode_offsets(buffer_bytes(&offsets)?)?;
+    let result = PyBytes::new_with(py, data.len(), |buffer| {
+        buffer.copy_from_slice(data);
+        py.allow_threads(|| {
+            split_rows(buffer, &offsets)
+                .into_par_iter()
+                .for_each(|b| zero_right_in_place(b, length))
+        });
+        Ok(())
+    })?;
+
+    Ok(result.into())
+}
+
+/// bytes_extract_bits over a column of fixed width values stored back to
+/// back. Returns the extracted values, also back to back, and their width.
+#[pyfunction]
+pub fn bytes_extract_bits_fixed(
+    py: Python,
+    data: PyBuffer<u8>,
+    width: usize,
+    begin: i64,
+    length: i64,
+) -> PyResult<(Py<PyBytes>, usize)> {
+    let data = buffer_bytes(&data)?;
+    let out_width = extracted_len(width, length);
+    if out_width == 0 {
+        return Ok((PyBytes::new(py, &[]).into(), 0));
+    }
+    // extracted straight into the bytes object returned
+    let result = PyBytes::new_with(py, data.len() / width * out_width, |buffer| {
+        py.allow_threads(|| {
+            buffer
+                .par_chunks_mut(out_width)
+                .zip(data.par_chunks_exact(width))
+                .for_each(|(out, b)| extract_bits_to(b, begin, length, out))
+        });
+        Ok(())
+    })?;
+
+    Ok((result.into(), out_width))
+}
+
+/// bytes_extract_bits over a column of variable width values, described by
+/// Arrow style int64 offsets into `data`. Returns the extracted values and
+/// their new offsets (little-endian int64, starting at 0).
+#[pyfunction]
+pub fn bytes_extract_bits_offsets(
+    py: Python,
+    data: PyBuffer<u8>,
+    offsets: PyBuffer<u8>,
+    begin: i64,
+    length: i64,
+) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let data = buffer_bytes(&data)?;
+    let offsets = decode_offsets(buffer_bytes(&offsets)?)?;
+
+    let mut out_offsets = vec![0usize];
+    for w in offsets.windows(2) {
+        let last = *out_offsets.last().unwrap();
+        out_offsets.push(last + extracted_len(w[1] - w[0], length));
+    }
+    let result = PyBytes::new_with(py, *out_offsets.last().unwrap(), |buffer| {
+        py.allow_threads(|| {
+            split_rows(buffer, &out_offsets)
+                .into_par_iter()
+                .zip(offsets.par_windows(2))
+                .for_each(|(out, w)| extract_bits_to(&data[w[0]..w[1]], begin, length, out))
+        });
+        Ok(())
+    })?;
+
+    let out_offsets = out_offsets
+        .iter()
+        .flat_map(|x| (*x as i64).to_le_bytes())
+        .collect::<Vec<u8>>();
+
+    Ok((result.into(), PyBytes::new(py, &out_offsets).into()))
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
 
+    fn extract_bits(b: &[u8], begin: i64, length: i64) -> Vec<u8> {
+        let mut out = vec![0u8; extracted_len(b.len(), length)];
+        extract_bits_to(b, begin, length, &mut out);
+        out
+    }
+
+    fn zero_right(b: &[u8], length: usize) -> Vec<u8> {
+        let mut out = b.to_vec();
+        zero_right_in_place(&mut out, length);
+        out
+    }
+
     #[test]
     fn test_bytes_bit_pos_to_bytes_pos() {
         assert_eq!(bytes_bit_pos_to_byte_pos(0).unwrap(), 0);
@@ -25,4 +268,45 @@ mod tests {
         assert_eq!(bytes_bit_pos_to_byte_pos(9).unwrap(), 2);
         assert_eq!(bytes_bit_pos_to_byte_pos(-9).unwrap(), -2);
     }
+
+    #[test]
+    fn test_zero_right() {
+        assert_eq!(zero_right(b"\xFF", 4), b"\xF0");
+        assert_eq!(zero_right(b"\xFF", 0), b"\xFF");
+        assert_eq!(zero_right(b"\xFF", 8), b"\x00");
+        assert_eq!(zero_right(b"\xFF\xFF", 12), b"\xF0\x00");
+        assert_eq!(zero_right(b"\xFF\xFF", 64), b"\x00\x00");
+    }
+
+    #[test]
+    fn test_extract_bits() {
+        assert_eq!(extract_bits(b"\x01\xFE", 8, 8), b"\xFF");
+        assert_eq!(extract_bits(b"\xFF", 5, 4), b"\xF0");
+        assert_eq!(extract_bits(b"\x0F\xF0", -12, 8), b"\xFF");
+        assert_eq!(extract_bits(b"\x0F\x77", 0, 8), b"\x0F");
+        assert_eq!(extract_bits(b"\x0F\xF0", -10, 8), b"\xFC");
+        assert_eq!(extract_bits(b"\x0F\xF0", 5, 8), b"\xFF");
+        assert_eq!(extract_bits(b"\x0C\xC0", -12, 8), b"\xCC");
+        assert_eq!(extract_bits(b"\xFF", -4, 1), b"\x80");
+        assert_eq!(extract_bits(b"\xFF\xFF", 2, 2), b"\xC0");
+        assert_eq!(extract_bits(b"\xFF\xFF", 6, 1), b"\x80");
+        assert_eq!(extract_bits(b"\xFF\xFF", 1, 1), b"\x80");
+        assert_eq!(extract_bits(b"\xFF", 1, 20), b"\xFF");
+        // as wide as BigQuery's, bits past the end are zero
+        assert_eq!(extract_bits(b"\xFF", 9, 8), b"\x00");
+        assert_eq!(extract_bits(b"\xFF\xFF", 9, 16), b"\xFF\x00");
+        assert_eq!(extract_bits(b"\xFF\xFF", -4, 16), b"\xF0\x00");
+        assert_eq!(extract_bits(b"\xFF", 1, 0), b"");
+    }
+
+    #[test]
+    fn test_split_rows() {
+        let mut data = vec![1u8, 2, 3, 4, 5, 6];
+        let rows = split_rows(&mut data, &[1, 3, 3, 6]);
+
+        assert_eq!(rows.len(), 3);
+        assert_eq!(rows[0], &[2, 3]);
+        assert!(rows[1].is_empty());
+        assert_eq!(rows[2], &[4, 5, 6]);
+    }
 }
@@ -0,0 +1,241 @@
+//! Duplicate pings, recognised by their document id, in bounded memory.
+//! Ids are kept in an exact set until it outgrows its memory budget, then
+//! moved into a scalable Bloom filter (Almeida et al., 2007): a chain of
+//! filters, each twice the capacity and half the false positive rate of the
+//! one before, so the overall rate stays under the target however many ids
+//! arrive. Past the switch a few unique rows can be taken for duplicates,
+//! never the other way around.
+use crate::sketch::hash_client_id;
+use std::collections::HashSet;
+
+/// Rough heap cost of an id in the exact set besides its bytes, the budget
+/// is checked against this rather than the allocator
+const ID_BYTES: usize = 48;
+
+/// Capacity of the first Bloom filter when the exact set held fewer ids
+const MIN_CAPACITY: usize = 1 << 16;
+
+/// Overall false positive rate of the Bloom filters, used when none is given
+pub const DEFAULT_FALSE_POSITIVE_RATE: f64 = 1e-6;
+
+/// Document ids seen so far, see the module docs
+pub struct Deduplicator {
+    exact: HashSet<Box<str>>,
+    exact_bytes: usize,
+    budget: usize,
+    false_positive_rate: f64,
+    filters: Vec<BloomFilter>,
+    /// Rows taken for duplicates
+    pub duplicates: usize,
+    /// Of those, rows taken for duplicates by the Bloom filters, which can
+    /// include false positives
+    pub approximate_duplicates: usize,
+}
+
+impl Deduplicator {
+    /// Holds up to `budget` bytes of ids exactly. The Bloom filters that
+    /// follow aim for an overall `false_positive_rate`.
+    pub fn new(budget: usize, false_positive_rate: f64) -> Self {
+        Deduplicator {
+            exact: HashSet::new(),
+            exact_bytes: 0,
+            budget,
+            false_positive_rate,
+            filters: Vec::new(),
+            duplicates: 0,
+            approximate_duplicates: 0,
+        }
+    }
+
+    /// Whether ids are still held exactly
+    pub fn is_exact(&self) -> bool {
+        self.filters.is_empty()
+    }
+
+    /// Records a document id, true the first time it is seen
+    pub fn insert(&mut self, id: &str) -> bool {
+        if !self.is_exact() {
+            return self.insert_approximate(hash_pair(id));
+        }
+        if self.exact.contains(id) {
+            self.duplicates += 1;
+            return false;
+        }
+
+        self.exact.insert(id.into());
+        self.exact_bytes += ID_BYTES + id.len();
+        if self.exact_bytes > self.budget {
+            self.switch_to_filters();
+        }
+
+        true
+    }
+
+    fn insert_approximate(&mut self, (h1, h2): (u64, u64)) -> bool {
+        if self.filters.iter().any(|f| f.contains(h1, h2)) {
+            self.duplicates += 1;
+            self.approximate_duplicates += 1;
+            return false;
+        }
+
+        let last = self.filters.last().unwrap();
+        if last.len >= last.capacity {
+            let next = BloomFilter::new(last.capacity * 2, last.false_positive_rate / 2.0);
+            self.filters.push(next);
+        }
+        self.filters.last_mut().unwrap().insert(h1, h2);
+
+        true
+    }
+
+    fn switch_to_filters(&mut self) {
+        // rates of p/2, p/4, .. add up to at most p
+        let capacity = (self.exact.len() * 2).max(MIN_CAPACITY);
+        self.filters
+            .push(BloomFilter::new(capacity, self.false_positive_rate / 2.0));
+
+        for id in std::mem::take(&mut self.exact) {
+            let (h1, h2) = hash_pair(&id);
+            self.filters[0].insert(h1, h2);
+        }
+        self.exact_bytes = 0;
+    }
+}
+
+/// Two hashes of an id, combined as h1 + i * h2 into the k probes of a
+/// filter (Kirsch and Mitzenmacher, 2006)
+fn hash_pair(id: &str) -> (u64, u64) {
+    let h1 = hash_client_id(id);
+    // the murmur3 finalizer again, on a rotated copy, for a second hash
+    let mut h2 = h1.rotate_left(32) ^ 0x9e37_79b9_7f4a_7c15;
+    h2 ^= h2 >> 33;
+    h2 = h2.wrapping_mul(0xff51_afd7_ed55_8ccd);
+    h2 ^= h2 >> 33;
+
+    (h1, h2)
+}
+
+struct BloomFilter {
+    bits: Vec<u64>,
+    n_bits: u64,
+    n_hashes: u32,
+    capacity: usize,
+    len: usize,
+    false_positive_rate: f64,
+}
+
+impl BloomFilter {
+    /// Sized for `capacity` ids at `false_positive_rate`, with the optimal
+    /// number of bits and hashes
+    fn new(capacity: usize, false_positive_rate: f64) -> Self {
+        let ln2 = std::f64::consts::LN_2;
+        let n_bits = (-(capacity as f64) * false_positive_rate.ln() / (ln2 * ln2)).ceil() as u64;
+        let n_bits = n_bits.max(64);
+        let n_hashes = (-false_positive_rate.log2()).ceil().max(1.0) as u32;
+
+        BloomFilter {
+            bits: vec![0; ((n_bits + 63) / 64) as usize],
+            n_bits,
+            n_hashes,
+            capacity,
+            len: 0,
+            false_positive_rate,
+        }
+    }
+
+    /// The bits h1 + i * h2 (mod n_bits) of the k probes. Both hashes are
+    /// reduced first and the sum taken step by step, so nothing wraps at
+    /// 2^64, which n_bits (not a power of two) does not divide. A step of
+    /// zero would put every probe on the same bit.
+    fn positions(&self, h1: u64, h2: u64) -> impl Iterator<Item = u64> {
+        let n_bits = self.n_bits;
+        let step = (h2 % n_bits).max(1);
+        (0..self.n_hashes).scan(h1 % n_bits, move |bit, _| {
+            let probe = *bit;
+            *bit = (*bit + step) % n_bits;
+            Some(probe)
+        })
+    }
+
+    fn contains(&self, h1: u64, h2: u64) -> bool {
+        self.positions(h1, h2)
+            .all(|bit| self.bits[(bit / 64) as usize] & (1 << (bit % 64)) != 0)
+    }
+
+    fn insert(&mut self, h1: u64, h2: u64) {
+        for bit in self.positions(h1, h2) {
+            self.bits[(bit / 64) as usize] |= 1 << (bit % 64);
+        }
+        self.len += 1;
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn ids(range: std::ops::Range<usize>) -> impl Iterator<Item = String> {
+        range.map(|i| format!("document-{}", i))
+    }
+
+    #[test]
+    fn test_exact() {
+        let mut dedup = Deduplicator::new(usize::MAX, DEFAULT_FALSE_POSITIVE_RATE);
+
+        assert!(ids(0..1_000).all(|id| dedup.insert(&id)));
+        assert_eq!(ids(500..1_500).filter(|id| dedup.insert(id)).count(), 500);
+        assert!(dedup.is_exact());
+        assert_eq!(dedup.duplicates, 500);
+        assert_eq!(dedup.approximate_duplicates, 0);
+    }
+
+    #[test]
+    fn test_switch_to_filters() {
+        let mut dedup = Deduplicator::new(10_000, 1e-4);
+
+        let unique = ids(0..200_000).filter(|id| dedup.insert(id)).count();
+        assert!(!dedup.is_exact());
+        assert!(dedup.filters.len() > 1);
+
+        // ids seen before the switch and after it are all caught
+        assert_eq!(ids(0..200_000).filter(|id| dedup.insert(id)).count(), 0);
+        // unique ids taken for duplicates stay under the target rate
+        assert!(200_000 - unique < 20);
+        let new = ids(200_000..400_000).filter(|id| dedup.insert(id)).count();
+        assert!(200_000 - new < 20);
+        assert_eq!(dedup.duplicates - dedup.approximate_duplicates, 0);
+    }
+
+    #[test]
+    fn test_bloom_filter_rate() {
+        let mut filter = BloomFilter::new(10_000, 0.01);
+        for id in ids(0..10_000) {
+            let (h1, h2) = hash_pair(&id);
+            filter.insert(h1, h2);
+        }
+
+        let false_positives = ids(10_000..110_000)
+            .filter(|id| {
+                let (h1, h2) = hash_pair(id);
+                filter.contains(h1, h2)
+            })
+            .count();
+        // about 1000 expected
+        assert!(false_positives < 1_500, "{}", false_positives);
+    }
+
+    #[test]
+    fn test_bloom_filter_positions() {
+        let filter = BloomFilter::new(10_000, 1e-6);
+        assert_eq!(filter.n_hashes, 20);
+
+        for (h1, h2) in [(u64::MAX, u64::MAX), (7, 0), (7, filter.n_bits)] {
+            let positions = filter.positions(h1, h2).collect::<Vec<_>>();
+            assert_eq!(positions.len(), 20);
+            assert!(positions.iter().all(|&bit| bit < filter.n_bits));
+            // a step that reduces to zero still spreads the probes
+            let distinct = positions.iter().collect::<HashSet<_>>();
+            assert_eq!(distinct.len(), 20);
+        }
+    }
+}
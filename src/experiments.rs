@@ -0,0 +1,573 @@
+//! Inverted index of experiment enrollment: for every experiment and branch,
+//! the bitmap of the rows of a column enrolled in it. Lookups and
+//! intersections across experiments are bitmap operations, with no JSON
+//! parsed after the index is built.
+use polars::export::arrow::array::{Array, ListArray, StructArray, Utf8Array};
+use polars::export::arrow::compute::cast::{cast, CastOptions};
+use polars::export::arrow::datatypes::DataType as ArrowDataType;
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use pyo3::types::PyBytes;
+use pyo3_polars::PySeries;
+use rayon::prelude::*;
+use roaring::RoaringBitmap;
+use serde::Deserialize;
+use std::borrow::Cow;
+use std::collections::HashMap;
+
+/// Rows indexed per unit of parallel work, each block builds its own
+/// bitmaps and blocks are merged with unions
+const BLOCK_ROWS: usize = 65_536;
+
+/// Leading byte of a serialized index, bumped if the layout ever changes
+const SERIAL_VERSION: u8 = 1;
+
+type Branches = HashMap<String, HashMap<String, RoaringBitmap>>;
+
+/// Only the parts of a Glean experiments payload the index needs, strings
+/// are borrowed from the row unless they hold escapes
+#[derive(Deserialize)]
+struct Enrollments<'a> {
+    #[serde(borrow)]
+    experiments: Vec<Enrollment<'a>>,
+}
+
+#[derive(Deserialize)]
+struct Enrollment<'a> {
+    #[serde(borrow)]
+    key: Cow<'a, str>,
+    #[serde(borrow)]
+    value: Option<EnrollmentBranch<'a>>,
+}
+
+#[derive(Deserialize)]
+struct EnrollmentBranch<'a> {
+    #[serde(borrow)]
+    branch: Option<Cow<'a, str>>,
+}
+
+/// Set of row numbers, the result of a lookup in an ExperimentIndex
+#[pyclass(name = "RowSet")]
+#[derive(Clone, Debug, Default, PartialEq)]
+pub struct RowSet {
+    rows: RoaringBitmap,
+}
+
+#[pymethods]
+impl RowSet {
+    /// Row numbers in increasing order
+    fn to_list(&self) -> Vec<u32> {
+        self.rows.iter().collect()
+    }
+
+    fn __len__(&self) -> usize {
+        self.rows.len() as usize
+    }
+
+    fn __contains__(&self, row: u32) -> bool {
+        self.rows.contains(row)
+    }
+
+    fn __and__(&self, other: PyRef<RowSet>) -> RowSet {
+        RowSet {
+            rows: &self.rows & &other.rows,
+        }
+    }
+
+    fn __or__(&self, other: PyRef<RowSet>) -> RowSet {
+        RowSet {
+            rows: &self.rows | &other.rows,
+        }
+    }
+
+    fn __sub__(&self, other: PyRef<RowSet>) -> RowSet {
+        RowSet {
+            rows: &self.rows - &other.rows,
+        }
+    }
+
+    fn __repr__(&self) -> String {
+        format!("RowSet(len={})", self.rows.len())
+    }
+}
+
+/// Experiment key -> branch -> rows of an experiments column
+#[pyclass(name = "ExperimentIndex")]
+#[derive(Clone, Debug, Default, PartialEq)]
+pub struct ExperimentIndex {
+    n_rows: u32,
+    branches: Branches,
+}
+
+impl ExperimentIndex {
+    /// Indexes a column of Glean experiments, either JSON strings of
+    /// `{"experiments": [{"key": .., "value": {"branch": ..}}]}` or the
+    /// list<struct<key, value: struct<branch, ..>>> of the ping tables.
+    /// Null rows and enrollments without a branch are left out.
+    pub fn from_series(s: &Series) -> PolarsResult<Self> {
+        let n_rows = u32::try_from(s.len())
+            .map_err(|_| PolarsError::ComputeError("cannot index more than 2^32 rows".into()))?;
+
+        let branches = match s.dtype() {
+            DataType::Utf8 => {
+                let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+                index_rows(rows.len(), 0, |i, add| {
+                    let row = match rows[i] {
+                        Some(row) => row,
+                        None => return Ok(()),
+                    };
+                    let enrollments: Enrollments = serde_json::from_str(row).map_err(|e| {
+                        PolarsError::ComputeError(
+                            format!("row {} is not a Glean experiments payload: {}", i, e).into(),
+                        )
+                    })?;
+                    for enrollment in &enrollments.experiments {
+                        let branch = enrollment.value.as_ref().and_then(|v| v.branch.as_ref());
+                        if let Some(branch) = branch {
+                            add(&*enrollment.key, &**branch);
+                        }
+                    }
+                    Ok(())
+                })?
+            }
+            DataType::List(_) => {
+                let mut branches = Branches::new();
+                let mut offset = 0;
+                for arr in s.list()?.downcast_iter() {
+                    merge(&mut branches, index_list_array(arr, offset)?);
+                    offset += arr.len() as u32;
+                }
+                branches
+            }
+            dt => {
+                return Err(PolarsError::ComputeError(
+                    format!("cannot index experiments stored as {:?}", dt).into(),
+                ))
+            }
+        };
+
+        Ok(ExperimentIndex { n_rows, branches })
+    }
+
+    /// Rows enrolled in a branch of an experiment, or in any of its
+    /// branches when `branch` is None
+    pub fn rows_of(&self, experiment: &str, branch: Option<&str>) -> RoaringBitmap {
+        let branches = match self.branches.get(experiment) {
+            Some(branches) => branches,
+            None => return RoaringBitmap::new(),
+        };
+
+        match branch {
+            Some(branch) => branches.get(branch).cloned().unwrap_or_default(),
+            None => branches
+                .values()
+                .fold(RoaringBitmap::new(), |all, rows| all | rows),
+        }
+    }
+
+    /// Rows in every one of the (experiment, branch) selections, smallest
+    /// first so each step shrinks the result. Every row when there are none.
+    pub fn intersection(&self, selections: &[(&str, Option<&str>)]) -> RoaringBitmap {
+        let mut sets = selections
+            .iter()
+            .map(|(experiment, branch)| self.rows_of(experiment, *branch))
+            .collect::<Vec<_>>();
+        sets.sort_by_key(|rows| rows.len());
+
+        let mut sets = sets.into_iter();
+        let first = match sets.next() {
+            Some(first) => first,
+            None => return (0..self.n_rows).collect(),
+        };
+        sets.fold(first, |all, rows| all & rows)
+    }
+
+    /// Version, row count, then every experiment and branch in sorted order
+    /// with its bitmap in the portable roaring format. Lengths and counts are
+    /// little endian u32.
+    pub fn serialize(&self) -> Vec<u8> {
+        let mut data = vec![SERIAL_VERSION];
+        data.extend_from_slice(&self.n_rows.to_le_bytes());
+        data.extend_from_slice(&(self.branches.len() as u32).to_le_bytes());
+
+        for experiment in sorted_keys(&self.branches) {
+            let branches = &self.branches[experiment];
+            write_str(&mut data, experiment);
+            data.extend_from_slice(&(branches.len() as u32).to_le_bytes());
+            for branch in sorted_keys(branches) {
+                let rows = &branches[branch];
+                write_str(&mut data, branch);
+                data.extend_from_slice(&(rows.serialized_size() as u32).to_le_bytes());
+                rows.serialize_into(&mut data).unwrap();
+            }
+        }
+
+        data
+    }
+
+    pub fn deserialize(data: &[u8]) -> Result<Self, String> {
+        let mut reader = match data {
+            [SERIAL_VERSION, rest @ ..] => rest,
+            _ => return Err("not a serialized ExperimentIndex".to_string()),
+        };
+        let n_rows = read_u32(&mut reader)?;
+
+        let mut branches = Branches::new();
+        for _ in 0..read_u32(&mut reader)? {
+            let experiment = read_str(&mut reader)?;
+            let mut experiment_branches = HashMap::new();
+            for _ in 0..read_u32(&mut reader)? {
+                let branch = read_str(&mut reader)?;
+                let len = read_u32(&mut reader)? as usize;
+                let rows = RoaringBitmap::deserialize_from(take(&mut reader, len)?)
+                    .map_err(|e| e.to_string())?;
+                experiment_branches.insert(branch, rows);
+            }
+            branches.insert(experiment, experiment_branches);
+        }
+
+        if !reader.is_empty() {
+            return Err(format!("{} trailing bytes", reader.len()));
+        }
+
+        Ok(ExperimentIndex { n_rows, branches })
+    }
+}
+
+#[pymethods]
+impl ExperimentIndex {
+    /// Indexes a polars Series of Glean experiments, in parallel and
+    /// without the GIL. See from_series for the column types.
+    #[staticmethod]
+    fn from_column(py: Python, column: PySeries) -> PyResult<Self> {
+        let s: Series = column.into();
+
+        py.allow_threads(|| ExperimentIndex::from_series(&s))
+            .map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+
+    /// Rows in the indexed column
+    #[getter]
+    fn n_rows(&self) -> u32 {
+        self.n_rows
+    }
+
+    /// Every experiment with at least one enrolled row, sorted
+    fn experiments(&self) -> Vec<String> {
+        sorted_keys(&self.branches).cloned().collect()
+    }
+
+    /// Branches of an experiment with at least one enrolled row, sorted
+    fn branches(&self, experiment: &str) -> Vec<String> {
+        match self.branches.get(experiment) {
+            Some(branches) => sorted_keys(branches).cloned().collect(),
+            None => vec![],
+        }
+    }
+
+    /// Rows enrolled in the branch of the experiment, or in any branch
+    fn rows(&self, experiment: &str, branch: Option<&str>) -> RowSet {
+        RowSet {
+            rows: self.rows_of(experiment, branch),
+        }
+    }
+
+    /// Rows enrolled in all of a list of (experiment, branch) pairs, branch
+    /// can be None for any branch
+    fn intersect(&self, py: Python, selections: Vec<(&str, Option<&str>)>) -> RowSet {
+        let rows = py.allow_threads(|| self.intersection(&selections));
+
+        RowSet { rows }
+    }
+
+    /// Enrolled rows of every experiment and branch
+    fn counts(&self) -> HashMap<String, HashMap<String, u64>> {
+        self.branches
+            .iter()
+            .map(|(experiment, branches)| {
+                let counts = branches
+                    .iter()
+                    .map(|(branch, rows)| (branch.clone(), rows.len()))
+                    .collect();
+                (experiment.clone(), counts)
+            })
+            .collect()
+    }
+
+    fn to_bytes<'py>(&self, py: Python<'py>) -> &'py PyBytes {
+        PyBytes::new(py, &self.serialize())
+    }
+
+    #[staticmethod]
+    fn from_bytes(data: &[u8]) -> PyResult<Self> {
+        ExperimentIndex::deserialize(data).map_err(PyValueError::new_err)
+    }
+
+    fn __reduce__(&self, py: Python) -> PyResult<(PyObject, (PyObject,))> {
+        let from_bytes = py.get_type::<ExperimentIndex>().getattr("from_bytes")?;
+
+        Ok((from_bytes.into(), (self.to_bytes(py).into(),)))
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "ExperimentIndex(n_rows={}, experiments={})",
+            self.n_rows,
+            self.branches.len()
+        )
+    }
+}
+
+/// Indexes n_rows rows in parallel blocks, as row numbers from `offset` on.
+/// `enrollments` hands every (experiment, branch) of row i to `add`.
+fn index_rows<F>(n_rows: usize, offset: u32, enrollments: F) -> PolarsResult<Branches>
+where
+    F: Fn(usize, &mut dyn FnMut(&str, &str)) -> PolarsResult<()> + Sync,
+{
+    let n_blocks = (n_rows + BLOCK_ROWS - 1) / BLOCK_ROWS;
+
+    (0..n_blocks)
+        .into_par_iter()
+        .map(|block| -> PolarsResult<Branches> {
+            let mut branches = Branches::new();
+            for i in block * BLOCK_ROWS..n_rows.min((block + 1) * BLOCK_ROWS) {
+                enrollments(i, &mut |experiment, branch| {
+                    insert(&mut branches, experiment, branch, offset + i as u32)
+                })?;
+            }
+            Ok(branches)
+        })
+        .try_reduce(Branches::new, |mut all, block| {
+            merge(&mut all, block);
+            Ok(all)
+        })
+}
+
+/// Rows arrive in increasing order within a block, so they are appended
+fn insert(branches: &mut Branches, experiment: &str, branch: &str, row: u32) {
+    // look up before inserting, to only allocate keys the first time
+    if !branches.contains_key(experiment) {
+        branches.insert(experiment.to_string(), HashMap::new());
+    }
+    let experiment_branches = branches.get_mut(experiment).unwrap();
+    if !experiment_branches.contains_key(branch) {
+        experiment_branches.insert(branch.to_string(), RoaringBitmap::new());
+    }
+    let rows = experiment_branches.get_mut(branch).unwrap();
+    if !rows.push(row) {
+        // an experiment listed twice in one row
+        rows.insert(row);
+    }
+}
+
+fn merge(all: &mut Branches, other: Branches) {
+    for (experiment, branches) in other {
+        let all_branches = all.entry(experiment).or_default();
+        for (branch, rows) in branches {
+            *all_branches.entry(branch).or_default() |= rows;
+        }
+    }
+}
+
+/// Reads list<struct<key, value: struct<branch>>> rows straight from the
+/// Arrow buffers, row numbers start at `offset`
+fn index_list_array(arr: &ListArray<i64>, offset: u32) -> PolarsResult<Branches> {
+    let enrollments = downcast_struct(arr.values().as_ref())?;
+    let keys = utf8_child(enrollments, "key")?;
+    let values = downcast_struct(struct_field(enrollments, "value")?)?;
+    let branches = utf8_child(values, "branch")?;
+    let keys = keys.as_any().downcast_ref::<Utf8Array<i64>>().unwrap();
+    let branches = branches.as_any().downcast_ref::<Utf8Array<i64>>().unwrap();
+    let offsets = arr.offsets().as_slice();
+
+    index_rows(arr.len(), offset, |i, add| {
+        if !arr.is_valid(i) {
+            return Ok(());
+        }
+        for j in offsets[i] as usize..offsets[i + 1] as usize {
+            if keys.is_valid(j) && branches.is_valid(j) && values.is_valid(j) {
+                add(keys.value(j), branches.value(j));
+            }
+        }
+        Ok(())
+    })
+}
+
+fn downcast_struct(arr: &dyn Array) -> PolarsResult<&StructArray> {
+    arr.as_any().downcast_ref::<StructArray>().ok_or_else(|| {
+        PolarsError::ComputeError("expected list<struct<key, value: struct<branch>>>".into())
+    })
+}
+
+fn struct_field<'a>(arr: &'a StructArray, name: &str) -> PolarsResult<&'a dyn Array> {
+    arr.fields()
+        .iter()
+        .position(|field| field.name == name)
+        .map(|i| arr.values()[i].as_ref())
+        .ok_or_else(|| {
+            PolarsError::ComputeError(format!("no {} field in experiments", name).into())
+        })
+}
+
+fn utf8_child(arr: &StructArray, name: &str) -> PolarsResult<Box<dyn Array>> {
+    Ok(cast(
+        struct_field(arr, name)?,
+        &ArrowDataType::LargeUtf8,
+        CastOptions::default(),
+    )?)
+}
+
+fn sorted_keys<V>(map: &HashMap<String, V>) -> impl Iterator<Item = &String> {
+    let mut keys = map.keys().collect::<Vec<_>>();
+    keys.sort();
+    keys.into_iter()
+}
+
+fn write_str(data: &mut Vec<u8>, s: &str) {
+    data.extend_from_slice(&(s.len() as u32).to_le_bytes());
+    data.extend_from_slice(s.as_bytes());
+}
+
+fn take<'a>(reader: &mut &'a [u8], len: usize) -> Result<&'a [u8], String> {
+    if reader.len() < len {
+        return Err("truncated ExperimentIndex".to_string());
+    }
+    let (head, rest) = reader.split_at(len);
+    *reader = rest;
+
+    Ok(head)
+}
+
+fn read_u32(reader: &mut &[u8]) -> Result<u32, String> {
+    let bytes = take(reader, 4)?;
+
+    Ok(u32::from_le_bytes(bytes.try_into().unwrap()))
+}
+
+fn read_str(reader: &mut &[u8]) -> Result<String, String> {
+    let len = read_u32(reader)? as usize;
+
+    String::from_utf8(take(reader, len)?.to_vec()).map_err(|e| e.to_string())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn payload(enrollments: &[(&str, &str)]) -> String {
+        let experiments = enrollments
+            .iter()
+            .map(|(key, branch)| {
+                format!(
+                    r#"{{"key": "{}", "value": {{"branch": "{}", "extra": {{"type": "nimbus"}}}}}}"#,
+                    key, branch
+                )
+            })
+            .collect::<Vec<_>>();
+        format!(r#"{{"experiments": [{}]}}"#, experiments.join(", "))
+    }
+
+    fn json_index() -> ExperimentIndex {
+        let rows = (0..200_000)
+            .map(|i| match i % 4 {
+                0 => Some(payload(&[("a", "control"), ("b", "treatment")])),
+                1 => Some(payload(&[("a", "treatment")])),
+                2 => Some(payload(&[])),
+                _ => None,
+            })
+            .collect::<Vec<_>>();
+
+        ExperimentIndex::from_series(&Series::new("experiments", rows)).unwrap()
+    }
+
+    #[test]
+    fn test_lookups() {
+        let index = json_index();
+
+        assert_eq!(index.n_rows, 200_000);
+        assert_eq!(index.rows_of("a", Some("control")).len(), 50_000);
+        assert_eq!(index.rows_of("a", None).len(), 100_000);
+        assert!(index.rows_of("a", Some("treatment")).contains(199_997));
+        assert!(index.rows_of("c", None).is_empty());
+
+        let both = index.intersection(&[("b", None), ("a", Some("control"))]);
+        assert_eq!(both, index.rows_of("b", Some("treatment")));
+        assert!(index
+            .intersection(&[("a", Some("treatment")), ("b", None)])
+            .is_empty());
+        assert_eq!(index.intersection(&[]).len(), 200_000);
+
+        let bad = Series::new("experiments", &[Some("{}")]);
+        assert!(ExperimentIndex::from_series(&bad).is_err());
+    }
+
+    #[test]
+    fn test_enrollments_without_branch() {
+        let rows = Series::new(
+            "experiments",
+            &[
+                r#"{"experiments": [{"key": "a", "value": {"branch": null}},
+                                    {"key": "b", "value": {"branch": "control"}}]}"#,
+                r#"{"experiments": [{"key": "a", "value": {}}, {"key": "b", "value": null}]}"#,
+                r#"{"experiments": [{"key": "a", "value": {"branch": "treatment"}}]}"#,
+            ],
+        );
+        let index = ExperimentIndex::from_series(&rows).unwrap();
+
+        assert_eq!(index.n_rows, 3);
+        assert_eq!(index.rows_of("a", None).iter().collect::<Vec<_>>(), vec![2]);
+        assert_eq!(index.rows_of("b", None).iter().collect::<Vec<_>>(), vec![0]);
+    }
+
+    #[test]
+    fn test_struct_column() {
+        let enrollment = |keys: &[&str], branches: &[&str]| {
+            let value = StructChunked::new("value", &[Series::new("branch", branches)])
+                .unwrap()
+                .into_series();
+            StructChunked::new("", &[Series::new("key", keys), value])
+                .unwrap()
+                .into_series()
+        };
+        let mut s = Series::new(
+            "experiments",
+            &[
+                enrollment(&["a", "b"], &["control", "treatment"]),
+                enrollment(&["a"], &["treatment"]),
+            ],
+        );
+        // a second chunk, so row numbers have to carry over
+        s.append(&Series::new(
+            "experiments",
+            &[enrollment(&["b"], &["control"])],
+        ))
+        .unwrap();
+
+        let index = ExperimentIndex::from_series(&s).unwrap();
+
+        assert_eq!(index.n_rows, 3);
+        assert_eq!(
+            index.rows_of("a", None).iter().collect::<Vec<_>>(),
+            vec![0, 1]
+        );
+        assert_eq!(
+            index
+                .rows_of("b", Some("control"))
+                .iter()
+                .collect::<Vec<_>>(),
+            vec![2]
+        );
+    }
+
+    #[test]
+    fn test_serialize() {
+        let index = json_index();
+        let data = index.serialize();
+
+        assert_eq!(ExperimentIndex::deserialize(&data).unwrap(), index);
+        assert_eq!(index.serialize(), data);
+        assert!(ExperimentIndex::deserialize(&data[..data.len() - 1]).is_err());
+        assert!(ExperimentIndex::deserialize(&[0]).is_err());
+    }
+}
@@ -1,13 +1,111 @@
-use crate::hist::{parse_main_histograms, parse_metadata_json};
+use crate::dedup::{Deduplicator, DEFAULT_FALSE_POSITIVE_RATE};
+use crate::hist::{
+    parse_list_histograms, parse_main_histograms, parse_metadata_json, HistogramMetaData,
+};
+use crate::norm::normalize_os;
+use crate::sketch::{hash_client_id, HyperLogLog};
+use crate::spill::SpillStore;
 use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3_polars::PyDataFrame;
+use rand::rngs::SmallRng;
+use rand::{Rng, SeedableRng};
+use rayon::prelude::*;
+use serde::{Deserialize, Serialize};
 use std::hash::Hash;
 use std::ops::AddAssign;
-use std::{
-    collections::{HashMap, HashSet},
-    str::FromStr,
-};
+use std::time::Instant;
+use std::{collections::HashMap, str::FromStr};
+
+/// Optional behaviour of the GLAM aggregation, passed from Python as JSON
+#[derive(Deserialize, Default)]
+#[serde(default, deny_unknown_fields)]
+pub struct GlamOptions {
+    /// Each row is already the sum of a client's pings for its build, as
+    /// produced by the query, so there is no client level grouping to do
+    pub client_aggregated: bool,
+    /// Fraction of clients the query sampled, set for approximate results.
+    /// n_reporting is scaled back up by it and standard errors are reported
+    pub sample_rate: Option<f64>,
+    /// Dimensions to slice by, build_id when empty. os is normalized like
+    /// norm_normalize_os
+    pub group_by: Vec<String>,
+    /// Also produce every rollup of the group_by dimensions, with "*"
+    /// standing for all values of a rolled up dimension
+    pub rollups: bool,
+    /// Bytes of per client histograms to hold in memory, past which they
+    /// are spilled to disk. Unset keeps everything in memory
+    pub memory_budget: Option<usize>,
+    /// Directory for the spill files, the system temp dir by default
+    pub spill_dir: Option<String>,
+    /// Column of document ids, e.g. document_id. Rows with an id already
+    /// seen are dropped before aggregating, so retried pings count once
+    pub dedup_column: Option<String>,
+    /// Bytes of document ids held exactly, past which they go into a
+    /// scalable Bloom filter. 256MB by default
+    pub dedup_memory_budget: Option<usize>,
+    /// Overall false positive rate of that Bloom filter, 1e-6 by default
+    pub dedup_false_positive_rate: Option<f64>,
+}
+
+/// Default GlamOptions::dedup_memory_budget
+const DEDUP_MEMORY_BUDGET: usize = 256 << 20;
+
+/// Where a GLAM aggregation spent its time and memory. Collected on every
+/// run, it is a handful of clock reads per client, and returned to Python
+/// on request. Memory figures are mimalloc's view of the whole process.
+#[derive(Serialize, Default, Debug)]
+pub struct GlamStats {
+    pub rows: usize,
+    pub clients: usize,
+    pub builds: usize,
+    pub bytes_parsed: usize,
+    pub spilled_bytes: usize,
+    pub duplicate_rows: usize,
+    pub approximate_duplicate_rows: usize,
+    pub dedup_seconds: f64,
+    pub partition_seconds: f64,
+    pub parse_seconds: f64,
+    pub client_aggregation_seconds: f64,
+    pub build_aggregation_seconds: f64,
+    pub dirichlet_seconds: f64,
+    pub total_seconds: f64,
+    pub commit_delta_bytes: i64,
+    pub peak_commit_bytes: usize,
+    pub peak_rss_bytes: usize,
+}
+
+/// (current commit, peak commit, peak rss) in bytes, from mimalloc
+fn process_memory() -> (usize, usize, usize) {
+    let (mut elapsed, mut user, mut system) = (0usize, 0usize, 0usize);
+    let (mut current_rss, mut peak_rss) = (0usize, 0usize);
+    let (mut current_commit, mut peak_commit, mut page_faults) = (0usize, 0usize, 0usize);
+
+    unsafe {
+        libmimalloc_sys::mi_process_info(
+            &mut elapsed,
+            &mut user,
+            &mut system,
+            &mut current_rss,
+            &mut peak_rss,
+            &mut current_commit,
+            &mut peak_commit,
+            &mut page_faults,
+        );
+    }
+
+    (current_commit, peak_commit, peak_rss)
+}
+
+/// A build's GLAM histogram, along with what is needed to judge its
+/// precision when it was computed from a client sample
+struct BuildHistogram {
+    build_id: String,
+    n_reporting: f64,
+    histogram: Vec<(usize, f64)>,
+    standard_errors: Option<HashMap<usize, f64>>,
+}
 
 enum Distribution {
     TimingDistribution,
@@ -58,31 +156,65 @@ fn sample_to_bucket_idx(sample: f64, log_base: f64, buckets_per_magnitude: f64)
     f64::ceil((sample + 1.0).ln() / exponent.ln()) as usize
 }
 
-fn generate_functional_buckets(
-    log_base: usize,
-    buckets_per_magnitude: usize,
+/// Keys are clamped below 2^40 when histograms are parsed, so a layout up to
+/// it covers every build
+const FUNCTIONAL_RANGE_MAX: usize = 1 << 40;
+
+/// Buckets of a Glean functional distribution (timing and memory). Bucket
+/// `idx` has the minimum floor(log_base^(idx / buckets_per_magnitude)), low
+/// indices share minimums, so `minimums` holds them sorted and distinct,
+/// after the 0 bucket, and `positions` maps every index to its minimum.
+struct FunctionalBuckets {
+    log_base: f64,
+    buckets_per_magnitude: f64,
     range_max: usize,
-) -> Vec<usize> {
-    let mut buckets = HashSet::new();
-    buckets.insert(0);
+    minimums: Vec<usize>,
+    positions: Vec<usize>,
+}
 
-    let max_bucket_id = sample_to_bucket_idx(
-        range_max as f64,
-        log_base as f64,
-        buckets_per_magnitude as f64,
-    );
+impl FunctionalBuckets {
+    /// Every bucket whose minimum is below range_max
+    fn new(log_base: f64, buckets_per_magnitude: f64, range_max: usize) -> Self {
+        let max_bucket_id = sample_to_bucket_idx(range_max as f64, log_base, buckets_per_magnitude);
+        let mut minimums = vec![0];
+        let mut positions = Vec::with_capacity(max_bucket_id);
 
-    for idx in 0..max_bucket_id {
-        let bucket =
-            f64::powf(log_base as f64, idx as f64 / buckets_per_magnitude as f64).floor() as usize;
-        if bucket < range_max {
-            buckets.insert(bucket);
-        } else {
-            break;
+        // minimums never decrease with the index, so repeats are neighbours
+        for idx in 0..max_bucket_id {
+            let bucket = f64::powf(log_base, idx as f64 / buckets_per_magnitude).floor() as usize;
+            if bucket >= range_max {
+                break;
+            }
+            if bucket != *minimums.last().unwrap() {
+                minimums.push(bucket);
+            }
+            positions.push(minimums.len() - 1);
+        }
+
+        FunctionalBuckets {
+            log_base,
+            buckets_per_magnitude,
+            range_max,
+            minimums,
+            positions,
         }
     }
 
-    Vec::from_iter(buckets)
+    /// Where `bucket` is in `minimums`, or None if it is not a bucket
+    /// minimum. The first index with that minimum is
+    /// ceil(buckets_per_magnitude * log(bucket) / log(log_base)), the float
+    /// estimate of it can be one off either way.
+    fn position(&self, bucket: usize) -> Option<usize> {
+        if bucket == 0 {
+            return Some(0);
+        }
+        let estimate = (self.buckets_per_magnitude * (bucket as f64).ln() / self.log_base.ln())
+            .ceil() as usize;
+
+        (estimate.saturating_sub(1)..=estimate + 1)
+            .filter_map(|idx| self.positions.get(idx).copied())
+            .find(|p| self.minimums[*p] == bucket)
+    }
 }
 
 fn generate_exponential_buckets(
@@ -124,122 +256,805 @@ fn generate_linear_buckets(min: usize, max: usize, n_buckets: usize) -> Vec<usiz
     result
 }
 
-// Converts histogram into Vec<k, v> sorted by k
-// Necessary to make calculating percentile less painful
-fn hist_to_normed_sorted(hist: &HashMap<usize, f64>) -> Vec<(usize, f64)> {
-    let total = hist.values().sum::<f64>().round();
+/// Bucket layout of a probe, worked out once per aggregation rather than
+/// for every build
+enum BucketLayout {
+    /// Glean distributions, each build is filled in up to its largest key
+    Functional(FunctionalBuckets),
+    /// Legacy custom distributions, sorted and distinct
+    Fixed(Vec<usize>),
+}
 
-    let mut normalized: Vec<(usize, f64)> = hist
+impl BucketLayout {
+    /// buckets_for_probe is the three int group that describes the input
+    /// arguments for legacy distributions: \[min, max, n\_buckets].
+    /// Glean distributions are predefined based on the type of histogram as
+    /// defined in Glean: \[log\_base, buckets\_per\_magnitude]
+    fn new(histogram_metadata: &HistogramMetaData) -> Result<Self, String> {
+        let positional = &histogram_metadata.buckets_for_probe;
+        let mut buckets = match Distribution::from_str(&histogram_metadata.histogram_type) {
+            Ok(Distribution::TimingDistribution) => {
+                return Ok(BucketLayout::Functional(FunctionalBuckets::new(
+                    2.0,
+                    8.0,
+                    FUNCTIONAL_RANGE_MAX,
+                )))
+            }
+            Ok(Distribution::MemoryDistribution) => {
+                return Ok(BucketLayout::Functional(FunctionalBuckets::new(
+                    2.0,
+                    16.0,
+                    FUNCTIONAL_RANGE_MAX,
+                )))
+            }
+            Ok(Distribution::CustomDistributionExponential) => {
+                generate_exponential_buckets(positional[0], positional[1], positional[2])
+            }
+            Ok(Distribution::CustomDistributionLinear) => {
+                generate_linear_buckets(positional[0], positional[1], positional[2])
+            }
+            _ => return Err("Invalid Histogram Type".to_string()),
+        };
+        buckets.sort_unstable();
+        buckets.dedup();
+
+        Ok(BucketLayout::Fixed(buckets))
+    }
+
+    /// GLAM histogram of a build from the sum of its normalized client
+    /// histograms, sorted by bucket.
+    ///
+    /// The sum of all values across all buckets equals the number reporting,
+    /// a handy coincidence of normalizing at the per client level. Every
+    /// bucket of the layout is filled in and the Dirichlet estimator applied:
+    /// given {k1: p1, k2: p2}, return {k1: (p1 + 1/K) / n_reporting,
+    /// k2: (p2 + 1/K) / n_reporting} where K counts the buckets. The result
+    /// is normalized once more to sum to 1.
+    fn dirichlet_histogram(
+        &self,
+        hist: HashMap<usize, f64>,
+        n_reporting: f64,
+    ) -> Vec<(usize, f64)> {
+        match self {
+            BucketLayout::Functional(functional) => {
+                let range_max = hist.keys().max().copied().unwrap_or(0);
+                if range_max > functional.range_max {
+                    let wider = FunctionalBuckets::new(
+                        functional.log_base,
+                        functional.buckets_per_magnitude,
+                        range_max,
+                    );
+                    return BucketLayout::Functional(wider).dirichlet_histogram(hist, n_reporting);
+                }
+                let filled = functional.minimums.partition_point(|b| *b < range_max);
+
+                dirichlet_estimator(&functional.minimums[..filled], hist, n_reporting, |k| {
+                    functional.position(k).filter(|p| *p < filled)
+                })
+            }
+            BucketLayout::Fixed(buckets) => dirichlet_estimator(buckets, hist, n_reporting, |k| {
+                buckets.binary_search(&k).ok()
+            }),
+        }
+    }
+}
+
+/// Dirichlet estimator over `buckets`, plus any key of `hist` that is not
+/// one of them. Values are held densely by bucket position, `position` maps
+/// a key to it, so only the populated buckets are looked up.
+fn dirichlet_estimator<F>(
+    buckets: &[usize],
+    hist: HashMap<usize, f64>,
+    n_reporting: f64,
+    position: F,
+) -> Vec<(usize, f64)>
+where
+    F: Fn(usize) -> Option<usize>,
+{
+    let mut dense = vec![0f64; buckets.len()];
+    let mut extra = Vec::new();
+
+    for (k, v) in hist {
+        match position(k) {
+            Some(p) => dense[p] += v,
+            None => extra.push((k, v)),
+        }
+    }
+
+    let k = (buckets.len() + extra.len()) as f64;
+    let mut histogram: Vec<(usize, f64)> = buckets
         .iter()
-        .map(|(k, v)| (*k, *v / total))
+        .copied()
+        .zip(dense)
+        .chain(extra)
+        .map(|(b, v)| (b, (v + 1.0 / k) / n_reporting))
         .collect();
+    // only keys off the layout are out of order
+    histogram.sort_by_key(|x| x.0);
 
-    normalized.sort_by(|a, b| a.0.partial_cmp(&b.0).unwrap());
+    let total = histogram.iter().map(|x| x.1).sum::<f64>().round();
+    histogram.iter_mut().for_each(|x| x.1 /= total);
 
-    normalized
+    histogram
 }
 
-// fn count_users(hist: &HashMap<usize, f64>) -> usize {
-//     // this is a neat trick; because all of the client histograms sum to
-//     // one, you can just sum the values to get N_reporting
-//     hist.values().sum::<f64>().round() as usize
-// }
+/// HistogramMetaData from its JSON, malformed metadata is a ValueError
+fn parse_metadata(histogram_metadata: &str) -> PyResult<HistogramMetaData> {
+    parse_metadata_json(histogram_metadata)
+        .map_err(|e| PyValueError::new_err(format!("invalid histogram metadata: {}", e)))
+}
+
+/// GlamOptions from their JSON, the defaults when there is none
+fn parse_options(options: Option<&str>) -> PyResult<GlamOptions> {
+    options
+        .map(serde_json::from_str)
+        .transpose()
+        .map(Option::unwrap_or_default)
+        .map_err(|e| PyValueError::new_err(format!("invalid GLAM options: {}", e)))
+}
 
-/// Operates on a single histogram.
-/// The histogram is filled at this point, can take K from length (total buckets)
-/// -- Dirichlet distribution density for each bucket in a histogram.
-/// -- Given {k1: p1,k2:p2} where p’s are proportions(and p1, p2 sum to 1)
-/// -- return {k1: (P1+1/K) / (nreporting+1), k2:(P2+1/K) / (nreporting+1)}
-fn transform_to_dirichlet_estimator(hist: &mut HashMap<usize, f64>, n_reporting: f64) {
-    let k = hist.len() as f64;
+/// Builds the GLAM histogram for every build in the frame. The GIL is
+/// released while aggregating, so fetches of other partitions (or other
+/// aggregations) can proceed from Python threads.
+#[pyfunction]
+pub fn glam_style_histogram(
+    py: Python,
+    pydf: PyDataFrame,
+    histogram_metadata: String,
+    options: Option<String>,
+) -> PyResult<Vec<(String, Vec<(usize, f64)>)>> {
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let options = parse_options(options.as_deref())?;
+    let data: DataFrame = pydf.into();
 
-    hist.iter_mut()
-        .for_each(|(_, v)| *v = (*v + 1.0f64 / k) / n_reporting);
+    py.allow_threads(|| glam_histograms(data, &histogram_metadata, &options))
+        .map_err(|e| PyValueError::new_err(e.to_string()))
 }
 
-fn fill_buckets(hist: &mut HashMap<usize, f64>, buckets: &[usize]) {
-    buckets.iter().for_each(|x| {
-        hist.entry(*x).or_insert(0f64);
-    });
+/// glam_style_histogram that also returns a JSON GlamStats of the run
+#[pyfunction]
+pub fn glam_style_histogram_profiled(
+    py: Python,
+    pydf: PyDataFrame,
+    histogram_metadata: String,
+    options: Option<String>,
+) -> PyResult<(Vec<(String, Vec<(usize, f64)>)>, String)> {
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let options = parse_options(options.as_deref())?;
+    let data: DataFrame = pydf.into();
+    let mut stats = GlamStats::default();
+
+    let builds = py
+        .allow_threads(|| glam_build_histograms(data, &histogram_metadata, &options, &mut stats))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+    let results = builds
+        .into_iter()
+        .map(|build| (build.build_id, build.histogram))
+        .collect();
+
+    Ok((results, serde_json::to_string(&stats).unwrap()))
 }
 
-/// Positional arguments are from the three int group that describes the
-/// input arguments for both glean and ffdesktop distributions
-/// \[int1, int2, int3] can represent either:
-/// Glean: \[log\_base, buckets\_per\_magnitude, max\_buckets]
-/// Legacy: \[min, max, n\_buckets]
-/// These are distinct sets, and the Glean set are predefined based on the type
-/// of histogram as defined in Glean
-fn calculate_dirichlet_distribution(
-    histogram_vector: HashMap<usize, f64>,
-    histogram_type: String,
-    n_reporting: f64,
-    positional_zero: usize,
-    positional_one: usize,
-    positional_two: usize,
-) -> Result<HashMap<usize, f64>, String> {
-    // 1. aggregate client level histograms <- per client level
-    // client_id || [bucket: sum, bucket: sum...]
-    //
-    // 2. normalize such that sum(values) = 1
-    // client_id || [bucket: sum/total, bucket: sum/total...]
-    //
-    // 3. add all the normalized values together such that each bucket now sums
-    // all of the normalized per-client values
-    // [bucket: [u1_normalized, u2_normalized, ...]
-    //
-    // 4. the total sum of all values accross all buckets  equals the number reporting,
-    // a handy coincidence of normalizing at the per client level
-    //
-    // 5. for every bucket that has a value, calculate the dirichelt approx transformation
-    // using N_reporting from 4
-    //
-    // 6.generate the array of all bucket values we need to fill in and
-    // add the dirichlet transfromed value (5) to the appropriate bucket
-    //
-    let mut hist = histogram_vector; // when we take the dictionary in from Python,
-                                     // we probably cannot take it as a reference
-
-    // assuming at this point I have aggregated, normalized histograms
-    let histogram_type = Distribution::from_str(histogram_type.as_str());
-
-    let range_max = match histogram_type {
-        // only calculate if glean histogram
-        Ok(Distribution::TimingDistribution | Distribution::MemoryDistribution) => {
-            *hist.keys().max().unwrap()
+/// Approximate GLAM histograms from a client sample. Per build, returns the
+/// n_reporting estimate for the whole population and, per bucket, the
+/// estimator value and its standard error. The JSON GlamStats of the run
+/// come with them.
+#[pyfunction]
+pub fn glam_style_histogram_sampled(
+    py: Python,
+    pydf: PyDataFrame,
+    histogram_metadata: String,
+    options: String,
+) -> PyResult<(Vec<(String, f64, Vec<(usize, f64, f64)>)>, String)> {
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let options = parse_options(Some(&options))?;
+    let data: DataFrame = pydf.into();
+    let sample_rate = options.sample_rate.unwrap_or(1.0);
+    let mut stats = GlamStats::default();
+
+    let builds = py
+        .allow_threads(|| glam_build_histograms(data, &histogram_metadata, &options, &mut stats))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+    let results = builds
+        .into_iter()
+        .map(|build| {
+            let errors = build.standard_errors.unwrap_or_default();
+            let histogram = build
+                .histogram
+                .into_iter()
+                .map(|(k, v)| (k, v, errors.get(&k).copied().unwrap_or(0.0)))
+                .collect();
+
+            (build.build_id, build.n_reporting / sample_rate, histogram)
+        })
+        .collect();
+
+    Ok((results, serde_json::to_string(&stats).unwrap()))
+}
+
+/// GLAM histograms with bootstrap confidence intervals for their
+/// percentiles. Clients are resampled with Poisson(1) weights, replicates
+/// run in parallel and reuse the client histograms parsed for the point
+/// estimate. Per build, returns the histogram and, per percentile, the
+/// estimated bucket and the bounds of the `confidence` interval, and the
+/// JSON GlamStats of the run.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn glam_bootstrap_percentiles(
+    py: Python,
+    pydf: PyDataFrame,
+    histogram_metadata: String,
+    percentiles: Vec<f64>,
+    n_replicates: usize,
+    confidence: f64,
+    seed: u64,
+    options: Option<String>,
+) -> PyResult<(BootstrapResults, String)> {
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let options = parse_options(options.as_deref())?;
+    let data: DataFrame = pydf.into();
+    let bootstrap = Bootstrap {
+        percentiles,
+        n_replicates,
+        confidence,
+        seed,
+    };
+
+    let mut stats = GlamStats::default();
+
+    let results = py
+        .allow_threads(|| {
+            glam_bootstrap(data, &histogram_metadata, &options, &bootstrap, &mut stats)
+        })
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok((results, serde_json::to_string(&stats).unwrap()))
+}
+
+/// GLAM histograms sliced by the group_by dimensions of the options (e.g.
+/// build_id, os and channel), and by every rollup of them when rollups is
+/// set. Rows are parsed once and the client histograms are shared by all
+/// slices. Per slice, returns its key in group_by order ("*" for rolled up
+/// dimensions), n_reporting and the histogram, along with the JSON
+/// GlamStats of the run.
+#[pyfunction]
+pub fn glam_style_histogram_slices(
+    py: Python,
+    pydf: PyDataFrame,
+    histogram_metadata: String,
+    options: String,
+) -> PyResult<(Vec<SliceHistogram>, String)> {
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let options = parse_options(Some(&options))?;
+    let data: DataFrame = pydf.into();
+    let mut stats = GlamStats::default();
+
+    let slices = py
+        .allow_threads(|| glam_slices(&data, &histogram_metadata, &options, &mut stats))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok((slices, serde_json::to_string(&stats).unwrap()))
+}
+
+type SliceHistogram = (Vec<String>, f64, Vec<(usize, f64)>);
+
+pub fn glam_slices(
+    data: &DataFrame,
+    histogram_metadata: &HistogramMetaData,
+    options: &GlamOptions,
+    stats: &mut GlamStats,
+) -> PolarsResult<Vec<SliceHistogram>> {
+    let layout =
+        BucketLayout::new(histogram_metadata).map_err(|e| PolarsError::ComputeError(e.into()))?;
+    let data = &deduplicate(data.clone(), options, stats)?;
+    let dimensions = match options.group_by.is_empty() {
+        true => vec!["build_id".to_string()],
+        false => options.group_by.clone(),
+    };
+
+    // the finest slice of every row
+    let columns = dimensions
+        .iter()
+        .map(|d| data.column(d)?.cast(&DataType::Utf8))
+        .collect::<PolarsResult<Vec<_>>>()?;
+    let values = columns
+        .iter()
+        .map(|c| Ok(c.utf8()?.into_iter().collect::<Vec<_>>()))
+        .collect::<PolarsResult<Vec<_>>>()?;
+
+    let mut slice_ids: HashMap<Vec<&str>, usize> = HashMap::new();
+    let mut slices: Vec<Vec<&str>> = Vec::new();
+    let row_slices: Vec<usize> = (0..data.height())
+        .map(|i| {
+            let key: Vec<&str> = dimensions
+                .iter()
+                .zip(&values)
+                .map(|(d, v)| match (d.as_str(), v[i]) {
+                    ("os", Some(os)) => normalize_os(os),
+                    (_, value) => value.unwrap_or("null"),
+                })
+                .collect();
+            *slice_ids.entry(key.clone()).or_insert_with(|| {
+                slices.push(key);
+                slices.len() - 1
+            })
+        })
+        .collect();
+
+    // every client's summed histogram in each finest slice, parsed once
+    let probe = histogram_metadata.probe.as_str();
+    let histograms = parse_probe_column(data, probe, &mut GlamStats::default());
+    let client_ids = data.column("client_id")?.utf8()?;
+    let mut client_slices: HashMap<(usize, &str), HashMap<i64, i64>> = HashMap::new();
+
+    for ((slice, client_id), histogram) in row_slices.iter().zip(client_ids).zip(histograms) {
+        let client_id = match client_id {
+            Some(client_id) => client_id,
+            None => continue,
+        };
+        let summed = client_slices.entry((*slice, client_id)).or_default();
+        for (k, v) in histogram {
+            *summed.entry(k).or_insert(0) += v;
         }
-        _ => 0,
+    }
+
+    // a bit per dimension, set when it is kept, the finest grouping first
+    let n_dimensions = dimensions.len();
+    let groupings: Vec<usize> = match options.rollups {
+        true => (0..1usize << n_dimensions).rev().collect(),
+        false => vec![(1 << n_dimensions) - 1],
     };
 
-    let buckets = match histogram_type {
-        Ok(Distribution::TimingDistribution) => generate_functional_buckets(2, 8, range_max),
-        Ok(Distribution::MemoryDistribution) => generate_functional_buckets(2, 16, range_max),
-        Ok(Distribution::CustomDistributionExponential) => {
-            generate_exponential_buckets(positional_zero, positional_one, positional_two)
+    let mut results = Vec::new();
+    for grouping in groupings {
+        let mut group_ids: HashMap<Vec<&str>, usize> = HashMap::new();
+        let mut groups: Vec<Vec<&str>> = Vec::new();
+        let slice_groups: Vec<usize> = slices
+            .iter()
+            .map(|slice| {
+                let key: Vec<&str> = slice
+                    .iter()
+                    .enumerate()
+                    .map(|(i, v)| match grouping & (1 << i) {
+                        0 => "*",
+                        _ => *v,
+                    })
+                    .collect();
+                *group_ids.entry(key.clone()).or_insert_with(|| {
+                    groups.push(key);
+                    groups.len() - 1
+                })
+            })
+            .collect();
+
+        // a client is counted once in a rolled up group, with the sum of
+        // its histograms over the slices in it
+        let mut client_groups: HashMap<(usize, &str), HashMap<i64, i64>> = HashMap::new();
+        for ((slice, client_id), histogram) in &client_slices {
+            let summed = client_groups
+                .entry((slice_groups[*slice], *client_id))
+                .or_default();
+            for (k, v) in histogram {
+                *summed.entry(*k).or_insert(0) += v;
+            }
         }
-        Ok(Distribution::CustomDistributionLinear) => {
-            generate_linear_buckets(positional_zero, positional_one, positional_two)
+
+        let mut client_levels: Vec<Vec<HashMap<usize, f64>>> = vec![Vec::new(); groups.len()];
+        for ((group, _), histogram) in client_groups {
+            client_levels[group].push(normalize_histogram_glam(histogram));
         }
-        _ => return Err("Invalid Histogram Type".to_string()),
-    };
 
-    fill_buckets(&mut hist, &buckets);
-    transform_to_dirichlet_estimator(&mut hist, n_reporting);
+        results.par_extend(groups.into_par_iter().zip(client_levels).map(
+            |(key, client_levels)| {
+                let group_histograms = map_sum(client_levels);
+                let n_reporting = group_histograms.values().sum::<f64>().round();
+                let histogram = layout.dirichlet_histogram(group_histograms, n_reporting);
 
-    Ok(hist)
+                (
+                    key.into_iter().map(String::from).collect(),
+                    n_reporting,
+                    histogram,
+                )
+            },
+        ));
+    }
+
+    Ok(results)
 }
 
+/// HyperLogLog sketches of the distinct clients of every build, overall and
+/// per bucket (clients with a non zero count in it). Sketches merge across
+/// dates and workers, so reporting counts over a window of days need no
+/// second pass over the pings. Builds are sketched in parallel.
 #[pyfunction]
-pub fn glam_style_histogram(
+pub fn glam_client_sketches(
+    py: Python,
     pydf: PyDataFrame,
     histogram_metadata: String,
-) -> PyResult<Vec<(String, Vec<(usize, f64)>)>> {
-    let histogram_metadata = parse_metadata_json(&histogram_metadata).unwrap();
+    precision: u8,
+) -> PyResult<Vec<ClientSketches>> {
+    HyperLogLog::with_precision(precision).map_err(PyValueError::new_err)?;
+    let histogram_metadata = parse_metadata(&histogram_metadata)?;
+    let data: DataFrame = pydf.into();
+    let probe = histogram_metadata.probe.as_str();
+
+    Ok(py.allow_threads(|| {
+        data.partition_by(["build_id"])
+            .unwrap()
+            .into_par_iter()
+            .map(|df| build_client_sketches(df, probe, precision))
+            .collect()
+    }))
+}
+
+type ClientSketches = (String, HyperLogLog, Vec<(usize, HyperLogLog)>);
+
+fn build_client_sketches(df: DataFrame, probe: &str, precision: u8) -> ClientSketches {
+    let build_id = df
+        .column("build_id")
+        .unwrap()
+        .str_value(0)
+        .unwrap()
+        .to_string();
+    let histograms = parse_probe_column(&df, probe, &mut GlamStats::default());
+    let empty = HyperLogLog::with_precision(precision).unwrap();
+    let mut clients = empty.clone();
+    let mut buckets: HashMap<usize, HyperLogLog> = HashMap::new();
+
+    let client_ids = df.column("client_id").unwrap().utf8().unwrap();
+    for (client_id, histogram) in client_ids.into_iter().zip(histograms) {
+        let hash = match client_id {
+            Some(client_id) => hash_client_id(client_id),
+            None => continue,
+        };
+        clients.insert_hash(hash);
+        for (k, v) in histogram {
+            if v > 0 {
+                buckets
+                    .entry(k as usize)
+                    .or_insert_with(|| empty.clone())
+                    .insert_hash(hash);
+            }
+        }
+    }
 
+    let mut buckets: Vec<_> = buckets.into_iter().collect();
+    buckets.sort_by_key(|x| x.0);
+
+    (build_id, clients, buckets)
+}
+
+type BootstrapResults = Vec<(String, Vec<(usize, f64)>, Vec<(f64, usize, usize, usize)>)>;
+
+struct Bootstrap {
+    percentiles: Vec<f64>,
+    n_replicates: usize,
+    confidence: f64,
+    seed: u64,
+}
+
+fn glam_bootstrap(
+    data: DataFrame,
+    histogram_metadata: &HistogramMetaData,
+    options: &GlamOptions,
+    bootstrap: &Bootstrap,
+    stats: &mut GlamStats,
+) -> PolarsResult<BootstrapResults> {
     let probe = histogram_metadata.probe.as_str();
-    let data: DataFrame = pydf.into();
+    let layout =
+        BucketLayout::new(histogram_metadata).map_err(|e| PolarsError::ComputeError(e.into()))?;
+    let data = with_build_and_client(deduplicate(data, options, stats)?)?;
+
+    Ok(data
+        .partition_by(["build_id"])?
+        .into_iter()
+        .map(|df| {
+            let build_id = df
+                .column("build_id")
+                .unwrap()
+                .str_value(0)
+                .unwrap()
+                .to_string();
+            let client_levels = client_histograms(df, probe, options, &mut GlamStats::default());
+            let build_histograms = map_sum(client_levels.clone());
+            let n_reporting = build_histograms.values().sum::<f64>().round();
+
+            let histogram = layout.dirichlet_histogram(build_histograms, n_reporting);
+
+            let intervals = bootstrap_intervals(&client_levels, &histogram, bootstrap);
+
+            (build_id, histogram, intervals)
+        })
+        .collect())
+}
+
+/// Bucket of every percentile: the first bucket whose cumulative value
+/// reaches it, as calculate_percentiles does on the Python side
+fn percentile_buckets(buckets: &[usize], values: &[f64], percentiles: &[f64]) -> Vec<usize> {
+    let mut cumulative = 0.0;
+    let cdf: Vec<f64> = values
+        .iter()
+        .map(|v| {
+            cumulative += v;
+            cumulative
+        })
+        .collect();
+
+    percentiles
+        .iter()
+        .map(|p| {
+            let idx = cdf.partition_point(|c| c < p).min(buckets.len() - 1);
+            buckets[idx]
+        })
+        .collect()
+}
+
+/// Knuth's method, cheap for a mean of one
+fn poisson_one(rng: &mut SmallRng) -> u32 {
+    let limit = (-1f64).exp();
+    let mut k = 0;
+    let mut p: f64 = rng.gen();
+
+    while p > limit {
+        k += 1;
+        p *= rng.gen::<f64>();
+    }
+
+    k
+}
+
+/// Percentile intervals over Poisson weighted replicates of the clients.
+/// Client histograms are flattened onto the dense bucket index of the point
+/// estimate first, so a replicate is a weighted sum and a cumulative scan.
+fn bootstrap_intervals(
+    client_levels: &[HashMap<usize, f64>],
+    histogram: &[(usize, f64)],
+    bootstrap: &Bootstrap,
+) -> Vec<(f64, usize, usize, usize)> {
+    let buckets: Vec<usize> = histogram.iter().map(|(k, _)| *k).collect();
+    let values: Vec<f64> = histogram.iter().map(|(_, v)| *v).collect();
+    let estimates = percentile_buckets(&buckets, &values, &bootstrap.percentiles);
+
+    let bucket_index: HashMap<usize, usize> =
+        buckets.iter().enumerate().map(|(i, k)| (*k, i)).collect();
+    let clients: Vec<Vec<(usize, f64)>> = client_levels
+        .iter()
+        .map(|hist| hist.iter().map(|(k, v)| (bucket_index[k], *v)).collect())
+        .collect();
+    let k = buckets.len() as f64;
+
+    let replicates: Vec<Vec<usize>> = (0..bootstrap.n_replicates)
+        .into_par_iter()
+        .filter_map(|replicate| {
+            let mut rng = SmallRng::seed_from_u64(
+                bootstrap
+                    .seed
+                    .wrapping_add((replicate as u64).wrapping_mul(0x9E37_79B9_7F4A_7C15)),
+            );
+            let mut aggregated = vec![0f64; buckets.len()];
+            let mut n_reporting = 0f64;
+
+            for client in &clients {
+                let weight = poisson_one(&mut rng) as f64;
+                if weight == 0.0 {
+                    continue;
+                }
+                n_reporting += weight;
+                for (idx, v) in client {
+                    aggregated[*idx] += weight * v;
+                }
+            }
+
+            if n_reporting == 0.0 {
+                return None;
+            }
+
+            // same steps as BucketLayout::dirichlet_histogram, on the
+            // buckets of the point estimate
+            aggregated
+                .iter_mut()
+                .for_each(|v| *v = (*v + 1.0 / k) / n_reporting);
+            let total = aggregated.iter().sum::<f64>().round();
+            aggregated.iter_mut().for_each(|v| *v /= total);
+
+            Some(percentile_buckets(
+                &buckets,
+                &aggregated,
+                &bootstrap.percentiles,
+            ))
+        })
+        .collect();
 
-    let partitioned_data = data.partition_by(["build_id"]).unwrap();
+    let alpha = (1.0 - bootstrap.confidence) / 2.0;
+
+    bootstrap
+        .percentiles
+        .iter()
+        .enumerate()
+        .map(|(i, p)| {
+            if replicates.is_empty() {
+                return (*p, estimates[i], estimates[i], estimates[i]);
+            }
+            let mut draws: Vec<usize> = replicates.iter().map(|r| r[i]).collect();
+            draws.sort_unstable();
+            let last = (draws.len() - 1) as f64;
+            let low = draws[(alpha * last).floor() as usize];
+            let high = draws[((1.0 - alpha) * last).ceil() as usize];
+
+            (*p, estimates[i], low, high)
+        })
+        .collect()
+}
+
+/// Standard error of each bucket's mean client share. Every client weighs the
+/// same in the GLAM estimator, so this is the spread of the client shares
+/// over sqrt(n), with the finite population correction for the sample rate.
+/// Undefined (NaN) with fewer than two clients.
+fn bucket_standard_errors(
+    client_levels: &[HashMap<usize, f64>],
+    sample_rate: f64,
+) -> HashMap<usize, f64> {
+    let mut moments: HashMap<usize, (f64, f64)> = HashMap::new();
+
+    for hist in client_levels {
+        add_moments(&mut moments, hist);
+    }
+
+    errors_from_moments(moments, client_levels.len(), sample_rate)
+}
+
+/// Sum and sum of squares of the client shares of each bucket
+fn add_moments(moments: &mut HashMap<usize, (f64, f64)>, hist: &HashMap<usize, f64>) {
+    for (k, v) in hist {
+        let entry = moments.entry(*k).or_insert((0.0, 0.0));
+        entry.0 += v;
+        entry.1 += v * v;
+    }
+}
+
+fn errors_from_moments(
+    moments: HashMap<usize, (f64, f64)>,
+    clients: usize,
+    sample_rate: f64,
+) -> HashMap<usize, f64> {
+    let n = clients as f64;
+    let correction = (1.0 - sample_rate).max(0.0);
+
+    moments
+        .into_iter()
+        .map(|(k, (sum, sum_squares))| {
+            if n < 2.0 {
+                return (k, f64::NAN);
+            }
+            let mean = sum / n;
+            let variance = ((sum_squares - n * mean * mean) / (n - 1.0)).max(0.0);
+
+            (k, (variance / n * correction).sqrt())
+        })
+        .collect()
+}
+
+/// Histograms arrive either as JSON strings or, when the query shapes them,
+/// as list<struct<key, value>> which needs no text parsing at all
+fn parse_probe_column(
+    df: &DataFrame,
+    probe: &str,
+    stats: &mut GlamStats,
+) -> Vec<HashMap<i64, i64>> {
+    let metric_column = df.column(probe).unwrap();
+    stats.bytes_parsed += metric_column.estimated_size();
+
+    if let DataType::List(_) = metric_column.dtype() {
+        return parse_list_histograms(metric_column).unwrap();
+    }
+
+    let histograms_raw = metric_column
+        .utf8()
+        .unwrap()
+        .into_iter()
+        .collect::<Vec<_>>();
+
+    parse_main_histograms(histograms_raw)
+}
+
+/// Normalized histogram of every client in a build
+fn client_histograms(
+    df: DataFrame,
+    probe: &str,
+    options: &GlamOptions,
+    stats: &mut GlamStats,
+) -> Vec<HashMap<usize, f64>> {
+    stats.rows += df.height();
+
+    if options.client_aggregated {
+        let start = Instant::now();
+        let histograms_parsed = parse_probe_column(&df, probe, stats);
+        stats.parse_seconds += start.elapsed().as_secs_f64();
+
+        let start = Instant::now();
+        let client_levels: Vec<_> = histograms_parsed
+            .into_iter()
+            .map(normalize_histogram_glam)
+            .collect();
+        stats.client_aggregation_seconds += start.elapsed().as_secs_f64();
+        stats.clients += client_levels.len();
+
+        return client_levels;
+    }
+
+    let start = Instant::now();
+    let client_level_dfs = df.partition_by(["client_id"]).unwrap();
+    stats.partition_seconds += start.elapsed().as_secs_f64();
+    let mut client_levels = Vec::new();
+
+    for d in client_level_dfs {
+        let start = Instant::now();
+        let histograms_parsed = parse_probe_column(&d, probe, stats);
+        let parsed = Instant::now();
+        stats.parse_seconds += (parsed - start).as_secs_f64();
+
+        let client_aggregatted = map_sum(histograms_parsed);
+        let client_normed = normalize_histogram_glam(client_aggregatted);
+        stats.client_aggregation_seconds += parsed.elapsed().as_secs_f64();
+
+        client_levels.push(client_normed);
+    }
+    stats.clients += client_levels.len();
+
+    client_levels
+}
+
+/// GLAM histogram of every build, without the Python wrapping
+pub fn glam_histograms(
+    data: DataFrame,
+    histogram_metadata: &HistogramMetaData,
+    options: &GlamOptions,
+) -> PolarsResult<Vec<(String, Vec<(usize, f64)>)>> {
+    let builds =
+        glam_build_histograms(data, histogram_metadata, options, &mut GlamStats::default())?;
+
+    Ok(builds
+        .into_iter()
+        .map(|build| (build.build_id, build.histogram))
+        .collect())
+}
+
+fn glam_build_histograms(
+    data: DataFrame,
+    histogram_metadata: &HistogramMetaData,
+    options: &GlamOptions,
+    stats: &mut GlamStats,
+) -> PolarsResult<Vec<BuildHistogram>> {
+    let run_start = Instant::now();
+    let (commit_start, _, _) = process_memory();
+    let probe = histogram_metadata.probe.as_str();
+    let layout =
+        BucketLayout::new(histogram_metadata).map_err(|e| PolarsError::ComputeError(e.into()))?;
+    let data = with_build_and_client(deduplicate(data, options, stats)?)?;
+
+    if sorted_by_build_and_client(&data)? {
+        let results = sorted_build_histograms(data, &layout, probe, options, stats);
+        finish_stats(stats, run_start, commit_start);
+
+        return Ok(results);
+    }
+
+    if let Some(memory_budget) = options.memory_budget {
+        let results = spilled_build_histograms(data, &layout, probe, options, memory_budget, stats)
+            .map_err(|e| {
+                PolarsError::ComputeError(
+                    format!("spilling client histograms to disk failed: {}", e).into(),
+                )
+            })?;
+        finish_stats(stats, run_start, commit_start);
+
+        return Ok(results);
+    }
+
+    let start = Instant::now();
+    let partitioned_data = data.partition_by(["build_id"])?;
+    stats.partition_seconds += start.elapsed().as_secs_f64();
+    stats.builds += partitioned_data.len();
 
     let mut results = Vec::new();
 
@@ -250,44 +1065,297 @@ pub fn glam_style_histogram(
             .str_value(0)
             .unwrap()
             .to_string();
-        let client_level_dfs = df.partition_by(["client_id"]).unwrap();
-        let mut client_levels = Vec::new();
+        let client_levels = client_histograms(df, probe, options, stats);
+        let standard_errors = options
+            .sample_rate
+            .map(|rate| bucket_standard_errors(&client_levels, rate));
+
+        let start = Instant::now();
+        let build_histograms = map_sum(client_levels);
+        // this is necessary to stop weird floating point behavior
+        let n_reporting = build_histograms.clone().values().sum::<f64>().round();
+        stats.build_aggregation_seconds += start.elapsed().as_secs_f64();
 
-        for d in client_level_dfs {
-            let metric_column = d.select_series([probe]).unwrap();
+        let start = Instant::now();
+        let histogram = layout.dirichlet_histogram(build_histograms, n_reporting);
+        stats.dirichlet_seconds += start.elapsed().as_secs_f64();
 
-            let histograms_raw = metric_column[0]
-                .utf8()
-                .unwrap()
-                .into_iter()
-                .collect::<Vec<_>>();
-            let histograms_parsed = parse_main_histograms(histograms_raw);
+        results.push(BuildHistogram {
+            build_id,
+            n_reporting,
+            histogram,
+            standard_errors,
+        });
+    }
+
+    finish_stats(stats, run_start, commit_start);
+
+    Ok(results)
+}
+
+/// The rows whose document id, in the options' dedup_column, was not seen
+/// in an earlier row, in order. Rows without an id are all kept. The frame
+/// is returned as is when there is no dedup_column.
+fn deduplicate(
+    data: DataFrame,
+    options: &GlamOptions,
+    stats: &mut GlamStats,
+) -> PolarsResult<DataFrame> {
+    let column = match &options.dedup_column {
+        Some(column) => column,
+        None => return Ok(data),
+    };
+    let start = Instant::now();
+    let mut dedup = Deduplicator::new(
+        options.dedup_memory_budget.unwrap_or(DEDUP_MEMORY_BUDGET),
+        options
+            .dedup_false_positive_rate
+            .unwrap_or(DEFAULT_FALSE_POSITIVE_RATE),
+    );
+
+    let ids = data.column(column)?.cast(&DataType::Utf8)?;
+    let keep: BooleanChunked = ids
+        .utf8()?
+        .into_iter()
+        .map(|id| id.map_or(true, |id| dedup.insert(id)))
+        .collect();
+    stats.duplicate_rows += dedup.duplicates;
+    stats.approximate_duplicate_rows += dedup.approximate_duplicates;
+
+    let result = match dedup.duplicates {
+        0 => data,
+        _ => data.filter(&keep)?,
+    };
+    stats.dedup_seconds += start.elapsed().as_secs_f64();
+
+    Ok(result)
+}
+
+/// The rows with both a build_id and a client_id. A row missing either
+/// cannot be put in a build or counted as a client, so the sorted,
+/// partitioned and spilled aggregations all leave it out.
+fn with_build_and_client(data: DataFrame) -> PolarsResult<DataFrame> {
+    let build_ids = data.column("build_id")?;
+    let client_ids = data.column("client_id")?;
+    if build_ids.null_count() == 0 && client_ids.null_count() == 0 {
+        return Ok(data);
+    }
+
+    let keep = &build_ids.is_not_null() & &client_ids.is_not_null();
+    data.filter(&keep)
+}
+
+fn finish_stats(stats: &mut GlamStats, run_start: Instant, commit_start: usize) {
+    let (commit_end, peak_commit, peak_rss) = process_memory();
+    stats.commit_delta_bytes += commit_end as i64 - commit_start as i64;
+    stats.peak_commit_bytes = peak_commit;
+    stats.peak_rss_bytes = peak_rss;
+    stats.total_seconds += run_start.elapsed().as_secs_f64();
+}
 
-            let client_aggregatted = map_sum(histograms_parsed);
-            let client_normed = normalize_histogram_glam(client_aggregatted);
+/// Rows parsed at once by the streaming aggregations, so the parsed
+/// histograms of the whole frame are never in memory together
+const PARSE_CHUNK_ROWS: usize = 1 << 16;
 
-            client_levels.push(client_normed);
+/// Hands the build_id, client_id and parsed histogram of every row to `f`,
+/// in order, parsing a chunk of rows at a time
+fn for_each_row<E, F>(
+    data: &DataFrame,
+    probe: &str,
+    stats: &mut GlamStats,
+    mut f: F,
+) -> Result<(), E>
+where
+    F: FnMut(Option<&str>, Option<&str>, HashMap<i64, i64>) -> Result<(), E>,
+{
+    let mut offset = 0;
+    while offset < data.height() {
+        let chunk = data.slice(offset as i64, PARSE_CHUNK_ROWS);
+        offset += chunk.height();
+        stats.rows += chunk.height();
+
+        let start = Instant::now();
+        let histograms_parsed = parse_probe_column(&chunk, probe, stats);
+        let parsed = Instant::now();
+        stats.parse_seconds += (parsed - start).as_secs_f64();
+
+        let build_ids = chunk
+            .column("build_id")
+            .unwrap()
+            .cast(&DataType::Utf8)
+            .unwrap();
+        let client_ids = chunk.column("client_id").unwrap().utf8().unwrap();
+        let rows = build_ids.utf8().unwrap().into_iter().zip(client_ids);
+
+        for ((build_id, client_id), histogram) in rows.zip(histograms_parsed) {
+            f(build_id, client_id, histogram)?;
         }
+        stats.client_aggregation_seconds += parsed.elapsed().as_secs_f64();
+    }
 
-        let build_histograms = map_sum(client_levels);
-        // this is necessary to stop weird floating point behavior
-        let n_reporting = build_histograms.clone().values().sum::<f64>().round();
+    Ok(())
+}
 
-        let dirichlet_transformed_hists = calculate_dirichlet_distribution(
-            build_histograms,
-            histogram_metadata.histogram_type.clone(),
+/// Running state of a build in the streaming aggregations: its number of
+/// clients and the sum and sum of squares of their shares of each bucket,
+/// which is all the estimator and its standard errors need
+#[derive(Default)]
+struct BuildMoments {
+    clients: usize,
+    moments: HashMap<usize, (f64, f64)>,
+}
+
+impl BuildMoments {
+    fn add_client(&mut self, histogram: HashMap<i64, i64>) {
+        self.clients += 1;
+        add_moments(&mut self.moments, &normalize_histogram_glam(histogram));
+    }
+
+    fn finish(
+        self,
+        build_id: String,
+        layout: &BucketLayout,
+        options: &GlamOptions,
+        stats: &mut GlamStats,
+    ) -> BuildHistogram {
+        stats.builds += 1;
+        stats.clients += self.clients;
+        let standard_errors = options
+            .sample_rate
+            .map(|rate| errors_from_moments(self.moments.clone(), self.clients, rate));
+        let build_histograms: HashMap<usize, f64> = self
+            .moments
+            .into_iter()
+            .map(|(k, (sum, _))| (k, sum))
+            .collect();
+        let n_reporting = build_histograms.values().sum::<f64>().round();
+
+        let start = Instant::now();
+        let histogram = layout.dirichlet_histogram(build_histograms, n_reporting);
+        stats.dirichlet_seconds += start.elapsed().as_secs_f64();
+
+        BuildHistogram {
+            build_id,
             n_reporting,
-            histogram_metadata.buckets_for_probe[0],
-            histogram_metadata.buckets_for_probe[1],
-            histogram_metadata.buckets_for_probe[2],
-        )
-        .unwrap();
+            histogram,
+            standard_errors,
+        }
+    }
+}
+
+/// glam_build_histograms for when the client histograms do not fit in
+/// memory. Rows are summed per (build, client) in a SpillStore, then each
+/// client is normalized and folded into its build as the store is read back,
+/// so beyond the budget only the per build sums are held.
+fn spilled_build_histograms(
+    data: DataFrame,
+    layout: &BucketLayout,
+    probe: &str,
+    options: &GlamOptions,
+    memory_budget: usize,
+    stats: &mut GlamStats,
+) -> std::io::Result<Vec<BuildHistogram>> {
+    let mut store = SpillStore::new(memory_budget, options.spill_dir.as_deref())?;
 
-        let result = hist_to_normed_sorted(&dirichlet_transformed_hists);
+    for_each_row(
+        &data,
+        probe,
+        stats,
+        |build_id, client_id, histogram| match (build_id, client_id) {
+            (Some(build_id), Some(client_id)) => store.add(build_id, client_id, histogram),
+            _ => Ok(()),
+        },
+    )?;
+    stats.spilled_bytes += store.spilled_bytes();
+
+    let start = Instant::now();
+    let mut builds: HashMap<String, BuildMoments> = HashMap::new();
+    store.finish(|build_id, _, histogram| {
+        builds.entry(build_id).or_default().add_client(histogram);
+    })?;
+    stats.build_aggregation_seconds += start.elapsed().as_secs_f64();
+
+    Ok(builds
+        .into_iter()
+        .map(|(build_id, build)| build.finish(build_id, layout, options, stats))
+        .collect())
+}
 
-        results.push((build_id, result));
+/// Whether the rows are ordered by (build_id, client_id), which makes every
+/// build and every client a contiguous run. Stops at the first row out of
+/// order, so unsorted frames are rejected almost immediately.
+fn sorted_by_build_and_client(data: &DataFrame) -> PolarsResult<bool> {
+    let build_ids = data.column("build_id")?.cast(&DataType::Utf8)?;
+    let client_ids = data.column("client_id")?.utf8()?;
+    let mut rows = build_ids.utf8()?.into_iter().zip(client_ids);
+
+    let mut previous = match rows.next() {
+        Some(row) => row,
+        None => return Ok(true),
+    };
+    for row in rows {
+        if row < previous {
+            return Ok(false);
+        }
+        previous = row;
     }
-    Ok(results)
+
+    Ok(true)
+}
+
+/// glam_build_histograms for rows grouped by build and client, e.g. sorted
+/// by the query. Clients and builds end where their run of rows does, so
+/// nothing is hashed or partitioned and only the current client's histogram
+/// is held besides the build's running sums.
+fn sorted_build_histograms(
+    data: DataFrame,
+    layout: &BucketLayout,
+    probe: &str,
+    options: &GlamOptions,
+    stats: &mut GlamStats,
+) -> Vec<BuildHistogram> {
+    let mut results = Vec::new();
+    let mut started = false;
+    let mut current_build: Option<String> = None;
+    let mut current_client: Option<String> = None;
+    let mut client: HashMap<i64, i64> = HashMap::new();
+    let mut build = BuildMoments::default();
+
+    let rows: Result<(), std::convert::Infallible> =
+        for_each_row(&data, probe, stats, |build_id, client_id, histogram| {
+            if !started || current_build.as_deref() != build_id {
+                if started {
+                    build.add_client(std::mem::take(&mut client));
+                    results.push((current_build.take(), std::mem::take(&mut build)));
+                }
+                started = true;
+                current_build = build_id.map(String::from);
+                current_client = client_id.map(String::from);
+            } else if current_client.as_deref() != client_id {
+                build.add_client(std::mem::take(&mut client));
+                current_client = client_id.map(String::from);
+            }
+
+            for (k, v) in histogram {
+                *client.entry(k).or_insert(0) += v;
+            }
+
+            Ok(())
+        });
+    rows.unwrap();
+
+    if started {
+        build.add_client(client);
+        results.push((current_build, build));
+    }
+
+    results
+        .into_iter()
+        .map(|(build_id, build)| {
+            let build_id = build_id.unwrap_or_else(|| "null".to_string());
+            build.finish(build_id, layout, options, stats)
+        })
+        .collect()
 }
 
 #[cfg(test)]
@@ -303,9 +1371,586 @@ mod tests {
 
         assert_eq!(comp_hist, test_hist)
     }
+    fn build_frame(client_ids: &[&str], build_ids: &[&str], histograms: &[&str]) -> DataFrame {
+        df!(
+            "client_id" => client_ids,
+            "build_id" => build_ids,
+            "gc_ms" => histograms
+        )
+        .unwrap()
+    }
+
+    fn exponential_metadata() -> HistogramMetaData {
+        parse_metadata_json(
+            r#"{"probe": "gc_ms", "histogram_type": "custom_distribution_exponential",
+                "process": "parent", "probe_location": "payload.histograms.gc_ms",
+                "buckets_key": "min, max, n_buckets", "buckets_for_probe": [1, 10000, 10]}"#,
+        )
+        .unwrap()
+    }
+
+    fn sorted_results(
+        mut results: Vec<(String, Vec<(usize, f64)>)>,
+    ) -> Vec<(String, Vec<(usize, f64)>)> {
+        results.sort_by(|a, b| a.0.cmp(&b.0));
+        results
+    }
+
+    #[test]
+    fn test_client_aggregated_matches_raw_pings() {
+        let raw = build_frame(
+            &["a", "a", "b", "c"],
+            &["1", "1", "1", "2"],
+            &[
+                r#"{"bucket_count": 10, "histogram_type": 0, "sum": 5, "range": [1, 10000], "values": {"1": 2, "3": 1}}"#,
+                r#"{"bucket_count": 10, "histogram_type": 0, "sum": 3, "range": [1, 10000], "values": {"3": 1}}"#,
+                r#"{"bucket_count": 10, "histogram_type": 0, "sum": 40, "range": [1, 10000], "values": {"10": 4}}"#,
+                r#"{"bucket_count": 10, "histogram_type": 0, "sum": 32, "range": [1, 10000], "values": {"32": 1}}"#,
+            ],
+        );
+        let client_aggregated = build_frame(
+            &["a", "b", "c"],
+            &["1", "1", "2"],
+            &[
+                r#"{"values": {"1": 2, "3": 2}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"32": 1}}"#,
+            ],
+        );
+        let metadata = exponential_metadata();
+
+        let from_raw = glam_histograms(raw, &metadata, &GlamOptions::default()).unwrap();
+        let from_aggregated = glam_histograms(
+            client_aggregated,
+            &metadata,
+            &GlamOptions {
+                client_aggregated: true,
+                ..Default::default()
+            },
+        )
+        .unwrap();
+
+        assert_eq!(sorted_results(from_raw), sorted_results(from_aggregated));
+    }
+
+    #[test]
+    fn test_list_histograms_match_json() {
+        let json = build_frame(
+            &["a", "a", "b"],
+            &["1", "1", "1"],
+            &[
+                r#"{"values": {"1": 2, "3": 1}}"#,
+                r#"{"values": {"3": 1}}"#,
+                r#"{"values": {"10": 4}}"#,
+            ],
+        );
+        let rows = [
+            (vec![1i64, 3], vec![2i64, 1]),
+            (vec![3], vec![1]),
+            (vec![10], vec![4]),
+        ]
+        .into_iter()
+        .map(|(keys, values)| {
+            StructChunked::new(
+                "",
+                &[Series::new("key", keys), Series::new("value", values)],
+            )
+            .unwrap()
+            .into_series()
+        })
+        .collect::<Vec<_>>();
+        let typed = df!(
+            "client_id" => &["a", "a", "b"],
+            "build_id" => &["1", "1", "1"],
+            "gc_ms" => rows
+        )
+        .unwrap();
+        let metadata = exponential_metadata();
+
+        assert_eq!(
+            glam_histograms(json, &metadata, &GlamOptions::default()).unwrap(),
+            glam_histograms(typed, &metadata, &GlamOptions::default()).unwrap()
+        );
+    }
+
+    #[test]
+    fn test_client_sketches() {
+        let df = build_frame(
+            &["a", "a", "b", "c"],
+            &["1", "1", "1", "1"],
+            &[
+                r#"{"values": {"1": 2, "3": 1}}"#,
+                r#"{"values": {"3": 1, "10": 0}}"#,
+                r#"{"values": {"3": 4}}"#,
+                r#"{"values": {"32": 1}}"#,
+            ],
+        );
+        let (build_id, clients, buckets) = build_client_sketches(df, "gc_ms", 12);
+
+        assert_eq!(build_id, "1");
+        assert_eq!(clients.cardinality().round(), 3.0);
+        let counts: Vec<(usize, f64)> = buckets
+            .iter()
+            .map(|(k, sketch)| (*k, sketch.cardinality().round()))
+            .collect();
+        assert_eq!(counts, vec![(1, 1.0), (3, 2.0), (32, 1.0)]);
+    }
+
+    #[test]
+    fn test_spilled_matches_in_memory() {
+        // out of order, or the sorted path would take it
+        let frame = build_frame(
+            &["c", "a", "b", "a", "d"],
+            &["2", "1", "1", "1", "2"],
+            &[
+                r#"{"values": {"32": 1}}"#,
+                r#"{"values": {"1": 2, "3": 1}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"3": 1}}"#,
+                r#"{"values": {"3": 2, "32": 2}}"#,
+            ],
+        );
+        let metadata = exponential_metadata();
+        let options = GlamOptions {
+            sample_rate: Some(0.5),
+            ..Default::default()
+        };
+        let spilling = GlamOptions {
+            sample_rate: Some(0.5),
+            memory_budget: Some(0),
+            ..Default::default()
+        };
+
+        let build = |options: &GlamOptions, stats: &mut GlamStats| {
+            let mut builds =
+                glam_build_histograms(frame.clone(), &metadata, options, stats).unwrap();
+            builds.sort_by(|a, b| a.build_id.cmp(&b.build_id));
+            builds
+        };
+        let mut spilled_stats = GlamStats::default();
+        let expected = build(&options, &mut GlamStats::default());
+        let spilled = build(&spilling, &mut spilled_stats);
+
+        assert!(spilled_stats.spilled_bytes > 0);
+        assert_eq!(spilled_stats.clients, 4);
+        for (s, e) in spilled.iter().zip(&expected) {
+            assert_eq!(s.build_id, e.build_id);
+            assert_eq!(s.n_reporting, e.n_reporting);
+            assert_eq!(s.histogram.len(), e.histogram.len());
+            for ((sk, sv), (ek, ev)) in s.histogram.iter().zip(&e.histogram) {
+                assert_eq!(sk, ek);
+                assert!((sv - ev).abs() < 1e-12);
+            }
+            let (s_errors, e_errors) = (s.standard_errors.as_ref(), e.standard_errors.as_ref());
+            for (k, v) in e_errors.unwrap() {
+                assert!((s_errors.unwrap()[k] - v).abs() < 1e-12);
+            }
+        }
+    }
+
+    #[test]
+    fn test_sorted_input() {
+        let histograms = [
+            r#"{"values": {"32": 1}}"#,
+            r#"{"values": {"1": 2, "3": 1}}"#,
+            r#"{"values": {"10": 4}}"#,
+            r#"{"values": {"3": 1}}"#,
+            r#"{"values": {"3": 2, "32": 2}}"#,
+        ];
+        let frame = build_frame(
+            &["c", "a", "b", "a", "d"],
+            &["2", "1", "1", "1", "2"],
+            &histograms,
+        );
+        let sorted = frame
+            .sort(["build_id", "client_id"], vec![false, false])
+            .unwrap();
+        assert!(!sorted_by_build_and_client(&frame).unwrap());
+        assert!(sorted_by_build_and_client(&sorted).unwrap());
+
+        let metadata = exponential_metadata();
+        let mut stats = GlamStats::default();
+        let mut from_runs = glam_build_histograms(
+            sorted.clone(),
+            &metadata,
+            &GlamOptions::default(),
+            &mut stats,
+        )
+        .unwrap();
+        let expected =
+            sorted_results(glam_histograms(frame, &metadata, &GlamOptions::default()).unwrap());
+
+        // detected, so nothing was partitioned
+        assert_eq!(stats.partition_seconds, 0.0);
+        assert_eq!((stats.rows, stats.clients, stats.builds), (5, 4, 2));
+        from_runs.sort_by(|a, b| a.build_id.cmp(&b.build_id));
+        for (build, (build_id, histogram)) in from_runs.iter().zip(&expected) {
+            assert_eq!(&build.build_id, build_id);
+            for ((k, v), (ek, ev)) in build.histogram.iter().zip(histogram) {
+                assert_eq!(k, ek);
+                assert!((v - ev).abs() < 1e-12);
+            }
+        }
+    }
+
+    #[test]
+    fn test_paths_agree_on_null_keys() {
+        // unsorted, with rows missing a build or a client, which no path counts
+        let frame = df!(
+            "client_id" => &[Some("c"), Some("a"), None, Some("b"), Some("a"), Some("d"), None],
+            "build_id" => &[Some("2"), Some("1"), Some("1"), None, Some("1"), Some("2"), None],
+            "gc_ms" => &[
+                r#"{"values": {"32": 1}}"#,
+                r#"{"values": {"1": 2, "3": 1}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"3": 1}}"#,
+                r#"{"values": {"3": 2, "32": 2}}"#,
+                r#"{"values": {"1": 1}}"#,
+            ]
+        )
+        .unwrap();
+        let metadata = exponential_metadata();
+        let run = |frame: &DataFrame, options: &GlamOptions| {
+            let mut stats = GlamStats::default();
+            let builds = glam_build_histograms(frame.clone(), &metadata, options, &mut stats)
+                .unwrap()
+                .into_iter()
+                .map(|build| (build.build_id, build.histogram))
+                .collect();
+            (sorted_results(builds), stats)
+        };
+
+        let assert_close = |results: &[(String, Vec<(usize, f64)>)],
+                            expected: &[(String, Vec<(usize, f64)>)]| {
+            assert_eq!(results.len(), expected.len());
+            for ((build_id, histogram), (expected_id, expected)) in results.iter().zip(expected) {
+                assert_eq!(build_id, expected_id);
+                for ((k, v), (ek, ev)) in histogram.iter().zip(expected) {
+                    assert_eq!(k, ek);
+                    assert!((v - ev).abs() < 1e-12);
+                }
+            }
+        };
+
+        let keyed = with_build_and_client(frame.clone()).unwrap();
+        assert!(!sorted_by_build_and_client(&keyed).unwrap());
+        let (partitioned, stats) = run(&frame, &GlamOptions::default());
+        assert_eq!((stats.rows, stats.clients, stats.builds), (4, 3, 2));
+
+        let sorted = frame
+            .sort(["build_id", "client_id"], vec![false, false])
+            .unwrap();
+        let (from_runs, stats) = run(&sorted, &GlamOptions::default());
+        assert_eq!(stats.partition_seconds, 0.0);
+        assert_eq!((stats.rows, stats.clients, stats.builds), (4, 3, 2));
+        assert_close(&from_runs, &partitioned);
+
+        let spilling = GlamOptions {
+            memory_budget: Some(0),
+            ..Default::default()
+        };
+        let (spilled, stats) = run(&frame, &spilling);
+        assert!(stats.spilled_bytes > 0);
+        assert_eq!((stats.rows, stats.clients, stats.builds), (4, 3, 2));
+        assert_close(&spilled, &partitioned);
+    }
+
+    #[test]
+    fn test_glam_slices() {
+        let histograms = [
+            r#"{"values": {"1": 2, "3": 1}}"#,
+            r#"{"values": {"3": 1}}"#,
+            r#"{"values": {"10": 4}}"#,
+            r#"{"values": {"32": 1}}"#,
+            r#"{"values": {"3": 2}}"#,
+        ];
+        let mut frame = build_frame(
+            &["a", "a", "b", "c", "c"],
+            &["1", "1", "1", "2", "2"],
+            &histograms,
+        );
+        frame
+            .with_column(Series::new(
+                "os",
+                &["Windows_NT", "Windows_NT", "Darwin", "Windows_NT", "Linux"],
+            ))
+            .unwrap();
+        let metadata = exponential_metadata();
+
+        // by build alone, the same as glam_histograms
+        let by_build = glam_slices(
+            &frame,
+            &metadata,
+            &GlamOptions::default(),
+            &mut GlamStats::default(),
+        )
+        .unwrap();
+        let expected = sorted_results(
+            glam_histograms(frame.clone(), &metadata, &GlamOptions::default()).unwrap(),
+        );
+        let mut by_build: Vec<_> = by_build
+            .into_iter()
+            .map(|(key, _, histogram)| (key[0].clone(), histogram))
+            .collect();
+        by_build.sort_by(|a, b| a.0.cmp(&b.0));
+        assert_eq!(by_build, expected);
+
+        let options = GlamOptions {
+            group_by: vec!["build_id".to_string(), "os".to_string()],
+            rollups: true,
+            ..Default::default()
+        };
+        let slices: HashMap<Vec<String>, f64> =
+            glam_slices(&frame, &metadata, &options, &mut GlamStats::default())
+                .unwrap()
+                .into_iter()
+                .map(|(key, n_reporting, _)| (key, n_reporting))
+                .collect();
+        let n_reporting =
+            |build_id: &str, os: &str| slices[&vec![build_id.to_string(), os.to_string()]];
+
+        assert_eq!(slices.len(), 4 + 2 + 3 + 1);
+        assert_eq!(n_reporting("1", "Windows"), 1.0);
+        assert_eq!(n_reporting("2", "Linux"), 1.0);
+        // client c is counted once in the rollups over os
+        assert_eq!(n_reporting("2", "*"), 1.0);
+        assert_eq!(n_reporting("*", "Windows"), 2.0);
+        assert_eq!(n_reporting("*", "*"), 3.0);
+    }
+
+    #[test]
+    fn test_glam_stats() {
+        let frame = build_frame(
+            &["a", "a", "b", "c"],
+            &["1", "1", "1", "2"],
+            &[
+                r#"{"values": {"1": 2, "3": 1}}"#,
+                r#"{"values": {"3": 1}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"32": 1}}"#,
+            ],
+        );
+        let mut stats = GlamStats::default();
+
+        glam_build_histograms(
+            frame,
+            &exponential_metadata(),
+            &GlamOptions::default(),
+            &mut stats,
+        )
+        .unwrap();
+
+        assert_eq!(stats.rows, 4);
+        assert_eq!(stats.clients, 3);
+        assert_eq!(stats.builds, 2);
+        assert!(stats.bytes_parsed > 0);
+        assert!(stats.total_seconds >= stats.parse_seconds + stats.dirichlet_seconds);
+        assert!(stats.peak_rss_bytes > 0);
+    }
+
+    #[test]
+    fn test_deduplicate() {
+        let histograms = [
+            r#"{"values": {"1": 2, "3": 1}}"#,
+            r#"{"values": {"3": 1}}"#,
+            r#"{"values": {"10": 4}}"#,
+            r#"{"values": {"32": 1}}"#,
+        ];
+        let unique = build_frame(&["b", "a", "a", "c"], &["1", "1", "1", "2"], &histograms);
+        // d1 retried twice, rows without a document id are never dropped
+        let retried = df!(
+            "client_id" => &["b", "a", "a", "a", "c", "a"],
+            "build_id" => &["1", "1", "1", "1", "2", "1"],
+            "gc_ms" => &[
+                histograms[0],
+                histograms[1],
+                histograms[1],
+                histograms[2],
+                histograms[3],
+                histograms[1],
+            ],
+            "document_id" => &[Some("d0"), Some("d1"), Some("d1"), None, Some("d4"), Some("d1")]
+        )
+        .unwrap();
+        let options = GlamOptions {
+            dedup_column: Some("document_id".to_string()),
+            ..Default::default()
+        };
+        let mut stats = GlamStats::default();
+
+        let builds = glam_build_histograms(
+            retried.clone(),
+            &exponential_metadata(),
+            &options,
+            &mut stats,
+        )
+        .unwrap();
+        let deduplicated = builds
+            .into_iter()
+            .map(|build| (build.build_id, build.histogram))
+            .collect();
+
+        assert_eq!(stats.rows, 4);
+        assert_eq!(stats.duplicate_rows, 2);
+        assert_eq!(stats.approximate_duplicate_rows, 0);
+        assert_eq!(
+            sorted_results(deduplicated),
+            sorted_results(
+                glam_histograms(
+                    unique.clone(),
+                    &exponential_metadata(),
+                    &GlamOptions::default()
+                )
+                .unwrap()
+            )
+        );
+
+        // without a budget every id goes through the Bloom filter
+        let options = GlamOptions {
+            dedup_memory_budget: Some(0),
+            ..options
+        };
+        let mut stats = GlamStats::default();
+        glam_build_histograms(retried, &exponential_metadata(), &options, &mut stats).unwrap();
+
+        assert_eq!(stats.rows, 4);
+        assert_eq!(stats.approximate_duplicate_rows, 2);
+
+        // a dedup_column the frame does not have is an error, not a panic
+        let options = GlamOptions {
+            dedup_column: Some("doc_id".to_string()),
+            ..Default::default()
+        };
+        assert!(glam_histograms(unique, &exponential_metadata(), &options).is_err());
+    }
+
+    #[test]
+    fn test_bucket_standard_errors() {
+        let client_levels = vec![
+            HashMap::from_iter([(1usize, 1.0)]),
+            HashMap::from_iter([(1usize, 0.5), (3, 0.5)]),
+            HashMap::from_iter([(3usize, 1.0)]),
+        ];
+
+        let errors = bucket_standard_errors(&client_levels, 0.0);
+        // shares in bucket 1 are [1, 0.5, 0]: sample variance 0.25 over n = 3
+        assert!((errors[&1] - (0.25f64 / 3.0).sqrt()).abs() < 1e-12);
+        assert!((errors[&3] - errors[&1]).abs() < 1e-12);
+
+        let full_population = bucket_standard_errors(&client_levels, 1.0);
+        assert_eq!(full_population[&1], 0.0);
+
+        assert!(bucket_standard_errors(&client_levels[..1], 0.5)[&1].is_nan());
+    }
+
+    #[test]
+    fn test_sampled_build_histograms() {
+        let frame = build_frame(
+            &["a", "b", "c"],
+            &["1", "1", "1"],
+            &[
+                r#"{"values": {"1": 2, "3": 2}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"10": 1}}"#,
+            ],
+        );
+        let metadata = exponential_metadata();
+        let options = GlamOptions {
+            client_aggregated: true,
+            sample_rate: Some(0.1),
+            ..Default::default()
+        };
+
+        let exact = glam_histograms(frame.clone(), &metadata, &GlamOptions::default()).unwrap();
+        let sampled =
+            glam_build_histograms(frame, &metadata, &options, &mut GlamStats::default()).unwrap();
+
+        assert_eq!(sampled.len(), 1);
+        assert_eq!(sampled[0].n_reporting, 3.0);
+        for ((k, v), (sampled_k, sampled_v)) in exact[0].1.iter().zip(&sampled[0].histogram) {
+            assert_eq!(k, sampled_k);
+            assert!((v - sampled_v).abs() < 1e-12);
+        }
+        let errors = sampled[0].standard_errors.as_ref().unwrap();
+        assert!(errors[&10] > 0.0);
+        assert!(!errors.contains_key(&32));
+    }
+
+    fn bootstrap(percentiles: Vec<f64>, n_replicates: usize) -> Bootstrap {
+        Bootstrap {
+            percentiles,
+            n_replicates,
+            confidence: 0.9,
+            seed: 42,
+        }
+    }
+
+    #[test]
+    fn test_percentile_buckets() {
+        let buckets = [0usize, 1, 3, 10];
+        let values = [0.1, 0.4, 0.3, 0.2];
+
+        assert_eq!(
+            percentile_buckets(&buckets, &values, &[0.05, 0.5, 0.8, 0.99, 1.5]),
+            vec![0, 1, 3, 10, 10]
+        );
+    }
+
+    #[test]
+    fn test_bootstrap_intervals() {
+        let mut client_levels = Vec::new();
+        for i in 0..200usize {
+            let bucket = [1usize, 3, 10, 32][i % 4];
+            client_levels.push(HashMap::from_iter([(bucket, 1.0)]));
+        }
+        let histogram = vec![(0usize, 0.0), (1, 0.25), (3, 0.25), (10, 0.25), (32, 0.25)];
+
+        let intervals = bootstrap_intervals(&client_levels, &histogram, &bootstrap(vec![0.5], 200));
+        let (p, estimate, low, high) = intervals[0];
+        assert_eq!(p, 0.5);
+        assert_eq!(estimate, 3);
+        assert!(low <= estimate && estimate <= high);
+        assert!(low >= 1 && high <= 10);
+
+        let again = bootstrap_intervals(&client_levels, &histogram, &bootstrap(vec![0.5], 200));
+        assert_eq!(intervals, again);
+    }
+
+    #[test]
+    fn test_bootstrap_matches_point_estimate() {
+        let frame = build_frame(
+            &["a", "b", "c"],
+            &["1", "1", "1"],
+            &[
+                r#"{"values": {"1": 2, "3": 2}}"#,
+                r#"{"values": {"10": 4}}"#,
+                r#"{"values": {"10": 1}}"#,
+            ],
+        );
+        let metadata = exponential_metadata();
+
+        let exact = glam_histograms(frame.clone(), &metadata, &GlamOptions::default()).unwrap();
+        let results = glam_bootstrap(
+            frame,
+            &metadata,
+            &GlamOptions::default(),
+            &bootstrap(vec![0.25, 0.75], 50),
+            &mut GlamStats::default(),
+        )
+        .unwrap();
+
+        assert_eq!(results.len(), 1);
+        assert_eq!(results[0].1.len(), exact[0].1.len());
+        assert_eq!(results[0].2.len(), 2);
+        for (_, estimate, low, high) in &results[0].2 {
+            assert!(low <= estimate && estimate <= high);
+        }
+    }
+
     #[test]
     fn test_generate_functional_buckets() {
-        let mut buckets = generate_functional_buckets(2, 8, 305);
+        let mut buckets = FunctionalBuckets::new(2.0, 8.0, 305).minimums;
 
         let target: Vec<usize> = vec![
             0usize, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 20, 22, 24, 26, 29,
@@ -318,6 +1963,60 @@ mod tests {
         assert_eq!(target, buckets);
     }
 
+    /// The fill of a bucket map that the layouts replace
+    fn dirichlet_reference(
+        mut hist: HashMap<usize, f64>,
+        buckets: &[usize],
+        n_reporting: f64,
+    ) -> Vec<(usize, f64)> {
+        buckets.iter().for_each(|b| {
+            hist.entry(*b).or_insert(0.0);
+        });
+        let k = hist.len() as f64;
+        hist.values_mut()
+            .for_each(|v| *v = (*v + 1.0 / k) / n_reporting);
+        let total = hist.values().sum::<f64>().round();
+        let mut sorted: Vec<_> = hist.into_iter().map(|(b, v)| (b, v / total)).collect();
+        sorted.sort_by_key(|x| x.0);
+
+        sorted
+    }
+
+    #[test]
+    fn test_functional_bucket_positions() {
+        for buckets_per_magnitude in [8.0, 16.0] {
+            let functional =
+                FunctionalBuckets::new(2.0, buckets_per_magnitude, FUNCTIONAL_RANGE_MAX);
+            for (i, bucket) in functional.minimums.iter().enumerate() {
+                assert_eq!(functional.position(*bucket), Some(i));
+            }
+        }
+
+        let timing = FunctionalBuckets::new(2.0, 8.0, FUNCTIONAL_RANGE_MAX);
+        assert_eq!(timing.position(3), Some(3));
+        assert_eq!(timing.position(15), None);
+    }
+
+    #[test]
+    fn test_dirichlet_histogram() {
+        let hist: HashMap<usize, f64> = HashMap::from_iter([(3, 0.5), (15, 0.25), (304, 1.25)]);
+
+        let timing =
+            BucketLayout::Functional(FunctionalBuckets::new(2.0, 8.0, FUNCTIONAL_RANGE_MAX));
+        let buckets = FunctionalBuckets::new(2.0, 8.0, 304).minimums;
+        assert_eq!(
+            timing.dirichlet_histogram(hist.clone(), 2.0),
+            dirichlet_reference(hist.clone(), &buckets, 2.0)
+        );
+
+        let exponential = BucketLayout::new(&exponential_metadata()).unwrap();
+        let buckets = generate_exponential_buckets(1, 10000, 10);
+        assert_eq!(
+            exponential.dirichlet_histogram(hist.clone(), 2.0),
+            dirichlet_reference(hist, &buckets, 2.0)
+        );
+    }
+
     #[test]
     fn test_exponential_buckets_1() {
         let comp_buckets = vec![
@@ -346,4 +2045,13 @@ mod tests {
 
         assert_eq!(test_buckets, comp_buckets);
     }
+
+    #[test]
+    fn test_glam_options_reject_unknown_fields() {
+        let options: GlamOptions = serde_json::from_str(r#"{"sample_rate": 0.1}"#).unwrap();
+        assert_eq!(options.sample_rate, Some(0.1));
+
+        assert!(serde_json::from_str::<GlamOptions>(r#"{"sample_rat": 0.1}"#).is_err());
+        assert!(serde_json::from_str::<GlamOptions>(r#"{"sample_rate": "0.1"}"#).is_err());
+    }
 }
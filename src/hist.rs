@@ -1,24 +1,264 @@
+use polars::export::arrow::array::{Array, ListArray, PrimitiveArray, StructArray};
+use polars::export::arrow::bitmap::Bitmap;
+use polars::export::arrow::compute::cast::{cast, CastOptions};
+use polars::export::arrow::datatypes::{DataType as ArrowDataType, Field};
+use polars::export::arrow::offset::Offsets;
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3_polars::PySeries;
+use rayon::prelude::*;
 use serde::{Deserialize, Serialize};
 use std::collections::HashMap;
 
+/// Rows handled per unit of parallel work, this bounds the intermediate
+/// state held at once to one block of parsed histograms per thread
+const BLOCK_ROWS: usize = 16_384;
+
 #[pyfunction]
-pub fn normalize_histogram(hist: HashMap<usize, f64>) -> PyResult<HashMap<usize, f64>> {
+pub fn normalize_histogram(py: Python, hist: HashMap<usize, f64>) -> PyResult<HashMap<usize, f64>> {
+    Ok(py.allow_threads(|| normalize_histogram_map(&hist)))
+}
+
+pub fn normalize_histogram_map(hist: &HashMap<usize, f64>) -> HashMap<usize, f64> {
     // Normalization of histogram. New values will be the existing value
     // divided by the total accross all buckets.
     let total: f64 = hist.values().sum();
 
-    Ok(hist
-        .iter()
+    hist.iter()
         .map(|(k, v)| (*k, *v / total))
-        .collect::<HashMap<usize, f64>>())
+        .collect::<HashMap<usize, f64>>()
+}
+
+/// Histogram as sorted (bucket, value) pairs
+type Buckets = Vec<(i64, f64)>;
+
+/// Either a full main ping histogram or just its map of values
+#[derive(Deserialize)]
+#[serde(untagged)]
+enum HistogramValues {
+    Main { values: HashMap<String, f64> },
+    Plain(HashMap<String, f64>),
+}
+
+fn parse_histogram_values(s: &str) -> Option<Buckets> {
+    let values = match serde_json::from_str(s).ok()? {
+        HistogramValues::Main { values } => values,
+        HistogramValues::Plain(values) => values,
+    };
+
+    values
+        .into_iter()
+        .map(|(k, v)| k.parse::<i64>().ok().map(|k| (k, v)))
+        .collect()
+}
+
+/// Sorts by bucket, sums repeated buckets and divides by the total
+fn normalize_buckets(mut buckets: Buckets) -> Buckets {
+    buckets.sort_by_key(|x| x.0);
+    buckets.dedup_by(|next, kept| {
+        let same_bucket = next.0 == kept.0;
+        if same_bucket {
+            kept.1 += next.1;
+        }
+        same_bucket
+    });
+
+    let total: f64 = buckets.iter().map(|x| x.1).sum();
+    buckets.iter_mut().for_each(|x| x.1 /= total);
+
+    buckets
+}
+
+/// Flattened list<struct<bucket, value>> column under construction
+#[derive(Default)]
+struct BucketValueColumn {
+    lengths: Vec<usize>,
+    validity: Vec<bool>,
+    buckets: Vec<i64>,
+    values: Vec<f64>,
+}
+
+impl BucketValueColumn {
+    fn push(&mut self, row: Option<Buckets>) {
+        self.validity.push(row.is_some());
+        let row = row.unwrap_or_default();
+        self.lengths.push(row.len());
+        for (bucket, value) in row {
+            self.buckets.push(bucket);
+            self.values.push(value);
+        }
+    }
+
+    fn append(&mut self, mut other: BucketValueColumn) {
+        self.lengths.append(&mut other.lengths);
+        self.validity.append(&mut other.validity);
+        self.buckets.append(&mut other.buckets);
+        self.values.append(&mut other.values);
+    }
+
+    fn into_series(self, name: &str) -> PolarsResult<Series> {
+        let struct_type = ArrowDataType::Struct(vec![
+            Field::new("bucket", ArrowDataType::Int64, false),
+            Field::new("value", ArrowDataType::Float64, false),
+        ]);
+        let fields = StructArray::new(
+            struct_type.clone(),
+            vec![
+                PrimitiveArray::from_vec(self.buckets).boxed(),
+                PrimitiveArray::from_vec(self.values).boxed(),
+            ],
+            None,
+        );
+
+        let mut offsets = Vec::with_capacity(self.lengths.len() + 1);
+        offsets.push(0i64);
+        for length in self.lengths {
+            offsets.push(offsets.last().unwrap() + length as i64);
+        }
+        let validity = match self.validity.iter().all(|x| *x) {
+            true => None,
+            false => Some(self.validity.into_iter().collect::<Bitmap>()),
+        };
+
+        let list = ListArray::<i64>::new(
+            ListArray::<i64>::default_datatype(struct_type),
+            Offsets::try_from(offsets)?.into(),
+            fields.boxed(),
+            validity,
+        );
+
+        Series::try_from((name, list.boxed()))
+    }
+}
+
+/// Normalizes n_rows histograms, fetched by row index, in parallel blocks
+fn normalize_rows<F>(n_rows: usize, row: F) -> BucketValueColumn
+where
+    F: Fn(usize) -> Option<Buckets> + Sync,
+{
+    let n_blocks = (n_rows + BLOCK_ROWS - 1) / BLOCK_ROWS;
+
+    let blocks = (0..n_blocks)
+        .into_par_iter()
+        .map(|block| {
+            let mut column = BucketValueColumn::default();
+            for i in block * BLOCK_ROWS..n_rows.min((block + 1) * BLOCK_ROWS) {
+                column.push(row(i).map(normalize_buckets));
+            }
+            column
+        })
+        .collect::<Vec<_>>();
+
+    let mut column = BucketValueColumn::default();
+    for block in blocks {
+        column.append(block);
+    }
+
+    column
+}
+
+/// Key and value children of a list<struct<key, value>> array, cast to
+/// int64 keys and `value_type` values. The first struct field is taken as
+/// the key and the second as the value, whatever their names.
+fn list_struct_children(
+    arr: &ListArray<i64>,
+    value_type: &ArrowDataType,
+) -> PolarsResult<(Box<dyn Array>, Box<dyn Array>)> {
+    let fields = match arr.values().as_any().downcast_ref::<StructArray>() {
+        Some(s) if s.values().len() >= 2 => s.values(),
+        _ => {
+            return Err(PolarsError::ComputeError(
+                "expected list<struct<key, value>> histograms".into(),
+            ))
+        }
+    };
+    let keys = cast(
+        fields[0].as_ref(),
+        &ArrowDataType::Int64,
+        CastOptions::default(),
+    )?;
+    let values = cast(fields[1].as_ref(), value_type, CastOptions::default())?;
+
+    Ok((keys, values))
 }
 
+/// Reads list<struct<key, value>> rows straight from the Arrow buffers
+fn normalize_list_array(arr: &ListArray<i64>) -> PolarsResult<BucketValueColumn> {
+    let (keys, values) = list_struct_children(arr, &ArrowDataType::Float64)?;
+    let keys = keys.as_any().downcast_ref::<PrimitiveArray<i64>>().unwrap();
+    let values = values
+        .as_any()
+        .downcast_ref::<PrimitiveArray<f64>>()
+        .unwrap();
+    let offsets = arr.offsets().as_slice();
+
+    Ok(normalize_rows(arr.len(), |i| {
+        if !arr.is_valid(i) {
+            return None;
+        }
+        let (start, end) = (offsets[i] as usize, offsets[i + 1] as usize);
+        (start..end)
+            .filter(|j| keys.is_valid(*j))
+            .map(|j| match values.is_valid(j) {
+                true => Some((keys.value(j), values.value(j))),
+                false => Some((keys.value(j), 0f64)),
+            })
+            .collect()
+    }))
+}
+
+/// Normalizes every histogram in a column of histogram JSON strings (full
+/// main ping histograms or plain value maps) or list<struct<key, value>>.
+/// Returns list<struct<bucket: i64, value: f64>>, sorted by bucket, with
+/// nulls for null or unparseable rows.
+pub fn normalize_histogram_series(s: &Series) -> PolarsResult<Series> {
+    let column = match s.dtype() {
+        DataType::Utf8 => {
+            let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+            normalize_rows(rows.len(), |i| rows[i].and_then(parse_histogram_values))
+        }
+        DataType::List(_) => {
+            let mut column = BucketValueColumn::default();
+            for arr in s.list()?.downcast_iter() {
+                column.append(normalize_list_array(arr)?);
+            }
+            column
+        }
+        dt => {
+            return Err(PolarsError::ComputeError(
+                format!("cannot normalize histograms stored as {:?}", dt).into(),
+            ))
+        }
+    };
+
+    column.into_series(s.name())
+}
+
+/// Column version of normalize_histogram, parsing and normalization are done
+/// in parallel without the GIL
+#[pyfunction]
+pub fn normalize_histogram_column(py: Python, column: PySeries) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| normalize_histogram_series(&s))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
+}
+
+/// Only values is required, so rows that were already summed per client by
+/// the query (`{"values": {...}}`) parse as well
 #[derive(Serialize, Deserialize)]
 struct MainHistogram {
+    #[serde(default)]
     bucket_count: usize,
+    #[serde(default)]
     histogram_type: usize,
+    #[serde(default)]
     sum: usize,
+    #[serde(default)]
     range: Vec<usize>,
     values: HashMap<String, i64>,
 }
@@ -57,3 +297,98 @@ pub fn parse_main_histograms(v: Vec<Option<&str>>) -> Vec<HashMap<i64, i64>> {
         .map(|s| parse_data_json(s.unwrap()).unwrap().clamp_keys())
         .collect()
 }
+
+/// Typed counterpart of parse_main_histograms for list<struct<key, value>>
+/// columns. Keys and values are read from the child buffers directly, with no
+/// text parsing. Keys are clamped like clamp_keys and null rows are empty.
+pub fn parse_list_histograms(s: &Series) -> PolarsResult<Vec<HashMap<i64, i64>>> {
+    let max_value = 2i64.pow(40);
+    let mut histograms = Vec::with_capacity(s.len());
+
+    for arr in s.list()?.downcast_iter() {
+        let (keys, values) = list_struct_children(arr, &ArrowDataType::Int64)?;
+        let keys = keys.as_any().downcast_ref::<PrimitiveArray<i64>>().unwrap();
+        let values = values
+            .as_any()
+            .downcast_ref::<PrimitiveArray<i64>>()
+            .unwrap();
+        let offsets = arr.offsets().as_slice();
+
+        for i in 0..arr.len() {
+            let mut histogram = HashMap::new();
+            if arr.is_valid(i) {
+                for j in offsets[i] as usize..offsets[i + 1] as usize {
+                    if keys.is_valid(j) && values.is_valid(j) && keys.value(j) < max_value {
+                        *histogram.entry(keys.value(j)).or_insert(0) += values.value(j);
+                    }
+                }
+            }
+            histograms.push(histogram);
+        }
+    }
+
+    Ok(histograms)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_parse_histogram_values() {
+        let main = r#"{"bucket_count": 3, "histogram_type": 1, "sum": 4, "range": [1, 2], "values": {"0": 1, "2": 3}}"#;
+        let mut parsed = parse_histogram_values(main).unwrap();
+        parsed.sort_by_key(|x| x.0);
+
+        assert_eq!(parsed, vec![(0, 1f64), (2, 3f64)]);
+        assert_eq!(
+            parse_histogram_values(r#"{"5": 2}"#).unwrap(),
+            vec![(5, 2f64)]
+        );
+        assert_eq!(parse_histogram_values("not json"), None);
+    }
+
+    #[test]
+    fn test_normalize_buckets() {
+        let normalized = normalize_buckets(vec![(11, 1f64), (2, 1f64), (11, 2f64)]);
+
+        assert_eq!(normalized, vec![(2, 0.25), (11, 0.75)]);
+    }
+
+    #[test]
+    fn test_normalize_histogram_series() {
+        let s = Series::new(
+            "h",
+            &[Some(r#"{"values": {"2": 1, "11": 1}}"#), None, Some("{")],
+        );
+        let result = normalize_histogram_series(&s).unwrap();
+
+        assert_eq!(result.len(), 3);
+        assert_eq!(result.null_count(), 2);
+        let first = result.list().unwrap().get(0).unwrap();
+        let fields = first.struct_().unwrap().fields();
+        let buckets = fields[0].i64().unwrap().into_iter().collect::<Vec<_>>();
+        let values = fields[1].f64().unwrap().into_iter().collect::<Vec<_>>();
+
+        assert_eq!(buckets, vec![Some(2), Some(11)]);
+        assert_eq!(values, vec![Some(0.5), Some(0.5)]);
+    }
+
+    #[test]
+    fn test_parse_list_histograms() {
+        let row = StructChunked::new(
+            "",
+            &[
+                Series::new("key", &[1i64, 3, 1, 2i64.pow(41)]),
+                Series::new("value", &[2i64, 1, 1, 5]),
+            ],
+        )
+        .unwrap()
+        .into_series();
+        let s = Series::new("gc_ms", &[row]);
+
+        let parsed = parse_list_histograms(&s).unwrap();
+
+        assert_eq!(parsed, vec![HashMap::from_iter([(1, 3), (3, 1)])]);
+    }
+}
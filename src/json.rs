@@ -1,28 +1,56 @@
 use std::collections::HashMap;
 
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3_polars::PySeries;
+use rayon::prelude::*;
 use serde::{Deserialize, Serialize};
 
+use crate::stats::last_mode;
+
+/// Json version of mode_last, pyo3 will coerce types to strings. "" when
+/// there are no values
 #[pyfunction]
-pub fn json_mode_last(data: Vec<&str>) -> PyResult<String> {
-    // Json version of mode_last, pyo3 will coerce types to strings
-    // One-pass mode calculation
-    // Source: https://codereview.stackexchange.com/a/173437
-    if data.is_empty() {
-        return Ok("".to_string());
-    }
-    let mut occurence_map = HashMap::new();
-
-    // max_by_key Returns the element that gives the maximum value from the specified function.
-    // Returns the second argument if the comparison determines them to be equal.
-    // So this conforms to mode_last
-    let highest_occurrence = data.iter().copied().max_by_key(|&i| {
-        let occurences = occurence_map.entry(i).or_insert(0);
-        *occurences += 1;
-        *occurences
-    });
-
-    Ok(highest_occurrence.unwrap().to_string())
+pub fn json_mode_last(py: Python, data: Vec<&str>) -> PyResult<String> {
+    let mode = py.allow_threads(|| last_mode(&data));
+
+    Ok(mode.unwrap_or("").to_string())
+}
+
+/// json_mode_last of every row of a list column, in parallel. Values are
+/// compared as strings, nulls within a row are ignored and null or empty
+/// rows give null
+pub fn json_mode_last_series(s: &Series) -> PolarsResult<Series> {
+    let lists = s.cast(&DataType::List(Box::new(DataType::Utf8)))?;
+    let rows = lists.list()?.into_iter().collect::<Vec<_>>();
+    let modes = rows
+        .par_iter()
+        .map(|row| -> PolarsResult<Option<String>> {
+            let values = match row {
+                Some(row) => row.utf8()?.into_iter().flatten().collect::<Vec<_>>(),
+                None => return Ok(None),
+            };
+            Ok(match values.is_empty() {
+                true => None,
+                false => last_mode(&values).map(String::from),
+            })
+        })
+        .collect::<PolarsResult<Vec<_>>>()?;
+
+    Ok(Series::new(s.name(), modes))
+}
+
+/// Column version of json_mode_last, without the GIL
+#[pyfunction]
+pub fn json_mode_last_column(py: Python, column: PySeries) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| json_mode_last_series(&s))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
 }
 
 #[derive(Serialize, Deserialize)]
@@ -42,11 +70,23 @@ struct GleanExperimentInfo {
     extra: HashMap<String, String>,
 }
 
+type LegacyExperiments = HashMap<String, Vec<HashMap<String, String>>>;
+
 #[pyfunction]
 pub fn glean_legacy_compatible_experiments(
+    py: Python,
+    experiment_data: &str,
+) -> PyResult<LegacyExperiments> {
+    py.allow_threads(|| legacy_compatible_experiments(experiment_data))
+        .map_err(|e| PyValueError::new_err(e.to_string()))
+}
+
+/// Glean experiments as {"experiments": [{"key": .., "value": branch}]}, the
+/// shape of the legacy telemetry experiments column
+pub fn legacy_compatible_experiments(
     experiment_data: &str,
-) -> PyResult<HashMap<String, Vec<HashMap<String, String>>>> {
-    let r: GleanExperiments = serde_json::from_str(experiment_data).unwrap();
+) -> serde_json::Result<LegacyExperiments> {
+    let r: GleanExperiments = serde_json::from_str(experiment_data)?;
 
     let experiments = r.experiments;
 
@@ -75,14 +115,29 @@ mod tests {
         // See stats::test_mode_last for more tests
         let string_vec = vec!["thing1", "thing2", "thing1"];
 
-        assert_eq!(json_mode_last(string_vec).unwrap(), "thing1");
+        assert_eq!(last_mode(&string_vec), Some("thing1"));
+    }
+
+    #[test]
+    fn test_json_mode_last_series() {
+        let rows = vec![
+            Series::new("", &[Some("a"), Some("b"), None, Some("a")]),
+            Series::new("", &[None::<&str>]),
+        ];
+        let s = Series::new("m", rows);
+
+        let result = json_mode_last_series(&s).unwrap();
+        assert_eq!(
+            result.utf8().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some("a"), None]
+        );
     }
 
     #[test]
     fn test_glean_legacy_compatible_experiments() {
         let data = r#"{  "experiments": [{    "key": "experiment_a",    "value": {      "branch": "control",      "extra": {        "type": "firefox"      }    }  }, {    "key": "experiment_b",    "value": {      "branch": "treatment",      "extra": {        "type": "firefoxOS"      }    }  }]}"#;
 
-        let result = glean_legacy_compatible_experiments(data);
+        let result = legacy_compatible_experiments(data);
         let mut target = HashMap::new();
 
         target.insert(
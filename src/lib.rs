@@ -1,11 +1,15 @@
 use pyo3::prelude::*;
 
 pub mod bytes;
+pub mod dedup;
+pub mod experiments;
 pub mod glam;
 pub mod hist;
 pub mod json;
 pub mod map;
 pub mod norm;
+pub mod sketch;
+pub mod spill;
 pub mod stats;
 
 // Remember to decorate with #[pyfunction]
@@ -16,18 +20,38 @@ fn mozfun_local_rust(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(map::float_map_sum, m)?)?;
     m.add_function(wrap_pyfunction!(map::int_map_sum, m)?)?;
     m.add_function(wrap_pyfunction!(map::map_get_key, m)?)?;
+    m.add_function(wrap_pyfunction!(map::map_get_key_column, m)?)?;
+    m.add_function(wrap_pyfunction!(map::map_sum_column, m)?)?;
     m.add_function(wrap_pyfunction!(stats::mode_last, m)?)?;
+    m.add_function(wrap_pyfunction!(stats::stats_mode_last_column, m)?)?;
     m.add_function(wrap_pyfunction!(json::json_mode_last, m)?)?;
+    m.add_function(wrap_pyfunction!(json::json_mode_last_column, m)?)?;
     m.add_class::<norm::Matcher>()?;
     m.add_class::<norm::Extractor>()?;
     m.add_function(wrap_pyfunction!(norm::norm_normalize_os, m)?)?;
+    m.add_function(wrap_pyfunction!(norm::norm_normalize_os_column, m)?)?;
+    m.add_function(wrap_pyfunction!(norm::norm_truncate_version_column, m)?)?;
+    m.add_function(wrap_pyfunction!(norm::norm_extract_version_column, m)?)?;
     m.add_function(wrap_pyfunction!(bytes::bytes_bit_pos_to_byte_pos, m)?)?;
+    m.add_function(wrap_pyfunction!(bytes::bytes_zero_right_fixed, m)?)?;
+    m.add_function(wrap_pyfunction!(bytes::bytes_zero_right_offsets, m)?)?;
+    m.add_function(wrap_pyfunction!(bytes::bytes_extract_bits_fixed, m)?)?;
+    m.add_function(wrap_pyfunction!(bytes::bytes_extract_bits_offsets, m)?)?;
     m.add_function(wrap_pyfunction!(
         json::glean_legacy_compatible_experiments,
         m
     )?)?;
     m.add_function(wrap_pyfunction!(hist::normalize_histogram, m)?)?;
+    m.add_function(wrap_pyfunction!(hist::normalize_histogram_column, m)?)?;
     m.add_function(wrap_pyfunction!(glam::glam_style_histogram, m)?)?;
+    m.add_function(wrap_pyfunction!(glam::glam_style_histogram_profiled, m)?)?;
+    m.add_function(wrap_pyfunction!(glam::glam_style_histogram_sampled, m)?)?;
+    m.add_function(wrap_pyfunction!(glam::glam_style_histogram_slices, m)?)?;
+    m.add_function(wrap_pyfunction!(glam::glam_bootstrap_percentiles, m)?)?;
+    m.add_function(wrap_pyfunction!(glam::glam_client_sketches, m)?)?;
+    m.add_class::<sketch::HyperLogLog>()?;
+    m.add_class::<experiments::ExperimentIndex>()?;
+    m.add_class::<experiments::RowSet>()?;
 
     Ok(())
 }
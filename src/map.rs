@@ -1,77 +1,69 @@
 use std::collections::HashMap;
-use std::sync::Arc;
+use std::hash::Hash;
+use std::ops::AddAssign;
 
 use dashmap::DashMap;
 
+use polars::export::arrow::array::{Array, ListArray, PrimitiveArray, StructArray, Utf8Array};
+use polars::export::arrow::bitmap::Bitmap;
+use polars::export::arrow::compute::cast::{cast, CastOptions};
+use polars::export::arrow::datatypes::{DataType as ArrowDataType, Field};
+use polars::export::arrow::offset::Offsets;
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3_polars::PySeries;
 use rayon::prelude::*;
 
 use serde_json::Value;
 
-/// Sum of a groupby of keys
-#[pyfunction]
-pub fn map_sum(r: Vec<(&str, f64)>) -> PyResult<HashMap<&str, f64>> {
+/// Sum of the values of every key, over all cores. The map_sum pyfunctions
+/// convert their input out of Python and run this without the GIL.
+pub fn sum_pairs<K, V>(pairs: &[(K, V)]) -> HashMap<K, V>
+where
+    K: Eq + Hash + Copy + Send + Sync,
+    V: AddAssign + Copy + Send + Sync,
+{
     let result_map = DashMap::new();
-    let arc_result_map = Arc::new(result_map);
 
-    r.par_iter().for_each(|x| {
-        let arc_result_map_clone = arc_result_map.clone();
-        let _ = *arc_result_map_clone
+    pairs.par_iter().for_each(|x| {
+        let _ = *result_map
             .entry(x.0)
             .and_modify(|y| *y += x.1)
             .or_insert(x.1);
     });
 
-    let unwraped_result_map = Arc::try_unwrap(arc_result_map).expect("rc not zero");
-
     // this could be less than great with a very large number of keys, but then why?
-    Ok(unwraped_result_map
-        .into_iter()
-        .collect::<HashMap<&str, f64>>())
+    result_map.into_iter().collect()
 }
 
-/// Sum of a groupby of numeric keys and int values
-/// Generics cannot be used due to exposing this in Python
+/// Sum of a groupby of keys
 #[pyfunction]
-pub fn int_map_sum(r: Vec<(u64, u64)>) -> PyResult<HashMap<u64, u64>> {
-    let result_map = DashMap::new();
-    let arc_result_map = Arc::new(result_map);
-
-    r.par_iter().for_each(|x| {
-        let arc_result_map_clone = arc_result_map.clone();
-        let _ = *arc_result_map_clone
-            .entry(x.0)
-            .and_modify(|y| *y += x.1)
-            .or_insert(x.1);
-    });
-
-    let unwraped_result_map = Arc::try_unwrap(arc_result_map).expect("rc not zero");
+pub fn map_sum<'a>(py: Python, r: Vec<(&'a str, f64)>) -> PyResult<HashMap<&'a str, f64>> {
+    Ok(py.allow_threads(|| sum_pairs(&r)))
+}
 
-    Ok(unwraped_result_map.into_iter().collect())
+/// Sum of a groupby of numeric keys and int values
+/// Pyfunctions cannot be generic, so there is one per key and value type
+#[pyfunction]
+pub fn int_map_sum(py: Python, r: Vec<(u64, u64)>) -> PyResult<HashMap<u64, u64>> {
+    Ok(py.allow_threads(|| sum_pairs(&r)))
 }
 
 /// Sum of a groupby of numeric keys and float values
 #[pyfunction]
-pub fn float_map_sum(r: Vec<(u64, f64)>) -> PyResult<HashMap<u64, f64>> {
-    let result_map = DashMap::new();
-    let arc_result_map = Arc::new(result_map);
-
-    r.par_iter().for_each(|x| {
-        let arc_result_map_clone = arc_result_map.clone();
-        let _ = *arc_result_map_clone
-            .entry(x.0)
-            .and_modify(|y| *y += x.1)
-            .or_insert(x.1);
-    });
-
-    let unwraped_result_map = Arc::try_unwrap(arc_result_map).expect("rc not zero");
-
-    Ok(unwraped_result_map.into_iter().collect())
+pub fn float_map_sum(py: Python, r: Vec<(u64, f64)>) -> PyResult<HashMap<u64, f64>> {
+    Ok(py.allow_threads(|| sum_pairs(&r)))
 }
 
 /// Parse a string with json array in it
 #[pyfunction]
-pub fn map_get_key(input: &str, key: &str, trim: bool) -> PyResult<String> {
+pub fn map_get_key(py: Python, input: &str, key: &str, trim: bool) -> PyResult<String> {
+    Ok(py.allow_threads(|| get_key(input, key, trim)))
+}
+
+/// Value of `key` in a json array of key/value structs, "" when it is missing
+pub fn get_key(input: &str, key: &str, trim: bool) -> String {
     let trim_chars = ['{', '}', '\n', '\r', ' '];
     let cleaned_string = match trim {
         true => input
@@ -89,14 +81,168 @@ pub fn map_get_key(input: &str, key: &str, trim: bool) -> PyResult<String> {
     for i in 0..len {
         if r[i]["key"] == key {
             let out = r[i]["value"].to_string();
-            return Ok(out
+            return out
                 .trim_start_matches('\"')
                 .trim_end_matches('\"')
-                .to_string());
+                .to_string();
         }
     }
 
-    Ok("".to_string())
+    "".to_string()
+}
+
+/// map_get_key over a Utf8 column of json arrays, in parallel. Nulls stay
+/// null, rows without the key are "" like map_get_key
+pub fn get_key_series(s: &Series, key: &str, trim: bool) -> PolarsResult<Series> {
+    let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+    let values = rows
+        .par_iter()
+        .map(|row| row.map(|r| get_key(r, key, trim)))
+        .collect::<Vec<_>>();
+
+    Ok(Series::new(s.name(), values))
+}
+
+/// Sums the values of repeated keys within every row of a
+/// list<struct<key, value>> column, like mozfun's map.sum. The first struct
+/// field is the key and the second the value, whatever their names. Returns
+/// list<struct<key: utf8, value: f64>> with keys in order of first
+/// appearance, null values count as 0
+pub fn sum_series(s: &Series) -> PolarsResult<Series> {
+    let mut rows = Vec::with_capacity(s.len());
+    for arr in s.list()?.downcast_iter() {
+        rows.append(&mut sum_list_array(arr)?);
+    }
+
+    key_value_series(s.name(), rows)
+}
+
+type KeyValues = Vec<(String, f64)>;
+
+fn sum_list_array(arr: &ListArray<i64>) -> PolarsResult<Vec<Option<KeyValues>>> {
+    let fields = match arr.values().as_any().downcast_ref::<StructArray>() {
+        Some(s) if s.values().len() >= 2 => s.values(),
+        _ => {
+            return Err(PolarsError::ComputeError(
+                "expected list<struct<key, value>>".into(),
+            ))
+        }
+    };
+    let keys = cast(
+        fields[0].as_ref(),
+        &ArrowDataType::LargeUtf8,
+        CastOptions::default(),
+    )?;
+    let keys = keys.as_any().downcast_ref::<Utf8Array<i64>>().unwrap();
+    let values = cast(
+        fields[1].as_ref(),
+        &ArrowDataType::Float64,
+        CastOptions::default(),
+    )?;
+    let values = values
+        .as_any()
+        .downcast_ref::<PrimitiveArray<f64>>()
+        .unwrap();
+    let offsets = arr.offsets().as_slice();
+
+    Ok((0..arr.len())
+        .into_par_iter()
+        .map(|i| {
+            if !arr.is_valid(i) {
+                return None;
+            }
+            let mut positions = HashMap::new();
+            let mut sums: KeyValues = Vec::new();
+            for j in offsets[i] as usize..offsets[i + 1] as usize {
+                if !keys.is_valid(j) {
+                    continue;
+                }
+                let value = match values.is_valid(j) {
+                    true => values.value(j),
+                    false => 0f64,
+                };
+                match positions.get(keys.value(j)) {
+                    Some(&position) => sums[position].1 += value,
+                    None => {
+                        positions.insert(keys.value(j), sums.len());
+                        sums.push((keys.value(j).to_string(), value));
+                    }
+                }
+            }
+            Some(sums)
+        })
+        .collect())
+}
+
+fn key_value_series(name: &str, rows: Vec<Option<KeyValues>>) -> PolarsResult<Series> {
+    let mut offsets = Vec::with_capacity(rows.len() + 1);
+    offsets.push(0i64);
+    let mut validity = Vec::with_capacity(rows.len());
+    let (mut keys, mut values) = (Vec::new(), Vec::new());
+
+    for row in rows {
+        validity.push(row.is_some());
+        for (key, value) in row.unwrap_or_default() {
+            keys.push(key);
+            values.push(value);
+        }
+        offsets.push(keys.len() as i64);
+    }
+
+    let struct_type = ArrowDataType::Struct(vec![
+        Field::new("key", ArrowDataType::LargeUtf8, false),
+        Field::new("value", ArrowDataType::Float64, false),
+    ]);
+    let fields = StructArray::new(
+        struct_type.clone(),
+        vec![
+            Utf8Array::<i64>::from_slice(keys).boxed(),
+            PrimitiveArray::from_vec(values).boxed(),
+        ],
+        None,
+    );
+    let validity = match validity.iter().all(|x| *x) {
+        true => None,
+        false => Some(validity.into_iter().collect::<Bitmap>()),
+    };
+
+    let list = ListArray::<i64>::new(
+        ListArray::<i64>::default_datatype(struct_type),
+        Offsets::try_from(offsets)?.into(),
+        fields.boxed(),
+        validity,
+    );
+
+    Series::try_from((name, list.boxed()))
+}
+
+/// Column version of map_get_key, without the GIL
+#[pyfunction]
+pub fn map_get_key_column(
+    py: Python,
+    column: PySeries,
+    key: &str,
+    trim: bool,
+) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| get_key_series(&s, key, trim))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
+}
+
+/// Per row map.sum of a list<struct<key, value>> column, without the GIL
+#[pyfunction]
+pub fn map_sum_column(py: Python, column: PySeries) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| sum_series(&s))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
 }
 
 #[cfg(test)]
@@ -123,8 +269,7 @@ mod tests {
             ("thing3", 144f64),
             ("thing3", 144f64),
         ];
-        let thing: PyResult<HashMap<&str, f64>> = map_sum(input);
-        let thing_result = &thing.unwrap();
+        let thing_result: &HashMap<&str, f64> = &sum_pairs(&input);
         assert_eq!(thing_result.get("thing1").unwrap(), &10f64);
         assert_eq!(thing_result.get("thing2").unwrap(), &16f64);
         assert_eq!(thing_result.get("thing3").unwrap(), &576f64);
@@ -150,9 +295,40 @@ mod tests {
           }]"#;
         // let result = map::map_get_key(data, "baz");
 
-        assert_eq!(map_get_key(data, "foo", true).unwrap(), "42");
-        assert_eq!(map_get_key(data, "foo", false).unwrap(), "");
-        assert_eq!(map_get_key(r_data, "bar", false).unwrap(), "12");
-        assert_eq!(map_get_key(data, "baz", true).unwrap(), "");
+        assert_eq!(get_key(data, "foo", true), "42");
+        assert_eq!(get_key(data, "foo", false), "");
+        assert_eq!(get_key(r_data, "bar", false), "12");
+        assert_eq!(get_key(data, "baz", true), "");
+    }
+
+    #[test]
+    fn test_get_key_series() {
+        let s = Series::new("m", &[Some(r#"{[{"key": "foo", "value": "42"}]}"#), None]);
+        let result = get_key_series(&s, "foo", true).unwrap();
+
+        assert_eq!(
+            result.utf8().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some("42"), None]
+        );
+    }
+
+    #[test]
+    fn test_key_value_series() {
+        let rows = vec![
+            Some(vec![("a".to_string(), 3f64), ("b".to_string(), 1f64)]),
+            None,
+            Some(vec![]),
+        ];
+        let result = key_value_series("m", rows).unwrap();
+
+        assert_eq!(result.len(), 3);
+        assert_eq!(result.null_count(), 1);
+        let first = result.list().unwrap().get(0).unwrap();
+        let fields = first.struct_().unwrap().fields();
+        let keys = fields[0].utf8().unwrap().into_iter().collect::<Vec<_>>();
+        let values = fields[1].f64().unwrap().into_iter().collect::<Vec<_>>();
+
+        assert_eq!(keys, vec![Some("a"), Some("b")]);
+        assert_eq!(values, vec![Some(3.0), Some(1.0)]);
     }
 }
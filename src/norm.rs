@@ -2,7 +2,11 @@
 use regex::Regex;
 
 use mimalloc::MiMalloc;
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3_polars::PySeries;
+use rayon::prelude::*;
 
 /// Faster memory allocator in Pyo3 context
 #[global_allocator]
@@ -18,7 +22,7 @@ pub struct Matcher {
 #[pymethods]
 impl Matcher {
     #[new]
-    fn new() -> Self {
+    pub fn new() -> Self {
         Matcher {
             major_version_regex: Regex::new(r#"^([0-9]+).*"#).unwrap(),
             minor_version_regex: Regex::new(r#"^([0-9]+[.]?[0-9]+).*"#).unwrap(),
@@ -64,7 +68,7 @@ pub struct Extractor {
 #[pymethods]
 impl Extractor {
     #[new]
-    fn new() -> Self {
+    pub fn new() -> Self {
         Extractor {
             major_version_regex: Regex::new(r#"^([0-9]+).*"#).unwrap(),
             minor_version_regex: Regex::new(r#"^[0-9]+[.]([0-9]+).*"#).unwrap(),
@@ -91,23 +95,122 @@ impl Extractor {
 
 #[pyfunction]
 pub fn norm_normalize_os(unnormalized_os: &str) -> PyResult<&str> {
+    Ok(normalize_os(unnormalized_os))
+}
+
+pub fn normalize_os(unnormalized_os: &str) -> &'static str {
     if unnormalized_os.starts_with("Windows") || unnormalized_os.starts_with("WINNT") {
-        return Ok("Windows");
+        return "Windows";
     } else if unnormalized_os.starts_with("Darwin") {
-        return Ok("Mac");
+        return "Mac";
     } else if unnormalized_os.starts_with("iOS") || unnormalized_os.contains("iPhone") {
-        return Ok("iOS");
+        return "iOS";
     } else if unnormalized_os.starts_with("Android") {
-        return Ok("Android");
+        return "Android";
     } else if unnormalized_os.contains("Linux")
         || unnormalized_os.contains("BSD")
         || unnormalized_os.contains("SunOS")
         || unnormalized_os.contains("Solaris")
     {
-        return Ok("Linux");
+        return "Linux";
+    }
+
+    "Other"
+}
+
+/// norm_normalize_os over a Utf8 column, in parallel. Nulls stay null
+pub fn normalize_os_series(s: &Series) -> PolarsResult<Series> {
+    let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+    let normalized = rows
+        .par_iter()
+        .map(|row| row.map(normalize_os))
+        .collect::<Vec<_>>();
+
+    Ok(Series::new(s.name(), normalized))
+}
+
+/// VersionTruncator over a Utf8 column, `part` is "major" or "minor"
+pub fn truncate_version_series(s: &Series, part: &str) -> PolarsResult<Series> {
+    let truncate = match part {
+        "major" => Matcher::find_major_version,
+        "minor" => Matcher::find_minor_version,
+        _ => {
+            return Err(PolarsError::ComputeError(
+                format!("{} is neither major/minor", part).into(),
+            ))
+        }
+    };
+    let matcher = Matcher::new();
+
+    let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+    let truncated = rows
+        .par_iter()
+        .map(|row| row.map(|v| truncate(&matcher, v)))
+        .collect::<Vec<_>>();
+
+    Ok(Series::new(s.name(), truncated))
+}
+
+/// VersionExtractor over a Utf8 column, `part` is "major", "minor" or
+/// "patch". Rows without that part are null
+pub fn extract_version_series(s: &Series, part: &str) -> PolarsResult<Series> {
+    if !["major", "minor", "patch"].contains(&part) {
+        return Err(PolarsError::ComputeError(
+            format!("{} was not one of major/minor/patch", part).into(),
+        ));
     }
+    let extractor = Extractor::new();
 
-    return Ok("Other");
+    let rows = s.utf8()?.into_iter().collect::<Vec<_>>();
+    let extracted = rows
+        .par_iter()
+        .map(|row| {
+            row.and_then(|v| extractor.extract_version(v, part))
+                .map(|v| v as u64)
+        })
+        .collect::<Vec<_>>();
+
+    Ok(Series::new(s.name(), extracted))
+}
+
+/// Column version of norm_normalize_os, without the GIL
+#[pyfunction]
+pub fn norm_normalize_os_column(py: Python, column: PySeries) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| normalize_os_series(&s))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
+}
+
+/// Column version of VersionTruncator, without the GIL
+#[pyfunction]
+pub fn norm_truncate_version_column(
+    py: Python,
+    column: PySeries,
+    part: &str,
+) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| truncate_version_series(&s, part))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
+}
+
+/// Column version of VersionExtractor, without the GIL
+#[pyfunction]
+pub fn norm_extract_version_column(py: Python, column: PySeries, part: &str) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| extract_version_series(&s, part))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+
+    Ok(PySeries(result))
 }
 
 #[allow(dead_code)]
@@ -177,4 +280,30 @@ mod tests {
         // Other.
         assert_eq!("Other", norm_normalize_os("asdf").unwrap());
     }
+
+    #[test]
+    fn test_version_series() {
+        let s = Series::new("v", &[Some("106.0.1"), None, Some("PerrysNightlyBuild")]);
+
+        let os = normalize_os_series(&Series::new("os", &[Some("Darwin"), None])).unwrap();
+        assert_eq!(
+            os.utf8().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some("Mac"), None]
+        );
+
+        let truncated = truncate_version_series(&s, "minor").unwrap();
+        assert_eq!(
+            truncated.utf8().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some("106.0"), None, Some("0.0")]
+        );
+
+        let extracted = extract_version_series(&s, "patch").unwrap();
+        assert_eq!(
+            extracted.u64().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some(1), None, None]
+        );
+
+        assert!(truncate_version_series(&s, "patch").is_err());
+        assert!(extract_version_series(&s, "build").is_err());
+    }
 }
@@ -0,0 +1,325 @@
+//! Per client state of the GLAM aggregation that can outgrow memory.
+//! Histograms are hash-partitioned by client_id and, once they take more
+//! than the memory budget, the largest partition is appended to a file on
+//! local disk. A client only ever lands in one partition, so partitions are
+//! finished one at a time and only one is back in memory at once.
+use crate::sketch::hash_client_id;
+use std::collections::HashMap;
+use std::fs::{self, File};
+use std::io::{self, BufReader, BufWriter, Read, Write};
+use std::path::PathBuf;
+use std::sync::atomic::{AtomicUsize, Ordering};
+
+const PARTITIONS: usize = 64;
+
+/// Rough heap cost of a (build, client) entry and of one of its buckets, the
+/// budget is checked against these rather than the allocator
+const CLIENT_BYTES: usize = 96;
+const BUCKET_BYTES: usize = 24;
+
+/// Distinguishes the spill files of several stores in one process
+static STORE_ID: AtomicUsize = AtomicUsize::new(0);
+
+type ClientKey = (String, String);
+type Histogram = HashMap<i64, i64>;
+
+struct Partition {
+    clients: HashMap<ClientKey, Histogram>,
+    bytes: usize,
+    path: PathBuf,
+    file: Option<BufWriter<File>>,
+}
+
+/// Summed histogram of every (build_id, client_id), within a memory budget
+pub struct SpillStore {
+    partitions: Vec<Partition>,
+    budget: usize,
+    in_memory: usize,
+    spilled_bytes: usize,
+}
+
+impl SpillStore {
+    /// Spill files go to `dir`, the system temp dir by default, and are
+    /// removed when the store is finished or dropped
+    pub fn new(budget: usize, dir: Option<&str>) -> io::Result<Self> {
+        let dir = dir.map(PathBuf::from).unwrap_or_else(std::env::temp_dir);
+        fs::create_dir_all(&dir)?;
+        let store_id = STORE_ID.fetch_add(1, Ordering::Relaxed);
+
+        let partitions = (0..PARTITIONS)
+            .map(|i| Partition {
+                clients: HashMap::new(),
+                bytes: 0,
+                path: dir.join(format!(
+                    "mozfun_local_spill_{}_{}_{}.bin",
+                    std::process::id(),
+                    store_id,
+                    i
+                )),
+                file: None,
+            })
+            .collect();
+
+        Ok(SpillStore {
+            partitions,
+            budget,
+            in_memory: 0,
+            spilled_bytes: 0,
+        })
+    }
+
+    /// Bytes written to disk so far
+    pub fn spilled_bytes(&self) -> usize {
+        self.spilled_bytes
+    }
+
+    pub fn add(&mut self, build_id: &str, client_id: &str, histogram: Histogram) -> io::Result<()> {
+        let index = (hash_client_id(client_id) % PARTITIONS as u64) as usize;
+        let partition = &mut self.partitions[index];
+        let before = partition.bytes;
+
+        // a client with a spilled entry gets a second one, they are summed
+        // when the partition is read back
+        let key = (build_id.to_string(), client_id.to_string());
+        let summed = partition.clients.entry(key).or_insert_with(|| {
+            partition.bytes += CLIENT_BYTES + build_id.len() + client_id.len();
+            HashMap::new()
+        });
+        for (k, v) in histogram {
+            summed.entry(k).and_modify(|y| *y += v).or_insert_with(|| {
+                partition.bytes += BUCKET_BYTES;
+                v
+            });
+        }
+        self.in_memory += partition.bytes - before;
+
+        while self.in_memory > self.budget {
+            let largest = (0..PARTITIONS)
+                .max_by_key(|i| self.partitions[*i].bytes)
+                .unwrap();
+            if self.partitions[largest].bytes == 0 {
+                break;
+            }
+            self.spill(largest)?;
+        }
+
+        Ok(())
+    }
+
+    fn spill(&mut self, index: usize) -> io::Result<()> {
+        let partition = &mut self.partitions[index];
+        if partition.file.is_none() {
+            partition.file = Some(BufWriter::new(File::create(&partition.path)?));
+        }
+        let file = partition.file.as_mut().unwrap();
+
+        let mut buffer = Vec::new();
+        for ((build_id, client_id), histogram) in partition.clients.drain() {
+            encode_client(&mut buffer, &build_id, &client_id, &histogram);
+            file.write_all(&buffer)?;
+            self.spilled_bytes += buffer.len();
+            buffer.clear();
+        }
+        self.in_memory -= partition.bytes;
+        partition.bytes = 0;
+
+        Ok(())
+    }
+
+    /// Hands the build_id, client_id and summed histogram of every client
+    /// to `f`, one partition at a time
+    pub fn finish<F>(mut self, mut f: F) -> io::Result<()>
+    where
+        F: FnMut(String, String, Histogram),
+    {
+        for partition in self.partitions.iter_mut() {
+            let mut clients = std::mem::take(&mut partition.clients);
+
+            if let Some(file) = partition.file.take() {
+                file.into_inner().map_err(|e| e.into_error())?;
+                let mut reader = BufReader::new(File::open(&partition.path)?);
+                while let Some((key, histogram)) = decode_client(&mut reader)? {
+                    let summed = clients.entry(key).or_default();
+                    for (k, v) in histogram {
+                        *summed.entry(k).or_insert(0) += v;
+                    }
+                }
+                fs::remove_file(&partition.path)?;
+            }
+
+            for ((build_id, client_id), histogram) in clients {
+                f(build_id, client_id, histogram);
+            }
+        }
+
+        Ok(())
+    }
+}
+
+impl Drop for SpillStore {
+    fn drop(&mut self) {
+        for partition in &self.partitions {
+            if partition.file.is_some() {
+                let _ = fs::remove_file(&partition.path);
+            }
+        }
+    }
+}
+
+/// A client is its build_id and client_id, each length prefixed, then the
+/// number of buckets and every (bucket, count). All integers are LEB128
+/// varints, zigzag encoded where they can be negative, so a typical bucket
+/// takes two to four bytes.
+fn encode_client(buffer: &mut Vec<u8>, build_id: &str, client_id: &str, histogram: &Histogram) {
+    write_varint(buffer, build_id.len() as u64);
+    buffer.extend_from_slice(build_id.as_bytes());
+    write_varint(buffer, client_id.len() as u64);
+    buffer.extend_from_slice(client_id.as_bytes());
+    write_varint(buffer, histogram.len() as u64);
+    for (k, v) in histogram {
+        write_varint(buffer, zigzag(*k));
+        write_varint(buffer, zigzag(*v));
+    }
+}
+
+fn decode_client<R: Read>(reader: &mut R) -> io::Result<Option<(ClientKey, Histogram)>> {
+    let build_len = match read_varint(reader)? {
+        Some(len) => len as usize,
+        None => return Ok(None),
+    };
+    let build_id = read_string(reader, build_len)?;
+    let client_len = read_varint(reader)?.ok_or_else(truncated)? as usize;
+    let client_id = read_string(reader, client_len)?;
+    let n_buckets = read_varint(reader)?.ok_or_else(truncated)? as usize;
+
+    let mut histogram = HashMap::with_capacity(n_buckets);
+    for _ in 0..n_buckets {
+        let k = unzigzag(read_varint(reader)?.ok_or_else(truncated)?);
+        let v = unzigzag(read_varint(reader)?.ok_or_else(truncated)?);
+        histogram.insert(k, v);
+    }
+
+    Ok(Some(((build_id, client_id), histogram)))
+}
+
+fn truncated() -> io::Error {
+    io::Error::new(io::ErrorKind::UnexpectedEof, "truncated spill file")
+}
+
+fn zigzag(v: i64) -> u64 {
+    ((v << 1) ^ (v >> 63)) as u64
+}
+
+fn unzigzag(v: u64) -> i64 {
+    (v >> 1) as i64 ^ -((v & 1) as i64)
+}
+
+fn write_varint(buffer: &mut Vec<u8>, mut v: u64) {
+    while v >= 0x80 {
+        buffer.push(v as u8 | 0x80);
+        v >>= 7;
+    }
+    buffer.push(v as u8);
+}
+
+/// None at a clean end of file
+fn read_varint<R: Read>(reader: &mut R) -> io::Result<Option<u64>> {
+    let mut v = 0u64;
+    let mut byte = [0u8];
+
+    for shift in (0..64).step_by(7) {
+        if reader.read(&mut byte)? == 0 {
+            return match shift {
+                0 => Ok(None),
+                _ => Err(truncated()),
+            };
+        }
+        v |= ((byte[0] & 0x7f) as u64) << shift;
+        if byte[0] & 0x80 == 0 {
+            return Ok(Some(v));
+        }
+    }
+
+    Err(io::Error::new(
+        io::ErrorKind::InvalidData,
+        "varint too long",
+    ))
+}
+
+fn read_string<R: Read>(reader: &mut R, len: usize) -> io::Result<String> {
+    let mut bytes = vec![0u8; len];
+    reader.read_exact(&mut bytes)?;
+
+    String::from_utf8(bytes).map_err(|e| io::Error::new(io::ErrorKind::InvalidData, e))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn histograms() -> Vec<(String, String, Histogram)> {
+        (0..500)
+            .map(|i| {
+                (
+                    format!("2023010{}", i % 3),
+                    format!("client-{}", i % 200),
+                    HashMap::from_iter([(i % 7, 1), (-(i % 5), i * 1_000)]),
+                )
+            })
+            .collect()
+    }
+
+    fn collect(store: SpillStore) -> HashMap<ClientKey, Histogram> {
+        let mut clients = HashMap::new();
+        store
+            .finish(|build_id, client_id, histogram| {
+                assert!(clients.insert((build_id, client_id), histogram).is_none());
+            })
+            .unwrap();
+        clients
+    }
+
+    #[test]
+    fn test_varints() {
+        let mut buffer = Vec::new();
+        let values = [0, 1, -1, 63, -64, 300, i64::MAX, i64::MIN];
+        for v in values {
+            write_varint(&mut buffer, zigzag(v));
+        }
+        assert_eq!(buffer[..3], [0, 2, 1]);
+
+        let mut reader = buffer.as_slice();
+        for v in values {
+            assert_eq!(unzigzag(read_varint(&mut reader).unwrap().unwrap()), v);
+        }
+        assert!(read_varint(&mut reader).unwrap().is_none());
+        assert!(read_varint(&mut [0x80u8].as_slice()).is_err());
+    }
+
+    #[test]
+    fn test_spilled_matches_in_memory() {
+        let mut in_memory = SpillStore::new(usize::MAX, None).unwrap();
+        let mut spilling = SpillStore::new(10_000, None).unwrap();
+        for (build_id, client_id, histogram) in histograms() {
+            in_memory
+                .add(&build_id, &client_id, histogram.clone())
+                .unwrap();
+            spilling.add(&build_id, &client_id, histogram).unwrap();
+            assert!(spilling.in_memory <= 10_000);
+        }
+
+        assert_eq!(in_memory.spilled_bytes(), 0);
+        assert!(spilling.spilled_bytes() > 0);
+        let paths: Vec<PathBuf> = spilling
+            .partitions
+            .iter()
+            .filter(|p| p.file.is_some())
+            .map(|p| p.path.clone())
+            .collect();
+
+        let expected = collect(in_memory);
+        assert_eq!(expected.len(), 200);
+        assert_eq!(collect(spilling), expected);
+        assert!(paths.iter().all(|p| !p.exists()));
+    }
+}
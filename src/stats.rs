@@ -1,27 +1,67 @@
 use std::collections::HashMap;
+use std::hash::Hash;
 
+use polars::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3_polars::PySeries;
+use rayon::prelude::*;
 
-/// Sum of a groupby of keys
-#[pyfunction]
-pub fn mode_last(data: Vec<i64>) -> PyResult<i64> {
+/// Most frequent value, the last one to reach the top count on ties. None
+/// when empty. Shared by stats_mode_last and json_mode_last.
+pub fn last_mode<T: Copy + Eq + Hash>(data: &[T]) -> Option<T> {
     // One-pass mode calculation
     // Source: https://codereview.stackexchange.com/a/173437
-    if data.is_empty() {
-        return Ok(i64::MAX);
-    }
     let mut occurence_map = HashMap::new();
 
     // max_by_key Returns the element that gives the maximum value from the specified function.
     // Returns the second argument if the comparison determines them to be equal.
     // So this conforms to mode_last
-    let highest_occurrence = data.iter().copied().max_by_key(|&i| {
+    data.iter().copied().max_by_key(|&i| {
         let occurences = occurence_map.entry(i).or_insert(0);
         *occurences += 1;
         *occurences
-    });
+    })
+}
+
+/// mode_last of a list of integers, i64::MAX when it is empty
+#[pyfunction]
+pub fn mode_last(py: Python, data: Vec<i64>) -> PyResult<i64> {
+    Ok(py.allow_threads(|| last_mode(&data)).unwrap_or(i64::MAX))
+}
+
+/// mode_last of every row of a list column, in parallel. Nulls within a
+/// row are ignored, null and empty rows give null
+pub fn mode_last_series(s: &Series) -> PolarsResult<Series> {
+    let lists = s.cast(&DataType::List(Box::new(DataType::Int64)))?;
+    let rows = lists.list()?.into_iter().collect::<Vec<_>>();
+    let modes = rows
+        .par_iter()
+        .map(|row| -> PolarsResult<Option<i64>> {
+            let values = match row {
+                Some(row) => row.i64()?.into_iter().flatten().collect::<Vec<_>>(),
+                None => return Ok(None),
+            };
+            Ok(match values.is_empty() {
+                true => None,
+                false => last_mode(&values),
+            })
+        })
+        .collect::<PolarsResult<Vec<_>>>()?;
+
+    Ok(Series::new(s.name(), modes))
+}
+
+/// Column version of mode_last, without the GIL
+#[pyfunction]
+pub fn stats_mode_last_column(py: Python, column: PySeries) -> PyResult<PySeries> {
+    let s: Series = column.into();
+
+    let result = py
+        .allow_threads(|| mode_last_series(&s))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
 
-    Ok(highest_occurrence.unwrap())
+    Ok(PySeries(result))
 }
 
 #[cfg(test)]
@@ -37,10 +77,25 @@ mod tests {
         let empty_vec: Vec<i64> = vec![];
         let python_nulls = vec![1, 1, i64::MIN, i64::MIN, i64::MIN];
 
-        assert_eq!(mode_last(well_formed).unwrap(), 1);
-        assert_eq!(mode_last(shared_mode).unwrap(), 1);
-        assert_eq!(mode_last(shared_mode_opposite).unwrap(), 2);
-        assert_eq!(mode_last(empty_vec).unwrap(), i64::MAX);
-        assert_eq!(mode_last(python_nulls).unwrap(), i64::MIN);
+        assert_eq!(last_mode(&well_formed), Some(1));
+        assert_eq!(last_mode(&shared_mode), Some(1));
+        assert_eq!(last_mode(&shared_mode_opposite), Some(2));
+        assert_eq!(last_mode(&empty_vec), None);
+        assert_eq!(last_mode(&python_nulls), Some(i64::MIN));
+    }
+
+    #[test]
+    fn test_mode_last_series() {
+        let rows = vec![
+            Series::new("", &[Some(1i64), Some(2), Some(2), None, None]),
+            Series::new("", &[None::<i64>]),
+        ];
+        let s = Series::new("m", rows);
+
+        let result = mode_last_series(&s).unwrap();
+        assert_eq!(
+            result.i64().unwrap().into_iter().collect::<Vec<_>>(),
+            vec![Some(2), None]
+        );
     }
 }